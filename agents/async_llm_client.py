@@ -0,0 +1,278 @@
+"""异步LLM客户端 - 基于 httpx.AsyncClient，同一事件循环内共享连接池并按后端限制并发"""
+import asyncio
+import logging
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple, Union
+from config import ASYNC_LLM_CONFIG, HTTP_POOL_CONFIG
+from agents.llm_cache import LLMResponseCache
+from agents.llm_client import MultiLLMClient, SSEDecoder
+
+try:
+    import httpx
+except ImportError:
+    httpx = None  # 只有使用异步客户端时才需要
+
+
+class AsyncMultiLLMClient(MultiLLMClient):
+    """异步多后端LLM客户端 - 与 MultiLLMClient 支持相同的后端，提供 achat / achat_stream
+
+    请求体构造、SSE解析、响应缓存、重试策略和熔断器都与同步客户端共用（熔断器按后端共享，
+    同步和异步请求的失败一起计数）。httpx 的连接池绑定在事件循环上，因此连接池和并发信号量
+    按事件循环各建一份。
+    """
+
+    # 事件循环 -> 共享的 httpx.AsyncClient / {后端: 信号量}
+    _async_clients = weakref.WeakKeyDictionary()
+    _semaphores = weakref.WeakKeyDictionary()
+
+    def __init__(self, backend: str = None):
+        """
+        初始化异步LLM客户端
+
+        Args:
+            backend: 后端类型 ("ollama", "huggingface", "vllm", "siliconflow", "openai", "anthropic")
+        """
+        if httpx is None:
+            raise ImportError("异步LLM客户端需要 httpx，请运行: pip install httpx")
+        super().__init__(backend)
+        self.max_concurrency = max(1, ASYNC_LLM_CONFIG.get("backend_concurrency", {}).get(
+            self.backend, ASYNC_LLM_CONFIG.get("max_concurrency", 4)
+        ))
+
+    @classmethod
+    def get_async_client(cls) -> 'httpx.AsyncClient':
+        """获取当前事件循环共享的 AsyncClient（首次使用时创建）"""
+        loop = asyncio.get_running_loop()
+        client = cls._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=ASYNC_LLM_CONFIG.get("max_connections", 20),
+                    max_keepalive_connections=ASYNC_LLM_CONFIG.get("max_keepalive_connections", 10),
+                    keepalive_expiry=ASYNC_LLM_CONFIG.get("keepalive_expiry", 30.0)
+                ),
+                transport=httpx.AsyncHTTPTransport(retries=HTTP_POOL_CONFIG.get("max_retries", 1))
+            )
+            cls._async_clients[loop] = client
+        return client
+
+    @classmethod
+    async def aclose_clients(cls):
+        """关闭当前事件循环的 AsyncClient 及其连接"""
+        client = cls._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """当前事件循环中该后端的并发信号量"""
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if self.backend not in semaphores:
+            semaphores[self.backend] = asyncio.Semaphore(self.max_concurrency)
+        return semaphores[self.backend]
+
+    async def achat(self, messages: list, stream: bool = False, bypass_cache: bool = False, **kwargs) -> Union[str, AsyncIterator[str]]:
+        """
+        异步发送聊天请求（参数和缓存行为与 chat 相同）
+
+        Args:
+            messages: 消息列表
+            stream: 为True时返回逐段产出文本的异步迭代器（同 achat_stream）
+            bypass_cache: 为True时不查询缓存（用于主动重新生成），新回复仍会写入缓存
+            **kwargs: 其他参数
+
+        Returns:
+            模型回复内容（stream=True 时为异步迭代器）
+        """
+        # 缓存读写是阻塞的 SQLite 操作，放到线程中执行，不阻塞事件循环
+        cache = LLMResponseCache()
+        cache_key = None
+        if cache.enabled:
+            cache_key = cache.make_key(self.backend, self.model_name, messages, kwargs)
+            cached = None if bypass_cache else await asyncio.to_thread(cache.get, cache_key)
+            if cached is not None:
+                logging.debug(f"LLM响应缓存命中: {self.backend}/{self.model_name}")
+                return self._aiter_cached(cached) if stream else cached
+
+        if stream:
+            chunks = self.achat_stream(messages, **kwargs)
+            return self._astore_when_complete(chunks, cache, cache_key) if cache_key else chunks
+        content = "".join([chunk async for chunk in self.achat_stream(messages, **kwargs)])
+        if not content:
+            logging.warning(f"{self.backend}返回内容为空，模型: {self.model_name}")
+            raise RuntimeError("模型调用失败: 模型返回内容为空")
+        if cache_key:
+            await asyncio.to_thread(cache.put, cache_key, self.backend, self.model_name, content)
+        return content
+
+    @staticmethod
+    async def _aiter_cached(content: str) -> AsyncIterator[str]:
+        yield content
+
+    async def _astore_when_complete(self, chunks: AsyncIterator[str], cache: LLMResponseCache, cache_key: str) -> AsyncIterator[str]:
+        """原样产出流式片段，完整读完后把回复写入缓存（中途出错或被放弃的回复不缓存）"""
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        await asyncio.to_thread(cache.put, cache_key, self.backend, self.model_name, "".join(parts))
+
+    async def achat_stream(self, messages: list, **kwargs) -> AsyncIterator[str]:
+        """
+        异步流式聊天（同 chat_stream），整个回复期间占用该后端的一个并发名额
+
+        Args:
+            messages: 消息列表
+            **kwargs: 其他参数（如temperature, max_tokens等）
+
+        Yields:
+            回复文本片段
+        """
+        if self.backend == "ollama":
+            chunks = self._astream_openai_compatible(self._ollama_payload(messages, **kwargs))
+        elif self.backend in ("vllm", "siliconflow", "openai"):
+            chunks = self._astream_openai_compatible(self._openai_payload(messages, **kwargs))
+        elif self.backend == "anthropic":
+            chunks = self._astream_anthropic(messages, **kwargs)
+        elif self.backend == "huggingface":
+            chunks = self._astream_huggingface(messages, **kwargs)
+        else:
+            raise ValueError(f"未实现的后端: {self.backend}")
+
+        async with self._semaphore():
+            start = time.perf_counter()
+            first_token_at = None
+            count = 0
+            try:
+                async for chunk in chunks:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    count += 1
+                    yield chunk
+            except httpx.HTTPError as e:
+                error_msg = self._describe_httpx_error(e)
+                logging.error(error_msg, exc_info=True)
+                raise RuntimeError(f"模型调用失败: {error_msg}") from e
+            finally:
+                await chunks.aclose()
+                end = time.perf_counter()
+                self.last_stream_stats = {
+                    "backend": self.backend,
+                    "ttft_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+                    "total_ms": round((end - start) * 1000, 1),
+                    "chunks": count,
+                }
+                logging.debug(f"LLM流式响应统计: {self.last_stream_stats}")
+
+    def _describe_httpx_error(self, e: 'httpx.HTTPError') -> str:
+        """把 httpx 异常转换为便于排查的错误消息（与 _describe_request_error 一致）"""
+        if isinstance(e, httpx.TimeoutException):
+            return f"{self.backend}请求超时 (timeout={self.timeout}s)，模型: {self.model_name}"
+        if isinstance(e, (httpx.ConnectError, httpx.RemoteProtocolError)):
+            hint = "，请确保Ollama服务正在运行" if self.backend == "ollama" else ""
+            return f"无法连接到{self.backend}服务 ({self.base_url}){hint}。错误: {str(e)}"
+        if isinstance(e, httpx.HTTPStatusError):
+            return (f"{self.backend} HTTP错误，模型: {self.model_name}。错误: {str(e)}"
+                    f"，响应: {e.response.text[:200]}")
+        return f"LLM调用失败 ({self.backend}): {e}"
+
+    @asynccontextmanager
+    async def _apost(self, url: str, **kwargs) -> AsyncIterator['httpx.Response']:
+        """发送流式POST请求（重试和熔断规则与 _post 相同），错误状态码抛出 HTTPStatusError"""
+        client = self.get_async_client()
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            attempt += 1
+            # 每次尝试的等待时间不超过剩余的总时间预算（与 _post 相同）
+            connect_timeout, read_timeout = self.retry_policy.attempt_timeout(self.request_timeout, started_at)
+            request = client.build_request(
+                "POST", url, timeout=httpx.Timeout(read_timeout, connect=connect_timeout), **kwargs
+            )
+            try:
+                response = await client.send(request, stream=True)
+            except asyncio.CancelledError:
+                # 任务被取消不代表后端故障，只释放半开状态的探测名额
+                self.breaker.release_probe()
+                raise
+            except BaseException as e:
+                # 其他任何失败（读取超时等）都要记录，否则半开状态的探测名额不会释放
+                self.breaker.record_failure()
+                if not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)):
+                    raise
+                delay = self.retry_policy.next_delay(attempt, started_at)
+                if delay is None:
+                    raise
+                logging.warning(f"{self.backend}连接失败，{delay:.1f}s 后重试（第{attempt}次）")
+                await asyncio.sleep(delay)
+                continue
+
+            if self.retry_policy.should_retry_status(response.status_code):
+                # 429 表示服务繁忙而不是不可用，不计入熔断
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                retry_after = self.retry_policy.parse_retry_after(response.headers.get("Retry-After"))
+                delay = self.retry_policy.next_delay(attempt, started_at, retry_after)
+                if delay is not None:
+                    logging.warning(f"{self.backend}返回 {response.status_code}，{delay:.1f}s 后重试（第{attempt}次）")
+                    await response.aclose()
+                    await asyncio.sleep(delay)
+                    continue
+            else:
+                self.breaker.record_success()
+
+            try:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                yield response
+            finally:
+                await response.aclose()
+            return
+
+    @staticmethod
+    async def _aiter_sse(response: 'httpx.Response') -> AsyncIterator[Tuple[Optional[str], str]]:
+        """解析 Server-Sent Events，逐个产出 (事件类型, data)"""
+        # text/event-stream 通常不带 charset，统一按 UTF-8 解码
+        response.encoding = "utf-8"
+        decoder = SSEDecoder()
+        async for line in response.aiter_lines():
+            event = decoder.feed(line)
+            if event:
+                yield event
+        event = decoder.flush()
+        if event:
+            yield event
+
+    async def _astream_openai_compatible(self, payload: Dict) -> AsyncIterator[str]:
+        """OpenAI兼容的流式聊天接口（Ollama, vLLM, SiliconFlow, OpenAI）"""
+        url = f"{self.base_url}/chat/completions"
+        async with self._apost(url, json=payload, headers=self._openai_headers()) as response:
+            async for _, data in self._aiter_sse(response):
+                if data == "[DONE]":
+                    break
+                content = self._openai_delta(data)
+                if content:
+                    yield content
+
+    async def _astream_anthropic(self, messages: list, **kwargs) -> AsyncIterator[str]:
+        """Anthropic Claude流式聊天（content_block_delta 事件中的 text_delta）"""
+        url, headers, payload = self._anthropic_request(messages, **kwargs)
+        async with self._apost(url, json=payload, headers=headers) as response:
+            async for event_type, data in self._aiter_sse(response):
+                if event_type == "message_stop":
+                    break
+                text = self._anthropic_delta(event_type, data)
+                if text:
+                    yield text
+
+    async def _astream_huggingface(self, messages: list, **kwargs) -> AsyncIterator[str]:
+        """HuggingFace Inference API 不支持流式，整段回复作为一个片段"""
+        url, headers, payload = self._huggingface_request(messages, **kwargs)
+        async with self._apost(url, json=payload, headers=headers) as response:
+            await response.aread()
+            yield self._huggingface_text(response.json())
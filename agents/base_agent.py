@@ -1,6 +1,7 @@
 """基础智能体类"""
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Union
 from agents.llm_client import SimpleLLMClient, MultiLLMClient
+from agents.async_llm_client import AsyncMultiLLMClient
 from agents.prompts_config import BASE_AGENT_SYSTEM_PROMPT, BASE_AGENT_DEFAULT_REPLY
 
 
@@ -22,6 +23,15 @@ class DiagramAgentBase:
             self.llm_client = MultiLLMClient(backend=backend)
         else:
             self.llm_client = SimpleLLMClient()
+        # 异步客户端在首次调用 amodel 时创建（需要 httpx）
+        self.async_llm_client: Optional[AsyncMultiLLMClient] = None
+    
+    def _messages(self, prompt: str) -> List[Dict]:
+        """系统提示词 + 用户提示词"""
+        return [
+            {"role": "system", "content": self.sys_prompt},
+            {"role": "user", "content": prompt}
+        ]
     
     def model(self, prompt: str, stream: bool = False, **kwargs) -> str:
         """调用模型
@@ -31,8 +41,16 @@ class DiagramAgentBase:
             stream: 是否流式返回
             **kwargs: 其他参数（如temperature, max_tokens等）
         """
-        messages = [
-            {"role": "system", "content": self.sys_prompt},
-            {"role": "user", "content": prompt}
-        ]
-        return self.llm_client.chat(messages, stream=stream, **kwargs)
+        return self.llm_client.chat(self._messages(prompt), stream=stream, **kwargs)
+    
+    async def amodel(self, prompt: str, stream: bool = False, **kwargs) -> Union[str, AsyncIterator[str]]:
+        """异步调用模型（参数同 model），可在一个事件循环中并发发起多个请求
+        
+        Args:
+            prompt: 用户提示词
+            stream: 是否流式返回（为True时返回异步迭代器）
+            **kwargs: 其他参数（如temperature, max_tokens等）
+        """
+        if self.async_llm_client is None:
+            self.async_llm_client = AsyncMultiLLMClient(backend=self.llm_client.backend)
+        return await self.async_llm_client.achat(self._messages(prompt), stream=stream, **kwargs)
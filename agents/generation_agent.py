@@ -5,6 +5,7 @@ from datetime import datetime
 from typing import Dict, List
 from agents.base_agent import DiagramAgentBase
 from utils.mermaid_renderer import MermaidRenderer
+from utils.render_client import RenderClient
 from agents.prompts_config import (
     GENERATION_SYSTEM_PROMPT,
     GENERATION_FLOWCHART_PROMPT_TEMPLATE,
@@ -27,6 +28,7 @@ from agents.utils.text_cleaner import TextCleaner
 from agents.utils.code_extractor import CodeExtractor
 from agents.generators.generator_factory import DiagramGeneratorFactory
 from agents.fixers.fixer_factory import SyntaxFixerFactory
+from config import EXPORT_CONFIG, RENDER_SERVER_CONFIG
 
 
 class GenerationAgent(DiagramAgentBase):
@@ -38,14 +40,22 @@ class GenerationAgent(DiagramAgentBase):
             sys_prompt=self._get_sys_prompt(),
             **kwargs
         )
-        # 将自身传入MermaidRenderer，使其可以使用AI进行语法检查
-        self.mermaid_renderer = MermaidRenderer(generation_agent=self)
+        # 配置了渲染服务地址时使用共享的渲染服务，否则在本进程内渲染
+        if RENDER_SERVER_CONFIG.get("url"):
+            self.mermaid_renderer = RenderClient()
+        else:
+            self.mermaid_renderer = MermaidRenderer(generation_agent=self)
     
     def _get_sys_prompt(self) -> str:
         return GENERATION_SYSTEM_PROMPT
     
-    def generate_diagram(self, clarified_requirements: str, diagram_type: str = "flowchart") -> Dict:
-        """生成架构图 - 只生成Mermaid代码并渲染为PNG"""
+    def generate_diagram(self, clarified_requirements: str, diagram_type: str = "flowchart", progressive: bool = False) -> Dict:
+        """生成架构图 - 只生成Mermaid代码并渲染为PNG
+
+        Args:
+            progressive: 使用渐进式渲染。默认返回时 png_file 已写入；为True时先返回预览图，
+                png_file 由后台的 full_render 写入，调用方需等待该 Future（界面可先显示 preview_file）
+        """
         # 第一步：基于需求澄清，生成完整的Mermaid格式代码
         mermaid_code = self._generate_mermaid_code(clarified_requirements, diagram_type)
         
@@ -59,9 +69,12 @@ class GenerationAgent(DiagramAgentBase):
         
         # 渲染Mermaid代码为PNG（渲染前会自动进行语法检查和修复）
         png_file = os.path.join(output_dir, f"diagram_{timestamp}.png")
+        svg_file = None
+        diagnostics = {}
         try:
-            # 先进行语法检查（获取详细信息）
-            is_valid, error_info = self.mermaid_renderer.validate_syntax_with_details(mermaid_code)
+            # 一次浏览器往返完成语法检查和渲染（语法正确时直接得到PNG，渐进式渲染时先得到预览图）
+            diagnostics = self._render_with_diagnostics(mermaid_code, png_file, progressive)
+            is_valid, error_info = diagnostics['is_valid'], diagnostics['error_info']
             is_valid_after_fix = is_valid
             
             if not is_valid:
@@ -73,14 +86,16 @@ class GenerationAgent(DiagramAgentBase):
                 fixer = SyntaxFixerFactory.create(diagram_type)
                 if fixer:
                     mermaid_code = fixer.fix(mermaid_code)
-                    is_valid_after_fix, error_info_after = self.mermaid_renderer.validate_syntax_with_details(mermaid_code)
+                    diagnostics = self._render_with_diagnostics(mermaid_code, png_file, progressive)
+                    is_valid_after_fix, error_info_after = diagnostics['is_valid'], diagnostics['error_info']
                     
                     # 如果还有错误且是类图，尝试高级修复
                     if not is_valid_after_fix and diagram_type == "classDiagram":
                         advanced_fixer = SyntaxFixerFactory.create(diagram_type, advanced=True)
                         if advanced_fixer:
                             mermaid_code = advanced_fixer.fix(mermaid_code, error_info=error_info_after)
-                            is_valid_after_fix, error_info_after = self.mermaid_renderer.validate_syntax_with_details(mermaid_code)
+                            diagnostics = self._render_with_diagnostics(mermaid_code, png_file, progressive)
+                            is_valid_after_fix, error_info_after = diagnostics['is_valid'], diagnostics['error_info']
                 else:
                     is_valid_after_fix = False
                     error_info_after = error_info
@@ -121,13 +136,16 @@ class GenerationAgent(DiagramAgentBase):
                     print(f"警告: Mermaid语法错误: {error_info.get('message', '未知错误')}")
                     png_file = None
             
-            # 如果语法正确（原始或修复后），进行渲染
-            if is_valid_after_fix:
-                try:
-                    self.mermaid_renderer.render_to_png(mermaid_code, png_file, validate=False)
-                except Exception as render_error:
-                    print(f"渲染失败: {str(render_error)}")
-                    png_file = None
+            # 语法正确（原始或修复后）时PNG已在同一次调用中生成，只需处理渲染失败
+            if is_valid_after_fix and diagnostics.get('render_error'):
+                print(f"渲染失败: {diagnostics['render_error']}")
+                png_file = None
+            elif is_valid_after_fix and diagnostics.get('svg') and EXPORT_CONFIG.get("svg", {}).get("enabled"):
+                # 同一次渲染得到的SVG保存到mmd文件旁边
+                svg_file = self.mermaid_renderer.write_svg(
+                    diagnostics['svg'],
+                    os.path.join(output_dir, f"diagram_{timestamp}.svg")
+                )
         except ValueError as e:
             # 语法错误（从validate_syntax或render_to_png抛出）
             error_msg = str(e)
@@ -160,7 +178,17 @@ class GenerationAgent(DiagramAgentBase):
             "mermaid_code": mermaid_code,  # 可能已经被修复
             "mermaid_file": mmd_file,
             "png_file": png_file,
+            "svg_file": svg_file,
+            # 渐进式渲染：png_file 在 full_render 完成前尚未写入，可先显示 preview_file
+            "preview_file": diagnostics.get('preview_file') if png_file else None,
+            "full_render": diagnostics.get('full_render') if png_file else None,
         }
+    
+    def _render_with_diagnostics(self, mermaid_code: str, png_file: str, progressive: bool = False) -> Dict:
+        """语法诊断并渲染；渐进式渲染时先生成预览图，完整分辨率PNG在后台写入 png_file"""
+        if progressive:
+            return self.mermaid_renderer.render_progressive(mermaid_code, png_file)
+        return self.mermaid_renderer.render_with_diagnostics(mermaid_code, png_file)
 
     def _generate_mermaid_code(self, requirements: str, diagram_type: str = "flowchart") -> str:
         """第一步：基于需求澄清，生成完整的Mermaid格式代码（使用工厂模式）"""
@@ -0,0 +1,161 @@
+"""LLM响应缓存 - 单例模式，SQLite持久化 + 过期时间 + LRU淘汰"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from config import LLM_CACHE_CONFIG
+
+
+class LLMResponseCache:
+    """LLM响应缓存 - 以后端、模型名、消息和采样参数的哈希为键保存完整回复
+
+    生成类提示词都使用很低的 temperature，相同请求的回复基本一致；命中时直接从磁盘返回，
+    不再等待模型重新生成。条目超过 ttl 后失效，数量或总大小超过上限时淘汰最久未使用的条目。
+    数据库使用 WAL 模式，多个 Streamlit 会话（线程）和进程可以同时读写。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        """单例模式"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化缓存（数据库在首次读写时创建）"""
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+
+        self.enabled = LLM_CACHE_CONFIG.get("enabled", False)
+        self.path = LLM_CACHE_CONFIG.get("path", os.path.join("output", ".llm_cache", "responses.sqlite3"))
+        self.ttl = LLM_CACHE_CONFIG.get("ttl", 7 * 24 * 3600)
+        self.max_entries = LLM_CACHE_CONFIG.get("max_entries", 2000)
+        self.max_bytes = LLM_CACHE_CONFIG.get("max_bytes", 50 * 1024 * 1024)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._initialized = True
+
+    @staticmethod
+    def make_key(backend: str, model_name: str, messages: list, params: Dict) -> str:
+        """根据后端、模型名、消息列表和采样参数计算缓存键"""
+        payload = json.dumps(
+            {
+                'backend': backend,
+                'model': model_name,
+                'messages': messages,
+                'params': params,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，命中返回回复内容，未命中或已过期返回None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._db_lock:
+            conn = self._connect()
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and row[1] + self.ttl < now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self._evictions += 1
+                row = None
+            if row is None:
+                self._misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self._hits += 1
+            return row[0]
+
+    def put(self, key: str, backend: str, model_name: str, response: str):
+        """保存一条回复（空回复不缓存），随后按过期时间和容量限制淘汰"""
+        if not self.enabled or not response:
+            return
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, backend, model, response, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, backend, model_name, response, size, now, now)
+            )
+            self._evict_locked(conn, now)
+            conn.commit()
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        entries, total_bytes = 0, 0
+        with self._db_lock:
+            if self.enabled:
+                entries, total_bytes = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+            lookups = self._hits + self._misses
+            return {
+                'entries': entries,
+                'bytes': total_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """清空缓存"""
+        if not self.enabled:
+            return
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库并建表（调用方需持有锁）"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, backend TEXT, model TEXT, response TEXT NOT NULL, "
+                "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _evict_locked(self, conn: sqlite3.Connection, now: float):
+        """删除过期条目，再按最近访问时间淘汰直到满足数量和容量限制（调用方需持有锁）"""
+        if self.ttl:
+            self._evictions += conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+
+        entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall():
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            entries -= 1
+            total_bytes -= size
+            self._evictions += 1
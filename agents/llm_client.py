@@ -3,13 +3,54 @@ import re
 import json
 import requests
 import logging
-from typing import Dict, Optional, Literal, Iterator, Union
-from config import LLM_CONFIG, DEFAULT_LLM_BACKEND
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional, Literal, Iterator, Tuple, Union
+from config import LLM_CONFIG, DEFAULT_LLM_BACKEND, HTTP_POOL_CONFIG
+from agents.llm_cache import LLMResponseCache
+from agents.resilience import RetryPolicy, CircuitBreaker
+
+
+class SSEDecoder:
+    """Server-Sent Events 解码器 - 逐行输入，一个事件结束（空行）时返回 (事件类型, data)"""
+    
+    def __init__(self):
+        self.event_type: Optional[str] = None
+        self.data_lines: list = []
+    
+    def feed(self, line: str) -> Optional[Tuple[Optional[str], str]]:
+        """输入一行（不含换行符），事件结束时返回该事件"""
+        if not line:
+            # 空行表示一个事件结束
+            return self.flush()
+        if line.startswith(":"):
+            return None  # 注释/保活
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            self.event_type = value
+        elif field == "data":
+            self.data_lines.append(value)
+        return None
+    
+    def flush(self) -> Optional[Tuple[Optional[str], str]]:
+        """返回已累积的事件（没有 data 时返回None）并重置状态"""
+        event = (self.event_type, "\n".join(self.data_lines)) if self.data_lines else None
+        self.event_type = None
+        self.data_lines = []
+        return event
 
 
 class MultiLLMClient:
     """多后端LLM客户端 - 支持Ollama, HuggingFace, vLLM, SiliconFlow, OpenAI, Anthropic"""
     
+    # 每个后端一个共享的 Session（连接池），所有智能体的客户端复用已建立的连接
+    _sessions: Dict[str, requests.Session] = {}
+    _sessions_lock = threading.Lock()
+    # 每个后端一个共享的熔断器，某个后端不可用时所有客户端都快速失败
+    _breakers: Dict[str, CircuitBreaker] = {}
+    
     def __init__(self, backend: str = None):
         """
         初始化LLM客户端
@@ -26,152 +67,336 @@ class MultiLLMClient:
         self.base_url = self.config["base_url"]
         self.api_key = self.config.get("api_key", "")
         self.timeout = self.config.get("timeout", 60)
+        # (连接超时, 读取超时)：连接失败很快暴露，生成长文本时仍有足够的读取时间
+        self.request_timeout = (HTTP_POOL_CONFIG.get("connect_timeout", 10), self.timeout)
+        self.session = self.get_session(self.backend)
+        self.retry_policy = RetryPolicy()
+        self.breaker = self.get_breaker(self.backend)
+        # 最近一次流式请求的耗时统计（首token延迟等），见 chat_stream
+        self.last_stream_stats: Optional[Dict] = None
         
         # 根据后端类型设置模型名
         self.model_name = self.config.get("model_name") or self.config.get("model_id", "")
     
-    def chat(self, messages: list, stream: bool = False, **kwargs) -> str:
+    @classmethod
+    def get_session(cls, backend: str) -> requests.Session:
+        """获取后端共享的 Session（首次使用时创建）"""
+        with cls._sessions_lock:
+            session = cls._sessions.get(backend)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONFIG.get("pool_connections", 4),
+                    pool_maxsize=HTTP_POOL_CONFIG.get("pool_maxsize", 10),
+                    max_retries=HTTP_POOL_CONFIG.get("max_retries", 1)
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                cls._sessions[backend] = session
+            return session
+    
+    @classmethod
+    def close_sessions(cls):
+        """关闭所有共享 Session 及其连接"""
+        with cls._sessions_lock:
+            sessions = list(cls._sessions.values())
+            cls._sessions.clear()
+        for session in sessions:
+            try:
+                session.close()
+            except:
+                pass
+    
+    @classmethod
+    def get_breaker(cls, backend: str) -> CircuitBreaker:
+        """获取后端共享的熔断器（首次使用时创建）"""
+        with cls._sessions_lock:
+            breaker = cls._breakers.get(backend)
+            if breaker is None:
+                breaker = CircuitBreaker(backend)
+                cls._breakers[backend] = breaker
+            return breaker
+    
+    def _post(self, url: str, **kwargs) -> requests.Response:
+        """通过共享 Session 发送POST请求（默认使用 (连接超时, 读取超时)）
+        
+        连接错误、429 和 5xx 按 retry_policy 退避重试；重试用完后返回最后一次的响应（由调用方
+        raise_for_status）或抛出最后一次的连接异常。熔断打开时直接抛出 CircuitOpenError。
+        总时间预算（LLM_RETRY_CONFIG["deadline"]）同时限制退避等待和每次尝试的连接/读取超时。
+        已开始产出内容的流式响应不在这里重试。
+        """
+        timeout = kwargs.pop("timeout", self.request_timeout)
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            attempt += 1
+            try:
+                # 每次尝试的等待时间不超过剩余的总时间预算
+                response = self.session.post(url, timeout=self.retry_policy.attempt_timeout(timeout, started_at), **kwargs)
+            except Exception as e:
+                # 任何请求失败（读取超时、SSL错误等）都要记录，否则半开状态的探测名额不会释放
+                self.breaker.record_failure()
+                if not isinstance(e, requests.exceptions.ConnectionError):
+                    raise
+                delay = self.retry_policy.next_delay(attempt, started_at)
+                if delay is None:
+                    raise
+                logging.warning(f"{self.backend}连接失败，{delay:.1f}s 后重试（第{attempt}次）")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # KeyboardInterrupt 等中断不代表后端故障（同 _apost 中的取消），只释放半开状态的探测名额
+                self.breaker.release_probe()
+                raise
+            
+            if not self.retry_policy.should_retry_status(response.status_code):
+                self.breaker.record_success()
+                return response
+            
+            # 429 表示服务繁忙而不是不可用，不计入熔断
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            retry_after = self.retry_policy.parse_retry_after(response.headers.get("Retry-After"))
+            delay = self.retry_policy.next_delay(attempt, started_at, retry_after)
+            if delay is None:
+                return response
+            logging.warning(f"{self.backend}返回 {response.status_code}，{delay:.1f}s 后重试（第{attempt}次）")
+            response.close()
+            time.sleep(delay)
+    
+    def chat(self, messages: list, stream: bool = False, bypass_cache: bool = False, **kwargs) -> Union[str, Iterator[str]]:
         """
         发送聊天请求
         
+        所有后端都以流式方式请求，非流式调用只是把 chat_stream 的结果拼接起来。
+        启用 LLM_CACHE_CONFIG 时，相同的请求直接返回缓存的回复。
+        
         Args:
             messages: 消息列表
-            stream: 是否流式返回
+            stream: 为True时返回逐段产出文本的迭代器（同 chat_stream）
+            bypass_cache: 为True时不查询缓存（用于主动重新生成），新回复仍会写入缓存
             **kwargs: 其他参数
         
         Returns:
-            模型回复内容
+            模型回复内容（stream=True 时为迭代器）
         """
-        try:
-            if self.backend == "ollama":
-                return self._chat_ollama(messages, stream, **kwargs)
-            elif self.backend == "huggingface":
-                return self._chat_huggingface(messages, **kwargs)
-            elif self.backend == "vllm":
-                return self._chat_openai_compatible(messages, stream, **kwargs)
-            elif self.backend == "siliconflow":
-                return self._chat_openai_compatible(messages, stream, **kwargs)
-            elif self.backend == "openai":
-                return self._chat_openai_compatible(messages, stream, **kwargs)
-            elif self.backend == "anthropic":
-                return self._chat_anthropic(messages, stream, **kwargs)
-            else:
-                raise ValueError(f"未实现的后端: {self.backend}")
+        cache = LLMResponseCache()
+        cache_key = None
+        if cache.enabled:
+            cache_key = cache.make_key(self.backend, self.model_name, messages, kwargs)
+            cached = None if bypass_cache else cache.get(cache_key)
+            if cached is not None:
+                logging.debug(f"LLM响应缓存命中: {self.backend}/{self.model_name}")
+                return iter([cached]) if stream else cached
+        
+        if stream:
+            chunks = self.chat_stream(messages, **kwargs)
+            return self._store_when_complete(chunks, cache, cache_key) if cache_key else chunks
+        content = "".join(self.chat_stream(messages, **kwargs))
+        if not content:
+            logging.warning(f"{self.backend}返回内容为空，模型: {self.model_name}")
+            raise RuntimeError("模型调用失败: 模型返回内容为空")
+        if cache_key:
+            cache.put(cache_key, self.backend, self.model_name, content)
+        return content
+    
+    def _store_when_complete(self, chunks: Iterator[str], cache: LLMResponseCache, cache_key: str) -> Iterator[str]:
+        """原样产出流式片段，完整读完后把回复写入缓存（中途出错或被放弃的回复不缓存）"""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        cache.put(cache_key, self.backend, self.model_name, "".join(parts))
+    
+    @staticmethod
+    def cache_stats() -> Dict:
+        """LLM响应缓存的统计信息（条目数、大小、命中率等）"""
+        return LLMResponseCache().stats()
+    
+    def chat_stream(self, messages: list, **kwargs) -> Iterator[str]:
+        """
+        流式聊天：模型每生成一段文本就立即产出
+        
+        读取超时（后端配置中的 timeout）作用于每次读取，因此限制的是首个token及两段文本之间的
+        最长等待时间，而不是整个回复的生成时间。首token延迟等统计保存在 last_stream_stats。
+        
+        Args:
+            messages: 消息列表
+            **kwargs: 其他参数（如temperature, max_tokens等）
         
+        Yields:
+            回复文本片段
+        """
+        if self.backend == "ollama":
+            chunks = self._stream_openai_compatible(self._ollama_payload(messages, **kwargs))
+        elif self.backend in ("vllm", "siliconflow", "openai"):
+            chunks = self._stream_openai_compatible(self._openai_payload(messages, **kwargs))
+        elif self.backend == "anthropic":
+            chunks = self._stream_anthropic(messages, **kwargs)
+        elif self.backend == "huggingface":
+            chunks = self._stream_huggingface(messages, **kwargs)
+        else:
+            raise ValueError(f"未实现的后端: {self.backend}")
+        
+        start = time.perf_counter()
+        first_token_at = None
+        count = 0
+        try:
+            for chunk in chunks:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                count += 1
+                yield chunk
         except requests.exceptions.RequestException as e:
-            error_msg = f"LLM调用失败 ({self.backend}): {e}"
+            error_msg = self._describe_request_error(e)
             print(error_msg)
             logging.error(error_msg, exc_info=True)
             # 不再返回mock响应，直接抛出异常让上层处理
-            raise RuntimeError(f"模型调用失败: {str(e)}")
+            raise RuntimeError(f"模型调用失败: {error_msg}") from e
+        finally:
+            end = time.perf_counter()
+            self.last_stream_stats = {
+                "backend": self.backend,
+                "ttft_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+                "total_ms": round((end - start) * 1000, 1),
+                "chunks": count,
+            }
+            logging.debug(f"LLM流式响应统计: {self.last_stream_stats}")
     
-    def _chat_ollama(self, messages: list, stream: bool = False, **kwargs) -> str:
-        """Ollama聊天"""
-        url = f"{self.base_url}/chat/completions"
-        
-        # 使用options参数来控制模型行为
-        options = kwargs.get("options", {})
-        
-        payload = {
+    def _describe_request_error(self, e: requests.exceptions.RequestException) -> str:
+        """把请求异常转换为便于排查的错误消息"""
+        if isinstance(e, requests.exceptions.Timeout):
+            return f"{self.backend}请求超时 (timeout={self.timeout}s)，模型: {self.model_name}"
+        if isinstance(e, requests.exceptions.ConnectionError):
+            hint = "，请确保Ollama服务正在运行" if self.backend == "ollama" else ""
+            return f"无法连接到{self.backend}服务 ({self.base_url}){hint}。错误: {str(e)}"
+        if isinstance(e, requests.exceptions.HTTPError):
+            error_msg = f"{self.backend} HTTP错误，模型: {self.model_name}。错误: {str(e)}"
+            if e.response is not None:
+                error_msg += f"，响应: {e.response.text[:200]}"
+            return error_msg
+        return f"LLM调用失败 ({self.backend}): {e}"
+    
+    def _ollama_payload(self, messages: list, **kwargs) -> Dict:
+        """Ollama请求体（使用options参数来控制模型行为）"""
+        return {
             "model": self.model_name,
             "messages": messages,
-            "stream": stream,
-            "options": options,
+            "stream": True,
+            "options": kwargs.get("options", {}),
             **{k: v for k, v in kwargs.items() if k != "options"}
         }
-        
-        try:
-            response = requests.post(url, json=payload, timeout=self.timeout)
-            response.raise_for_status()
-            result = response.json()
-            
-            # 检查响应格式
-            if "choices" not in result:
-                logging.warning(f"Ollama响应格式异常: {result}")
-                raise ValueError(f"Ollama响应格式错误: 缺少choices字段")
-            
-            if not result.get("choices"):
-                logging.warning(f"Ollama响应为空: {result}")
-                raise ValueError(f"Ollama响应为空: choices列表为空")
-            
-            if stream:
-                content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-            else:
-                content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-            
-            if not content:
-                logging.warning(f"Ollama返回内容为空: {result}")
-                raise ValueError(f"模型返回内容为空")
-            
-            return content
-            
-        except requests.exceptions.Timeout:
-            error_msg = f"Ollama请求超时 (timeout={self.timeout}s)，模型: {self.model_name}"
-            logging.error(error_msg)
-            raise RuntimeError(error_msg)
-        except requests.exceptions.ConnectionError as e:
-            error_msg = f"无法连接到Ollama服务 ({self.base_url})，请确保Ollama服务正在运行。错误: {str(e)}"
-            logging.error(error_msg)
-            raise RuntimeError(error_msg)
-        except requests.exceptions.HTTPError as e:
-            error_msg = f"Ollama HTTP错误，模型: {self.model_name}。错误: {str(e)}"
-            if hasattr(e.response, 'text'):
-                error_msg += f"，响应: {e.response.text[:200]}"
-            logging.error(error_msg)
-            raise RuntimeError(error_msg)
-        except (ValueError, KeyError) as e:
-            error_msg = f"Ollama响应解析错误: {str(e)}"
-            logging.error(error_msg)
-            raise RuntimeError(error_msg)
     
-    def _chat_openai_compatible(self, messages: list, stream: bool = False, **kwargs) -> Union[str, Iterator[str]]:
-        """OpenAI兼容的聊天接口（vLLM, SiliconFlow, OpenAI）"""
-        url = f"{self.base_url}/chat/completions"
+    def _openai_payload(self, messages: list, **kwargs) -> Dict:
+        """OpenAI兼容接口的请求体（vLLM, SiliconFlow, OpenAI）"""
+        return {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": True,
+            **kwargs
+        }
+    
+    def _openai_headers(self) -> Dict:
+        """OpenAI兼容接口的请求头"""
         headers = {"Content-Type": "application/json"}
+        if self.api_key and self.backend in ("openai", "siliconflow", "vllm"):
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+    
+    def _stream_openai_compatible(self, payload: Dict) -> Iterator[str]:
+        """OpenAI兼容的流式聊天接口（Ollama, vLLM, SiliconFlow, OpenAI）"""
+        url = f"{self.base_url}/chat/completions"
+        with self._post(url, json=payload, headers=self._openai_headers(), stream=True) as response:
+            response.raise_for_status()
+            for _, data in self._iter_sse(response):
+                if data == "[DONE]":
+                    break
+                content = self._openai_delta(data)
+                if content:
+                    yield content
+    
+    def _openai_delta(self, data: str) -> Optional[str]:
+        """从OpenAI兼容接口的一个SSE事件中取出文本片段"""
+        try:
+            event = json.loads(data)
+        except json.JSONDecodeError as e:
+            logging.warning(f"Failed to parse SSE chunk: {str(e)}")
+            return None
+        if event.get("error"):
+            raise RuntimeError(f"{self.backend}返回错误: {event['error']}")
+        choices = event.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content")
+    
+    def _anthropic_request(self, messages: list, **kwargs) -> Tuple[str, Dict, Dict]:
+        """Anthropic流式请求的 (url, 请求头, 请求体)"""
+        url = f"{self.base_url}/messages"
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01"
+        }
         
-        if self.api_key:
-            if self.backend == "openai":
-                headers["Authorization"] = f"Bearer {self.api_key}"
-            elif self.backend == "siliconflow":
-                headers["Authorization"] = f"Bearer {self.api_key}"
+        # Claude格式转换
+        claude_messages = self._messages_to_claude(messages)
         
         payload = {
             "model": self.model_name,
-            "messages": messages,
-            "stream": stream,
-            **kwargs
+            "max_tokens": kwargs.get("max_tokens", 4096),
+            "messages": claude_messages,
+            "stream": True,
+            **{k: v for k, v in kwargs.items() if k != "max_tokens"}
         }
-        
+        return url, headers, payload
+    
+    def _stream_anthropic(self, messages: list, **kwargs) -> Iterator[str]:
+        """Anthropic Claude流式聊天（content_block_delta 事件中的 text_delta）"""
+        url, headers, payload = self._anthropic_request(messages, **kwargs)
+        with self._post(url, json=payload, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            for event_type, data in self._iter_sse(response):
+                if event_type == "message_stop":
+                    break
+                text = self._anthropic_delta(event_type, data)
+                if text:
+                    yield text
+    
+    @staticmethod
+    def _anthropic_delta(event_type: Optional[str], data: str) -> Optional[str]:
+        """从Anthropic的一个SSE事件中取出文本片段（只处理 content_block_delta 和 error）"""
+        if event_type not in ("content_block_delta", "error"):
+            return None
         try:
-            with requests.post(url, json=payload, headers=headers, timeout=self.timeout, stream=stream) as response:
-                response.raise_for_status()
-                
-                if stream:
-                    for chunk in response.iter_lines(decode_unicode=True):
-                        if not chunk:  # Skip keep-alive lines
-                            continue
-                        
-                        # Check for SSE data lines
-                        if chunk.startswith('data:'):
-                            try:
-                                # Remove 'data: ' prefix and parse JSON
-                                data = json.loads(chunk[6:].strip())
-                                if 'choices' in data:
-                                    content = data['choices'][0].get('delta', {}).get('content', '')
-                                    if content:
-                                        yield content
-                            except json.JSONDecodeError as e:
-                                logging.warning(f"Failed to parse SSE chunk: {str(e)}")
-                                continue
-                else:
-                    result = response.json()
-                    return result.get("choices", [{}])[0].get("message", {}).get("content", "")
-        except (requests.RequestException, json.JSONDecodeError) as e:
-            logging.error(f"Error in API call: {str(e)}", exc_info=True)
-            raise
+            event = json.loads(data)
+        except json.JSONDecodeError as e:
+            logging.warning(f"Failed to parse SSE chunk: {str(e)}")
+            return None
+        if event_type == "error":
+            raise RuntimeError(f"Anthropic返回错误: {event.get('error')}")
+        return (event.get("delta") or {}).get("text")
     
-    def _chat_huggingface(self, messages: list, **kwargs) -> str:
-        """HuggingFace聊天"""
+    @staticmethod
+    def _iter_sse(response: requests.Response) -> Iterator[Tuple[Optional[str], str]]:
+        """解析 Server-Sent Events，逐个产出 (事件类型, data)"""
+        # text/event-stream 通常不带 charset，requests 会按 ISO-8859-1 解码，中文会乱码
+        response.encoding = "utf-8"
+        decoder = SSEDecoder()
+        for line in response.iter_lines(decode_unicode=True):
+            event = decoder.feed(line)
+            if event:
+                yield event
+        event = decoder.flush()
+        if event:
+            yield event
+    
+    def _stream_huggingface(self, messages: list, **kwargs) -> Iterator[str]:
+        """HuggingFace Inference API 不支持流式，整段回复作为一个片段"""
+        yield self._chat_huggingface(messages, **kwargs)
+    
+    def _huggingface_request(self, messages: list, **kwargs) -> Tuple[str, Dict, Dict]:
+        """HuggingFace请求的 (url, 请求头, 请求体)"""
         url = f"{self.base_url}/{self.model_name}"
         headers = {"Content-Type": "application/json"}
         
@@ -190,43 +415,24 @@ class MultiLLMClient:
             },
             **{k: v for k, v in kwargs.items() if k not in ["max_tokens", "temperature"]}
         }
-        
-        response = requests.post(url, json=payload, headers=headers, timeout=self.timeout)
+        return url, headers, payload
+    
+    def _chat_huggingface(self, messages: list, **kwargs) -> str:
+        """HuggingFace聊天"""
+        url, headers, payload = self._huggingface_request(messages, **kwargs)
+        response = self._post(url, json=payload, headers=headers)
         response.raise_for_status()
-        result = response.json()
-        
-        # HuggingFace返回格式
+        return self._huggingface_text(response.json())
+    
+    @staticmethod
+    def _huggingface_text(result) -> str:
+        """HuggingFace返回格式"""
         if isinstance(result, list) and len(result) > 0:
             return result[0].get("generated_text", "")
         elif isinstance(result, dict):
             return result.get("generated_text", "")
         return ""
     
-    def _chat_anthropic(self, messages: list, stream: bool = False, **kwargs) -> str:
-        """Anthropic Claude聊天"""
-        url = f"{self.base_url}/messages"
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01"
-        }
-        
-        # Claude格式转换
-        claude_messages = self._messages_to_claude(messages)
-        
-        payload = {
-            "model": self.model_name,
-            "max_tokens": kwargs.get("max_tokens", 4096),
-            "messages": claude_messages,
-            **{k: v for k, v in kwargs.items() if k != "max_tokens"}
-        }
-        
-        response = requests.post(url, json=payload, headers=headers, timeout=self.timeout)
-        response.raise_for_status()
-        result = response.json()
-        
-        return result.get("content", [{}])[0].get("text", "")
-    
     def _messages_to_prompt(self, messages: list) -> str:
         """将消息列表转换为提示字符串"""
         prompt = ""
@@ -0,0 +1,178 @@
+"""LLM请求容错 - 策略模式（重试退避策略）+ 状态模式（熔断器：关闭/打开/半开）"""
+import logging
+import math
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple, Union
+from config import LLM_RETRY_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，请求未发送直接失败
+
+    retry_in 为距离允许探测的秒数；已有探测请求在进行中时为None（何时恢复取决于探测结果）。
+    """
+
+    def __init__(self, name: str, retry_in: Optional[float]):
+        self.name = name
+        self.retry_in = retry_in
+        if retry_in is None:
+            message = f"模型调用失败: {name}服务连续请求失败，正在探测服务是否恢复，请稍后重试"
+        else:
+            message = f"模型调用失败: {name}服务连续请求失败，已暂停调用，约{math.ceil(retry_in)}秒后重试"
+        super().__init__(message)
+
+
+class RetryPolicy:
+    """重试策略 - 指数退避 + 全抖动，优先使用服务端 Retry-After，总等待受截止时间限制
+
+    只处理可安全重发的失败：连接错误、429 和 5xx（请求还未产出任何内容）。
+    """
+
+    MIN_ATTEMPT_TIMEOUT = 0.1  # 预算即将用完时每次尝试至少等待的秒数
+
+    def __init__(self, max_attempts: Optional[int] = None, backoff_base: Optional[float] = None,
+                 backoff_max: Optional[float] = None, deadline: Optional[float] = None,
+                 retry_statuses: Optional[list] = None):
+        self.max_attempts = max(1, max_attempts or LLM_RETRY_CONFIG.get("max_attempts", 3))
+        self.backoff_base = backoff_base if backoff_base is not None else LLM_RETRY_CONFIG.get("backoff_base", 1.0)
+        self.backoff_max = backoff_max if backoff_max is not None else LLM_RETRY_CONFIG.get("backoff_max", 20.0)
+        self.deadline = deadline if deadline is not None else LLM_RETRY_CONFIG.get("deadline", 120.0)
+        self.retry_statuses = set(retry_statuses or LLM_RETRY_CONFIG.get("retry_statuses", [429, 500, 502, 503, 504]))
+
+    def should_retry_status(self, status_code: int) -> bool:
+        """该HTTP状态码是否值得重试"""
+        return status_code in self.retry_statuses
+
+    def next_delay(self, attempt: int, started_at: float, retry_after: Optional[float] = None) -> Optional[float]:
+        """计算第 attempt 次（从1开始）失败后的等待秒数
+
+        Args:
+            attempt: 已经失败的次数
+            started_at: 首次请求的 time.monotonic()
+            retry_after: 服务端 Retry-After 给出的等待秒数
+
+        Returns:
+            等待秒数；次数用完或等待后会超过截止时间时返回None（不再重试）
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            # 全抖动：在 [0, base * 2^(n-1)] 内随机，避免多个客户端同时重试
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+        if self.deadline and time.monotonic() - started_at + delay > self.deadline:
+            return None
+        return delay
+
+    def remaining(self, started_at: float) -> Optional[float]:
+        """距截止时间剩余的秒数（未设置截止时间时返回None）"""
+        if not self.deadline:
+            return None
+        return max(0.0, self.deadline - (time.monotonic() - started_at))
+
+    def attempt_timeout(self, timeout: Union[float, Tuple[float, float]], started_at: float) -> Union[float, Tuple[float, float]]:
+        """把一次尝试的超时（秒数或 (连接超时, 读取超时)）限制在剩余的总时间预算内
+
+        流式响应的读取超时作用于每次读取，因此预算限制的是等待响应头和每段文本的时间。
+        """
+        remaining = self.remaining(started_at)
+        if remaining is None:
+            return timeout
+        remaining = max(self.MIN_ATTEMPT_TIMEOUT, remaining)
+        if isinstance(timeout, tuple):
+            return tuple(min(t, remaining) if t is not None else remaining for t in timeout)
+        return min(timeout, remaining) if timeout is not None else remaining
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """解析 Retry-After 头（秒数或HTTP日期）"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class CircuitBreaker:
+    """熔断器 - 连续失败达到阈值后打开，reset_timeout 内的请求直接失败；
+    到期后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold or LLM_RETRY_CONFIG.get("failure_threshold", 5))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else LLM_RETRY_CONFIG.get("reset_timeout", 30.0)
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """发送请求前调用；熔断打开（或半开且已有探测请求）时抛出 CircuitOpenError"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if self._state == self.OPEN and elapsed >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if not self._probe_in_flight:
+                    self._probe_in_flight = True
+                    return
+                raise CircuitOpenError(self.name, None)
+            raise CircuitOpenError(self.name, max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self):
+        """请求成功（服务端可用），关闭熔断器"""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"{self.name} 熔断器关闭")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """请求失败（连接错误或5xx）；半开状态下失败或连续失败达到阈值时打开熔断器"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"{self.name} 连续失败 {self._failures} 次，熔断器打开 {self.reset_timeout}s")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release_probe(self):
+        """探测请求被取消（未得到结果）时释放探测名额，下一个请求可以重新探测"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict:
+        """熔断器状态"""
+        state = self.state
+        with self._lock:
+            return {'name': self.name, 'state': state, 'failures': self._failures}
@@ -5,10 +5,12 @@ import os
 import base64
 import html as html_module
 import re
+import time
+from concurrent.futures import wait as wait_futures
 
 from agents.clarification_agent import ClarificationAgent
 from agents.generation_agent import GenerationAgent
-from config import LLM_CONFIG, DEFAULT_LLM_BACKEND
+from config import LLM_CONFIG, DEFAULT_LLM_BACKEND, PROGRESSIVE_RENDER_CONFIG
 
 
 # 页面配置
@@ -161,6 +163,35 @@ def reset_session():
         st.session_state.clarification_agent.clarified_points = []
 
 
+# 渐进式渲染时轮询高清图的间隔（秒）
+FULL_RENDER_POLL_INTERVAL = 0.5
+# Streamlit 1.37 起为 st.fragment，1.33~1.36 为 st.experimental_fragment；更早的版本没有片段
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+
+def _poll_full_render():
+    """高清图渲染完成后重新运行整个页面，把预览图替换为高清图"""
+    generated_diagram = st.session_state.get("generated_diagram") or {}
+    full_render = generated_diagram.get("full_render")
+    if full_render is not None and full_render.done():
+        st.rerun()
+
+
+if _fragment is not None:
+    # 只有这个片段按间隔重新运行，等待期间不会重复执行整个页面脚本
+    _poll_full_render = _fragment(run_every=FULL_RENDER_POLL_INTERVAL)(_poll_full_render)
+
+
+def wait_for_full_render():
+    """高清图仍在后台渲染时，定期检查并在完成后刷新页面"""
+    if _fragment is not None:
+        _poll_full_render()
+    else:
+        # 不支持片段的旧版本只能整页刷新
+        time.sleep(FULL_RENDER_POLL_INTERVAL)
+        st.rerun()
+
+
 def get_current_step():
     """获取当前步骤"""
     if st.session_state.selected_diagram_type is None:
@@ -725,7 +756,9 @@ def main():
                         try:
                             result = st.session_state.generation_agent.generate_diagram(
                                 st.session_state.clarified_requirements,
-                                diagram_type=st.session_state.selected_diagram_type
+                                diagram_type=st.session_state.selected_diagram_type,
+                                # 界面先显示预览图，完整分辨率PNG渲染完成后自动替换
+                                progressive=PROGRESSIVE_RENDER_CONFIG.get("enabled", False)
                             )
                             st.session_state.generated_diagram = result
                             st.rerun()
@@ -746,10 +779,26 @@ def main():
         elif st.session_state.generated_diagram:
             st.markdown("### 🎨 绘制结果")
             
+            # 渐进式渲染：完整分辨率PNG在后台生成，完成前先显示预览图
+            full_render = st.session_state.generated_diagram.get("full_render")
+            if full_render is not None and full_render.done():
+                st.session_state.generated_diagram["full_render"] = None
+                if full_render.exception() is not None:
+                    # 完整渲染失败时继续使用预览图
+                    st.session_state.generated_diagram["png_file"] = st.session_state.generated_diagram.get("preview_file")
+                    st.warning(f"高清图渲染失败，当前显示的是预览图: {full_render.exception()}")
+            render_pending = st.session_state.generated_diagram.get("full_render") is not None
+            display_png = (
+                st.session_state.generated_diagram.get("preview_file") if render_pending
+                else st.session_state.generated_diagram.get("png_file")
+            )
+            
             # 显示图表，使用带边框的容器
-            if st.session_state.generated_diagram.get("png_file") and os.path.exists(st.session_state.generated_diagram["png_file"]):
+            if display_png and os.path.exists(display_png):
+                if render_pending:
+                    st.info("⏳ 当前为预览图，高清图正在后台渲染，完成后自动替换")
                 # 读取图片并转换为base64
-                with open(st.session_state.generated_diagram["png_file"], 'rb') as f:
+                with open(display_png, 'rb') as f:
                     image_bytes = f.read()
                     image_base64 = base64.b64encode(image_bytes).decode()
                 
@@ -794,6 +843,18 @@ def main():
                         st.rerun()
                 with zoom_col4:
                     st.caption(f"当前缩放: {st.session_state.image_zoom_level}%")
+                    # 有SVG时可切换为矢量图显示（浏览器直接绘制，缩放不失真）
+                    svg_file = st.session_state.generated_diagram.get("svg_file")
+                    view_format = "PNG"
+                    if svg_file and os.path.exists(svg_file):
+                        view_format = st.radio("显示格式", ["PNG", "SVG"], horizontal=True, key="diagram_view_format", label_visibility="collapsed")
+                
+                if view_format == "SVG":
+                    with open(svg_file, 'rb') as f:
+                        image_base64 = base64.b64encode(f.read()).decode()
+                    image_mime = "image/svg+xml"
+                else:
+                    image_mime = "image/png"
                 
                 # 使用HTML容器显示图片，带黑色边框并支持缩放
                 zoom_scale = st.session_state.image_zoom_level / 100.0
@@ -826,7 +887,7 @@ def main():
                 </style>
                 <div class="diagram-container-wrapper">
                     <div class="diagram-container">
-                        <img src="data:image/png;base64,{image_base64}" alt="绘制的图形" />
+                        <img src="data:{image_mime};base64,{image_base64}" alt="绘制的图形" />
                     </div>
                 </div>
                 """
@@ -838,8 +899,8 @@ def main():
                 # 创建工具栏按钮（居中布局，按钮自适应宽度）
                 tool_cols = st.columns([1, 1, 1, 1, 1])
                 
-                # PNG文件下载
-                if st.session_state.generated_diagram.get("png_file"):
+                # PNG文件下载（高清图渲染完成后提供）
+                if st.session_state.generated_diagram.get("png_file") and not render_pending:
                     with open(st.session_state.generated_diagram["png_file"], 'rb') as f:
                         png_data = f.read()
                     with tool_cols[1]:
@@ -858,6 +919,19 @@ def main():
                         st.session_state.show_mermaid_code = not st.session_state.get('show_mermaid_code', False)
                         st.rerun()
                 
+                # SVG文件下载
+                if svg_file and os.path.exists(svg_file):
+                    with open(svg_file, 'rb') as f:
+                        svg_data = f.read()
+                    with tool_cols[4]:
+                        st.download_button(
+                            label="🖼️ 下载SVG",
+                            data=svg_data,
+                            file_name=os.path.basename(svg_file),
+                            mime="image/svg+xml",
+                            key="download_svg_toolbar"
+                        )
+                
                 # Mermaid代码文件下载（如果有编辑，下载编辑后的代码）
                 if st.session_state.generated_diagram.get("mermaid_code"):
                     # 优先使用编辑后的代码，否则使用原始代码
@@ -1215,8 +1289,21 @@ def main():
                                                         png_file = os.path.join(output_dir, f"diagram_{timestamp}.png")
                                                     
                                                     try:
+                                                        # 等待仍在后台进行的完整渲染，避免它稍后用旧代码覆盖新图
+                                                        pending_render = st.session_state.generated_diagram.pop("full_render", None)
+                                                        if pending_render is not None:
+                                                            wait_futures([pending_render])
                                                         st.session_state.generation_agent.mermaid_renderer.render_to_png(edited_code, png_file, validate=False)
                                                         
+                                                        # 同步更新SVG（只执行mermaid.render，不截图）
+                                                        if st.session_state.generated_diagram.get("svg_file"):
+                                                            try:
+                                                                st.session_state.generation_agent.mermaid_renderer.render_to_svg(
+                                                                    edited_code, st.session_state.generated_diagram["svg_file"]
+                                                                )
+                                                            except Exception:
+                                                                st.session_state.generated_diagram["svg_file"] = None
+                                                        
                                                         # 更新session_state
                                                         st.session_state.generated_diagram["mermaid_code"] = edited_code
                                                         st.session_state.generated_diagram["mermaid_file"] = mmd_file
@@ -1247,6 +1334,10 @@ def main():
                         file_name=os.path.basename(st.session_state.generated_diagram["mermaid_file"]),
                         mime="text/plain",
                     )
+            
+            # 高清图仍在渲染时定期检查，完成后替换预览图
+            if render_pending:
+                wait_for_full_render()
 
 
 if __name__ == "__main__":
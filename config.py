@@ -60,6 +60,46 @@ LLM_CONFIG = {
 # 默认使用的后端
 DEFAULT_LLM_BACKEND = "ollama"
 
+# LLM HTTP 连接池配置：同一后端的所有客户端共用一个 requests.Session，复用 TCP/TLS 连接
+HTTP_POOL_CONFIG = {
+    "pool_connections": 4,  # 每个后端缓存的连接池数（按主机区分）
+    "pool_maxsize": 10,  # 每个连接池保持的空闲连接数，并发请求超过时额外的连接用完即关闭
+    "max_retries": 1,  # 建立连接失败时的重试次数（已发送的 POST 请求不会重试）
+    "connect_timeout": 10,  # 建立连接的超时秒数；读取超时使用各后端配置中的 timeout
+}
+
+# 异步LLM客户端配置（AsyncMultiLLMClient，需要 httpx）：同一事件循环内所有后端共用一个连接池，
+# 每个后端用信号量限制同时进行的请求数（本地 Ollama 等并行能力有限，过多并发只会排队变慢）
+ASYNC_LLM_CONFIG = {
+    "max_connections": 20,  # 连接池最大连接数
+    "max_keepalive_connections": 10,  # 保持的空闲连接数
+    "keepalive_expiry": 30.0,  # 空闲连接保持时间（秒）
+    "max_concurrency": 4,  # 每个后端默认的最大并发请求数
+    "backend_concurrency": {"ollama": 2},  # 按后端覆盖 max_concurrency
+}
+
+# LLM请求重试与熔断配置：连接错误、429、5xx 按指数退避（全抖动）重试，优先遵守 Retry-After；
+# 同一后端连续失败达到阈值后熔断，reset_timeout 内的请求直接失败，到期后放行一个探测请求
+LLM_RETRY_CONFIG = {
+    "max_attempts": 3,  # 每次请求最多尝试的次数（含首次）
+    "backoff_base": 1.0,  # 退避基数（秒），第 n 次重试前最多等待 base * 2^(n-1)
+    "backoff_max": 20.0,  # 单次退避等待上限（秒）
+    "deadline": 120.0,  # 总时间预算（秒）：限制退避等待和每次尝试的连接/读取超时，超出后不再重试
+    "retry_statuses": [429, 500, 502, 503, 504],
+    "failure_threshold": 5,  # 连续失败多少次后熔断
+    "reset_timeout": 30.0,  # 熔断持续时间（秒）
+}
+
+# LLM响应缓存配置（默认关闭）：后端、模型名、消息和采样参数完全相同的请求直接返回磁盘上的回复
+# 需要重新生成时调用 chat(..., bypass_cache=True)，跳过查询但仍会用新回复覆盖缓存
+LLM_CACHE_CONFIG = {
+    "enabled": os.getenv("LLM_CACHE_ENABLED", "false").lower() in ("1", "true", "yes"),
+    "path": os.path.join("output", ".llm_cache", "responses.sqlite3"),
+    "ttl": 7 * 24 * 3600,  # 条目有效期（秒），0 表示不过期
+    "max_entries": 2000,  # 最多缓存的回复数
+    "max_bytes": 50 * 1024 * 1024,  # 回复文本总大小上限（字节）
+}
+
 # 绘图配置
 DRAWING_CONFIG = {
     "canvas_size": {"width": 1200, "height": 800},
@@ -85,6 +125,112 @@ DRAWING_CONFIG = {
 EXPORT_CONFIG = {
     "png": {"dpi": 300, "scale": 2.0},
     "jpg": {"dpi": 300, "quality": 95},
+    "svg": {"enabled": True},  # 生成图表时同时保存SVG（与PNG来自同一次渲染，不额外开销）
+}
+
+# 浏览器池配置（Mermaid渲染与验证共用）
+BROWSER_POOL_CONFIG = {
+    "max_size": 4,  # 最多同时存在的浏览器实例数（每个实例独占一个工作线程）
+    "idle_timeout": 300,  # 浏览器空闲超过该秒数后自动关闭
+    "lease_timeout": 60,  # 等待可用浏览器的最长秒数
+    # 单个浏览器任务的最长等待秒数（调用方一侧计时，超时后结束该浏览器进程；0 表示不限制）
+    # 渲染任务按各自的渲染超时计算：渲染和截图各 timeout，再加 task_timeout_slack（启动浏览器、准备页面）
+    "task_timeout": 60,
+    "task_timeout_slack": 15,
+    # 健康检查：超过任一阈值的浏览器会在两次任务之间被关闭并重新启动（0 表示不限制）
+    "max_renders": 500,  # 单个浏览器实例最多使用预热页面的次数
+    "max_errors": 5,  # 单个浏览器实例累计的浏览器错误（超时、崩溃等）次数
+    "max_rss_mb": 1024,  # 浏览器所有进程的常驻内存上限（MB）
+    "health_check_interval": 30,  # 内存检查的最小间隔（秒）
+}
+
+# 渲染页面隔离配置：页面只从内存中的虚拟源加载脚本，渲染结果不依赖网络和外部资源
+# 修改字体或安全级别会改变资源版本号，渲染缓存随之失效
+RENDER_SANDBOX_CONFIG = {
+    "block_network": True,  # 中止虚拟源以外的所有请求（图表中引用的外部图片、字体、样式等）
+    "security_level": "antiscript",  # mermaid securityLevel：允许HTML标签但移除脚本；loose 还会执行点击回调
+    # 只使用本机已安装的字体，不从网络加载（中文字体按 Linux/Windows/macOS 常见名称依次回退）
+    "font_family": 'arial, "Noto Sans CJK SC", "WenQuanYi Micro Hei", "Microsoft YaHei", "PingFang SC", sans-serif',
+}
+
+# Mermaid.js 语法验证后端配置
+VALIDATOR_CONFIG = {
+    "backend": "chromium",  # chromium: 浏览器预热页面验证；node: 常驻Node.js进程验证（需先 npm install）
+    "node_path": "node",
+    "node_pool_size": 2,  # 常驻Node进程数
+    "node_timeout": 10,  # 单条验证的超时秒数，超时的进程会被关闭并在下次使用时重启
+    "node_startup_timeout": 15,
+}
+
+# 渲染工作进程池配置（开启后 MermaidRenderer 的渲染在独立进程中执行，可利用多核并隔离浏览器故障）
+RENDER_WORKER_POOL_CONFIG = {
+    "enabled": False,
+    "workers": 2,  # 工作进程数，每个进程独占一个浏览器
+    "task_timeout": 120,  # 任务开始执行后超过该秒数未完成则认为进程卡死，重启该进程（排队时间不计）
+    "start_method": "spawn",  # Playwright不支持fork后的子进程继续使用，必须用spawn
+}
+
+# 异步渲染配置（AsyncMermaidRenderer，一个事件循环共享一个浏览器）
+ASYNC_RENDER_CONFIG = {
+    "max_concurrency": 8,  # 同时处于渲染/验证中的页面数上限
+}
+
+# 渲染结果缓存配置（相同代码和参数的渲染直接复用已生成的PNG）
+RENDER_CACHE_CONFIG = {
+    "enabled": True,
+    "dir": os.path.join("output", ".render_cache"),
+    "max_entries": 500,  # 最多缓存的图片数
+    "max_bytes": 200 * 1024 * 1024,  # 缓存目录占用上限（字节）
+    "rescan_interval": 60,  # 按目录内容重建索引的最小间隔（秒），用于计入其他渲染进程写入的条目
+}
+
+# 语法验证结果缓存配置（进程内共享，相同代码重复检查时直接返回）
+VALIDATION_MEMO_CONFIG = {
+    "enabled": True,
+    "max_entries": 1024,
+}
+
+# 渲染性能指标配置（各阶段耗时记录在滚动日志中，并通知 RenderMetrics 上注册的钩子）
+RENDER_METRICS_CONFIG = {
+    "enabled": True,
+    "log_size": 500,  # 滚动日志保留的记录条数
+    "log_to_logger": False,  # 是否同时用 logging 输出每条记录
+}
+
+# 超大图表分块截图配置：截图任一边超过阈值时按固定大小分块截图，逐条拼接并流式写入PNG
+TILED_RENDER_CONFIG = {
+    "enabled": True,
+    "threshold_px": 8192,  # 设备像素；Chromium 单次截图的纹理上限通常为 16384
+    "tile_size": 2048,  # 分块边长（设备像素），拼接时内存中只保留 图宽 × tile_size 的一个条带
+    "compress_level": 6,  # zlib 压缩级别
+}
+
+# 渐进式预览配置：先以低缩放比例生成预览图（同时完成语法诊断），完整分辨率PNG在后台渲染
+PROGRESSIVE_RENDER_CONFIG = {
+    # Streamlit 界面生成图表时使用渐进式渲染（界面会等待后台渲染完成后替换预览图）；
+    # 直接调用 GenerationAgent.generate_diagram 默认不使用，返回时 png_file 已写入
+    "enabled": True,
+    "preview_scale": 0.5,  # 预览图的设备缩放比例（像素数约为完整图的 1/16，截图和编码更快）
+    "workers": 2,  # 后台完整渲染的线程数（实际并发仍受浏览器池大小限制）
+}
+
+# 渲染服务配置（python -m utils.render_server 启动，多个进程/工具共用一组预热浏览器）
+RENDER_SERVER_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8765,
+    "dispatchers": 4,  # 固定数量的处理线程，实际渲染并发仍受浏览器池（或渲染进程池）大小限制
+    "queue_size": 32,  # 排队等待处理的请求上限，队列已满时返回 429
+    "request_timeout": 120,  # 请求在服务端等待处理结果的最长秒数，超时返回 504
+    "max_body_bytes": 4 * 1024 * 1024,  # 请求体大小上限
+    # 请求参数上限，超出或类型错误时返回 400
+    "max_dimension": 8192,  # 视口宽高（像素）
+    "max_scale": 4,  # 设备缩放比例
+    "max_render_timeout": 60,  # 单次渲染的 timeout（秒），不应超过 request_timeout
+    "max_batch_jobs": 16,  # /batch 单次最多的任务数；每项单独占用请求队列的一个位置，应小于 queue_size
+    # 客户端：设置后 GenerationAgent 通过 RenderClient 使用该服务，而不是在本进程启动浏览器
+    "url": os.getenv("RENDER_SERVER_URL", ""),
+    "client_timeout": 180,
+    "busy_retries": 3,  # 服务返回 429 时的重试次数
 }
 
 # 需求澄清配置
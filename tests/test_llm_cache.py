@@ -0,0 +1,92 @@
+"""LLMResponseCache 读写、过期和淘汰的单元测试（使用临时SQLite文件）"""
+import pytest
+import agents.llm_cache as llm_cache
+from agents.llm_cache import LLMResponseCache
+from config import LLM_CACHE_CONFIG
+
+
+class _Clock:
+    """可手动推进的 time 替身"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def make_cache(tmp_path, monkeypatch):
+    """按给定限制创建一个使用临时数据库的新缓存实例（绕过单例）"""
+    caches = []
+
+    def factory(**limits):
+        monkeypatch.setitem(LLM_CACHE_CONFIG, "enabled", True)
+        monkeypatch.setitem(LLM_CACHE_CONFIG, "path", str(tmp_path / "responses.sqlite3"))
+        for name, value in limits.items():
+            monkeypatch.setitem(LLM_CACHE_CONFIG, name, value)
+        monkeypatch.setattr(LLMResponseCache, "_instance", None)
+        cache = LLMResponseCache()
+        caches.append(cache)
+        return cache
+
+    yield factory
+    for cache in caches:
+        if cache._conn is not None:
+            cache._conn.close()
+
+
+def test_key_depends_on_every_input():
+    messages = [{"role": "user", "content": "画一个流程图"}]
+    key = LLMResponseCache.make_key("ollama", "qwen", messages, {"temperature": 0.1})
+    assert key == LLMResponseCache.make_key("ollama", "qwen", list(messages), {"temperature": 0.1})
+    assert key != LLMResponseCache.make_key("openai", "qwen", messages, {"temperature": 0.1})
+    assert key != LLMResponseCache.make_key("ollama", "qwen", messages, {"temperature": 0.2})
+
+
+def test_put_then_get(make_cache, clock):
+    cache = make_cache()
+    assert cache.get("k") is None
+    cache.put("k", "ollama", "qwen", "graph TD; A-->B")
+    cache.put("empty", "ollama", "qwen", "")  # 空回复不缓存
+
+    assert cache.get("k") == "graph TD; A-->B"
+    assert cache.get("empty") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.put("k", "ollama", "qwen", "reply")
+    clock.now += 61
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_least_recently_accessed(make_cache, clock):
+    cache = make_cache(max_entries=2, ttl=0)
+    cache.put("a", "ollama", "qwen", "A")
+    clock.now += 1
+    cache.put("b", "ollama", "qwen", "B")
+    clock.now += 1
+    assert cache.get("a") == "A"  # a 变为最近访问
+    clock.now += 1
+    cache.put("c", "ollama", "qwen", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+
+
+def test_disabled_cache_is_a_no_op(make_cache, tmp_path):
+    cache = make_cache(enabled=False)
+    cache.put("k", "ollama", "qwen", "reply")
+    assert cache.get("k") is None
+    assert not (tmp_path / "responses.sqlite3").exists()
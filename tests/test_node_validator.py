@@ -0,0 +1,40 @@
+"""NodeMermaidValidator 冒烟测试：通过常驻Node进程验证一条正确和一条错误的图表（需要 node 和 npm install）"""
+import os
+import shutil
+import subprocess
+import pytest
+
+pytest.importorskip("playwright")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _jsdom_installed(node_path: str) -> bool:
+    result = subprocess.run([node_path, "-e", "require.resolve('jsdom')"], cwd=PROJECT_ROOT, capture_output=True)
+    return result.returncode == 0
+
+
+@pytest.fixture(scope="module")
+def validator():
+    node_path = shutil.which("node")
+    if node_path is None:
+        pytest.skip("未安装 node")
+    if not _jsdom_installed(node_path):
+        pytest.skip("未安装 Node 依赖（npm install）")
+
+    from utils.node_mermaid_validator import NodeMermaidValidator
+    validator = NodeMermaidValidator()
+    yield validator
+    validator.cleanup()
+
+
+def test_node_validator_accepts_valid_and_rejects_invalid(validator):
+    valid = validator.validate("graph TD\n    A[开始] --> B[结束]")
+    assert valid == {'isValid': True, 'diagramType': 'flowchart'}
+    assert validator.available
+
+    invalid = validator.validate("graph TD\n    A[开始] -->")
+    # mermaid 未加载时 validate 返回None，错误图表会被当作通过基础检查
+    assert invalid is not None
+    assert invalid['isValid'] is False
+    assert invalid['message']
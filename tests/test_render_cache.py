@@ -0,0 +1,88 @@
+"""RenderCache 的LRU顺序、淘汰和多进程共享目录的单元测试（不需要浏览器）"""
+import os
+import pytest
+from config import RENDER_CACHE_CONFIG
+from utils.render_cache import RenderCache
+
+
+@pytest.fixture
+def make_cache(tmp_path, monkeypatch):
+    """按给定限制创建一个使用临时目录的新缓存实例（绕过单例）"""
+    def factory(**limits):
+        monkeypatch.setitem(RENDER_CACHE_CONFIG, "dir", str(tmp_path / "cache"))
+        monkeypatch.setitem(RENDER_CACHE_CONFIG, "enabled", True)
+        for name, value in limits.items():
+            monkeypatch.setitem(RENDER_CACHE_CONFIG, name, value)
+        monkeypatch.setattr(RenderCache, "_instance", None)
+        return RenderCache()
+    return factory
+
+
+def _png(tmp_path, name, size=10):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_make_key_depends_on_render_params():
+    key = RenderCache.make_key("graph TD; A-->B", 800, 600)
+    assert key == RenderCache.make_key("graph TD; A-->B", 800, 600)
+    assert key != RenderCache.make_key("graph TD; A-->B", 800, 600, scale=2.0)
+    assert key != RenderCache.make_key("graph TD; A-->B", 800, 600, theme="dark")
+
+
+def test_fetch_to_copies_cached_png(make_cache, tmp_path):
+    cache = make_cache()
+    cache.put_file("k", _png(tmp_path, "src.png"))
+    output = tmp_path / "out.png"
+
+    assert cache.fetch_to("k", str(output))
+    assert output.read_bytes() == b"x" * 10
+    assert not cache.fetch_to("missing", str(tmp_path / "none.png"))
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_evicts_least_recently_used_entry(make_cache, tmp_path):
+    cache = make_cache(max_entries=2)
+    src = _png(tmp_path, "src.png")
+    cache.put_file("a", src)
+    cache.put_file("b", src)
+    assert cache.get("a") is not None  # a 变为最近使用
+    cache.put_file("c", src)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert not os.path.exists(cache._blob_path("b"))
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_by_total_bytes(make_cache, tmp_path):
+    cache = make_cache(max_bytes=25)
+    cache.put_file("a", _png(tmp_path, "a.png", 10))
+    cache.put_file("b", _png(tmp_path, "b.png", 10))
+    cache.put_file("c", _png(tmp_path, "c.png", 10))
+
+    assert cache.stats()["bytes"] <= 25
+    assert cache.get("a") is None
+
+
+def test_sees_entries_written_by_other_processes(make_cache, tmp_path):
+    cache = make_cache()
+    cache.put_file("a", _png(tmp_path, "src.png"))
+    # 另一个进程直接写入共享目录
+    with open(cache._blob_path("other"), "wb") as f:
+        f.write(b"y" * 5)
+
+    assert cache.get("other") is not None
+    assert cache.stats()["entries"] == 2
+
+
+def test_missing_blob_counts_as_miss(make_cache, tmp_path):
+    cache = make_cache()
+    cache.put_file("a", _png(tmp_path, "src.png"))
+    os.remove(cache._blob_path("a"))
+
+    assert not cache.fetch_to("a", str(tmp_path / "out.png"))
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (0, 1, 0)
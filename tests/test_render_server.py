@@ -0,0 +1,90 @@
+"""渲染服务参数校验（400）与批量请求限制的单元测试（使用假渲染器，不启动浏览器）"""
+import pytest
+
+pytest.importorskip("playwright")
+
+from config import RENDER_SERVER_CONFIG
+from utils.render_server import (
+    InvalidParamsError, RenderService,
+    _bool_param, _dimension_param, _number_param, _require_code, _theme_param,
+)
+
+
+class _FakeRenderer:
+    """只实现 render_to_svg 的假渲染器，记录收到的参数"""
+
+    def __init__(self):
+        self.calls = []
+
+    def render_to_svg(self, code, **kwargs):
+        self.calls.append(kwargs)
+        return "<svg/>"
+
+
+@pytest.mark.parametrize("value", [0, -1, 1.5, "800", True, None, RENDER_SERVER_CONFIG["max_dimension"] + 1])
+def test_dimension_param_rejects_bad_values(value):
+    with pytest.raises(InvalidParamsError):
+        _dimension_param({"width": value}, "width", 1920)
+
+
+def test_dimension_param_default_and_valid():
+    assert _dimension_param({}, "width", 1920) == 1920
+    assert _dimension_param({"width": 800}, "width", 1920) == 800
+
+
+@pytest.mark.parametrize("value", [0, -2, "3", True, float("nan"), float("inf"), 100])
+def test_number_param_rejects_bad_values(value):
+    with pytest.raises(InvalidParamsError):
+        _number_param({"scale": value}, "scale", 4)
+
+
+def test_number_param_optional():
+    assert _number_param({}, "timeout", 60) is None
+    assert _number_param({"timeout": None}, "timeout", 60) is None
+    assert _number_param({"timeout": 5}, "timeout", 60) == 5.0
+
+
+@pytest.mark.parametrize("value", ["false", 0, 1, None])
+def test_bool_param_only_accepts_json_booleans(value):
+    with pytest.raises(InvalidParamsError):
+        _bool_param({"validate": value}, "validate", True)
+
+
+def test_bool_param_default():
+    assert _bool_param({}, "validate", True) is True
+    assert _bool_param({"validate": False}, "validate", True) is False
+
+
+@pytest.mark.parametrize("params", [{"theme": ""}, {"theme": 1}, {"theme": None}])
+def test_theme_param_rejects_non_strings(params):
+    with pytest.raises(InvalidParamsError):
+        _theme_param(params)
+
+
+@pytest.mark.parametrize("params", [{}, {"code": "  "}, {"code": 42}])
+def test_require_code(params):
+    with pytest.raises(InvalidParamsError):
+        _require_code(params)
+
+
+def test_call_rejects_bad_params_before_rendering():
+    renderer = _FakeRenderer()
+    service = RenderService(renderer=renderer, dispatchers=1, queue_size=4, request_timeout=5)
+    with pytest.raises(InvalidParamsError):
+        service.call("svg", {"code": "graph TD", "validate": "false"})
+    assert renderer.calls == []
+
+    assert service.call("svg", {"code": "graph TD", "timeout": 5}) == {"svg": "<svg/>"}
+    assert renderer.calls == [{"validate": False, "theme": "default", "timeout": 5.0}]
+
+
+def test_batch_size_is_limited(monkeypatch):
+    monkeypatch.setitem(RENDER_SERVER_CONFIG, "max_batch_jobs", 2)
+    service = RenderService(renderer=_FakeRenderer(), dispatchers=1, queue_size=4, request_timeout=5)
+    jobs = [{"id": i, "op": "svg", "code": "graph TD"} for i in range(3)]
+    with pytest.raises(InvalidParamsError):
+        service.call("batch", {"jobs": jobs})
+
+    results = service.call("batch", {"jobs": [jobs[0], {"id": "x", "op": "batch"}]})["results"]
+    assert [item["ok"] for item in results] == [True, False]
+    assert results[1]["error"] == "未知操作: batch"
@@ -0,0 +1,140 @@
+"""RetryPolicy / CircuitBreaker 及 MultiLLMClient._post 熔断探测的单元测试（不访问网络）"""
+import time
+import pytest
+import requests
+from agents.llm_client import MultiLLMClient
+from agents.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+class _RaisingSession:
+    """post 总是抛出指定异常的假 Session"""
+
+    def __init__(self, exc):
+        self.exc = exc
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        raise self.exc
+
+
+def _half_open_breaker(name):
+    breaker = CircuitBreaker(name, failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    return breaker
+
+
+def test_breaker_opens_and_admits_single_probe():
+    breaker = CircuitBreaker("t", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()  # 探测请求
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # 探测未结束时其他请求快速失败
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+@pytest.mark.parametrize("exc", [
+    requests.exceptions.ReadTimeout("read timeout"),
+    requests.exceptions.ChunkedEncodingError("broken"),
+])
+def test_post_releases_probe_on_any_failure(exc):
+    client = MultiLLMClient("ollama")
+    client.breaker = _half_open_breaker(f"probe-{type(exc).__name__}")
+    client.session = _RaisingSession(exc)
+
+    with pytest.raises(type(exc)):
+        client._post("http://llm.invalid/chat/completions", json={})
+    assert client.session.calls == 1
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # 熔断到期后必须能再次放行探测请求，而不是一直处于半开状态
+    time.sleep(0.06)
+    client.breaker.before_call()
+
+
+def test_post_interrupt_releases_probe_without_counting_failure():
+    client = MultiLLMClient("ollama")
+    client.breaker = _half_open_breaker("probe-interrupt")
+    client.session = _RaisingSession(KeyboardInterrupt())
+
+    with pytest.raises(KeyboardInterrupt):
+        client._post("http://llm.invalid/chat/completions", json={})
+    # 中断不计为失败，探测名额立即可用
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    client.breaker.before_call()
+
+
+def test_open_error_message_while_probe_in_flight():
+    breaker = _half_open_breaker("probe-message")
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.before_call()
+    assert info.value.retry_in is None
+    assert "正在探测" in str(info.value)
+
+
+def test_attempt_timeout_is_clamped_to_deadline():
+    policy = RetryPolicy(deadline=5.0)
+    started_at = time.monotonic() - 4.0
+    connect, read = policy.attempt_timeout((10, 60), started_at)
+    assert connect <= 1.0 and read <= 1.0
+    assert RetryPolicy(deadline=0).attempt_timeout((10, 60), started_at) == (10, 60)
+
+
+def test_next_delay_honours_retry_after_and_deadline():
+    policy = RetryPolicy(max_attempts=3, deadline=10.0)
+    started_at = time.monotonic()
+    assert policy.next_delay(1, started_at, retry_after=2.0) == 2.0
+    assert policy.next_delay(1, started_at, retry_after=20.0) is None
+    assert policy.next_delay(3, started_at) is None
+    assert RetryPolicy.parse_retry_after("1.5") == 1.5
+    assert RetryPolicy.parse_retry_after("soon") is None
+
+
+class _FakeAsyncClient:
+    """send 总是抛出指定异常的假 httpx.AsyncClient"""
+
+    def __init__(self, exc):
+        self.exc = exc
+
+    def build_request(self, method, url, **kwargs):
+        return (method, url)
+
+    async def send(self, request, stream=False):
+        raise self.exc
+
+
+@pytest.mark.parametrize("exc_name", ["ReadTimeout", "CancelledError"])
+def test_apost_releases_probe_on_any_failure(monkeypatch, exc_name):
+    httpx = pytest.importorskip("httpx")
+    import asyncio
+    from agents.async_llm_client import AsyncMultiLLMClient
+
+    exc = asyncio.CancelledError() if exc_name == "CancelledError" else httpx.ReadTimeout("read timeout")
+    client = AsyncMultiLLMClient("ollama")
+    client.breaker = _half_open_breaker(f"async-probe-{exc_name}")
+    monkeypatch.setattr(AsyncMultiLLMClient, "get_async_client", classmethod(lambda cls: _FakeAsyncClient(exc)))
+
+    async def call():
+        async with client._apost("http://llm.invalid/chat/completions", json={}):
+            pass
+
+    with pytest.raises(type(exc)):
+        asyncio.run(call())
+    if exc_name == "CancelledError":
+        # 取消不计为失败，但探测名额已释放
+        client.breaker.before_call()
+    else:
+        assert client.breaker.state == CircuitBreaker.OPEN
+        time.sleep(0.06)
+        client.breaker.before_call()
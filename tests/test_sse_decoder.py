@@ -0,0 +1,37 @@
+"""SSEDecoder 事件分帧的单元测试"""
+from agents.llm_client import SSEDecoder
+
+
+def _decode(lines):
+    decoder = SSEDecoder()
+    events = [event for event in map(decoder.feed, lines) if event is not None]
+    tail = decoder.flush()
+    return events + ([tail] if tail is not None else [])
+
+
+def test_blank_line_ends_event():
+    assert _decode(['data: {"a": 1}', '', 'data: [DONE]', '']) == [(None, '{"a": 1}'), (None, '[DONE]')]
+
+
+def test_event_type_and_multiline_data():
+    events = _decode(['event: content_block_delta', 'data: line1', 'data: line2', ''])
+    assert events == [('content_block_delta', 'line1\nline2')]
+
+
+def test_event_type_resets_between_events():
+    assert _decode(['event: ping', 'data: {}', '', 'data: x', '']) == [('ping', '{}'), (None, 'x')]
+
+
+def test_comments_and_events_without_data_are_skipped():
+    assert _decode([': keep-alive', '', 'event: ping', '', 'id: 3', 'retry: 100', '']) == []
+
+
+def test_only_one_leading_space_is_stripped():
+    assert _decode(['data:no-space', '', 'data:  two', '']) == [(None, 'no-space'), (None, ' two')]
+
+
+def test_flush_returns_unterminated_event():
+    decoder = SSEDecoder()
+    assert decoder.feed('data: partial') is None
+    assert decoder.flush() == (None, 'partial')
+    assert decoder.flush() is None
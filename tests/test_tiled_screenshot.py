@@ -0,0 +1,47 @@
+"""PngStreamWriter 按条带写入后的PNG能被Pillow完整读回"""
+import io
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from utils.tiled_screenshot import PngStreamWriter
+
+
+def _gradient(width, height, mode):
+    image = Image.new(mode, (width, height))
+    image.putdata([
+        (x * 7 % 256, y * 5 % 256, (x + y) % 256) + ((200,) if mode == 'RGBA' else ())
+        for y in range(height) for x in range(width)
+    ])
+    return image
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+def test_round_trip_in_bands(mode):
+    image = _gradient(37, 50, mode)
+    buffer = io.BytesIO()
+    writer = PngStreamWriter(buffer, image.width, image.height, mode=mode)
+    for top in range(0, image.height, 16):  # 最后一个条带不满 16 行
+        writer.write_band(image.crop((0, top, image.width, min(top + 16, image.height))))
+    writer.close()
+
+    buffer.seek(0)
+    decoded = Image.open(buffer)
+    decoded.load()
+    assert decoded.mode == mode and decoded.size == image.size
+    assert decoded.tobytes() == image.tobytes()
+
+
+def test_rejects_mismatched_or_incomplete_bands():
+    writer = PngStreamWriter(io.BytesIO(), 10, 4)
+    with pytest.raises(ValueError):
+        writer.write_band(Image.new('RGB', (9, 2)))
+    with pytest.raises(ValueError):
+        writer.write_band(Image.new('RGBA', (10, 2)))
+    writer.write_band(Image.new('RGB', (10, 2)))
+    with pytest.raises(ValueError):
+        writer.write_band(Image.new('RGB', (10, 3)))
+    with pytest.raises(ValueError):
+        writer.close()  # 只写入了 2/4 行
+    with pytest.raises(ValueError):
+        PngStreamWriter(io.BytesIO(), 10, 4, mode='L')
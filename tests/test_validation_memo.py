@@ -0,0 +1,50 @@
+"""ValidationMemo 的键、LRU淘汰和深拷贝行为的单元测试"""
+import pytest
+from config import VALIDATION_MEMO_CONFIG
+from utils.validation_memo import ValidationMemo
+
+
+@pytest.fixture
+def memo(monkeypatch):
+    """容量为2的新备忘录实例（绕过单例）"""
+    monkeypatch.setitem(VALIDATION_MEMO_CONFIG, "enabled", True)
+    monkeypatch.setitem(VALIDATION_MEMO_CONFIG, "max_entries", 2)
+    monkeypatch.setattr(ValidationMemo, "_instance", None)
+    return ValidationMemo()
+
+
+def test_key_includes_validator_version():
+    code = "graph TD; A-->B"
+    assert ValidationMemo.make_key(code, "v1") == ValidationMemo.make_key(code, "v1")
+    assert ValidationMemo.make_key(code, "v1") != ValidationMemo.make_key(code, "v2")
+    assert ValidationMemo.make_key(code, "v1") != ValidationMemo.make_key(code + " ", "v1")
+
+
+def test_results_are_deep_copied(memo):
+    error_info = {"message": "语法错误", "error_lines": [1, 2]}
+    memo.put("k", False, error_info)
+    error_info["error_lines"].append(3)  # 修改传入的对象不影响缓存
+
+    is_valid, cached = memo.get("k")
+    assert is_valid is False
+    assert cached == {"message": "语法错误", "error_lines": [1, 2]}
+    cached["error_lines"].clear()  # 修改返回的对象也不影响缓存
+    assert memo.get("k")[1]["error_lines"] == [1, 2]
+
+
+def test_evicts_least_recently_used(memo):
+    memo.put("a", True, {})
+    memo.put("b", True, {})
+    assert memo.get("a") is not None
+    memo.put("c", True, {})
+
+    assert memo.get("b") is None
+    assert memo.get("a") is not None and memo.get("c") is not None
+    assert memo.stats()["entries"] == 2
+
+
+def test_disabled_memo_stores_nothing(memo):
+    memo.enabled = False
+    memo.put("a", True, {})
+    assert memo.get("a") is None
+    assert memo.stats()["entries"] == 0
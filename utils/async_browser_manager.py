@@ -0,0 +1,122 @@
+"""异步浏览器管理器 - 对象池模式（playwright.async_api）"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+from playwright.async_api import async_playwright, Browser, Page, Playwright, Error as PlaywrightError
+from config import ASYNC_RENDER_CONFIG
+from utils.mermaid_assets import MermaidAssets
+
+
+class AsyncBrowserManager:
+    """异步浏览器管理器 - 同一事件循环内共享一个Chromium，用信号量限制并发页面数
+
+    与同步的 BrowserManager 不同，异步API下多个页面可以在一个线程里并发工作，
+    因此这里只维护一个浏览器和一组预热好的mermaid页面。实例需在同一个事件循环中使用。
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        """初始化异步浏览器管理器
+
+        Args:
+            max_concurrency: 最大并发页面数，默认使用 ASYNC_RENDER_CONFIG 配置
+        """
+        self.max_concurrency = max(1, max_concurrency or ASYNC_RENDER_CONFIG.get("max_concurrency", 8))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._idle_pages: Dict[float, List[Page]] = {}  # 设备缩放比例 -> 空闲预热页面
+
+    @asynccontextmanager
+    async def lease_page(self, device_scale_factor: float = 1.0) -> AsyncIterator[Page]:
+        """租用一个已加载mermaid.js的预热页面，退出上下文时重置并归还
+
+        Args:
+            device_scale_factor: 页面的设备缩放比例（截图像素密度）
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            page = await self._checkout_page(device_scale_factor)
+            try:
+                yield page
+            except PlaywrightError:
+                # 页面可能已处于异常状态（超时、崩溃），直接丢弃
+                await self._discard_page(page)
+                raise
+            except BaseException:
+                await self._recycle_page(page, device_scale_factor)
+                raise
+            else:
+                await self._recycle_page(page, device_scale_factor)
+
+    async def _ensure_browser(self) -> Browser:
+        """确保已启动Playwright和浏览器（断开后自动重新启动）"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+
+        async with self._start_lock:
+            if self._playwright is None:
+                try:
+                    self._playwright = await async_playwright().start()
+                except ImportError:
+                    raise ImportError(
+                        "Playwright未安装。请运行以下命令安装：\n"
+                        "pip install playwright\n"
+                        "playwright install chromium"
+                    ) from None
+
+            if self._browser is None or not self._browser.is_connected():
+                self._idle_pages.clear()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+            return self._browser
+
+    async def _checkout_page(self, device_scale_factor: float) -> Page:
+        """取出一个预热页面，没有时新建"""
+        browser = await self._ensure_browser()
+        idle_pages = self._idle_pages.get(device_scale_factor, [])
+        while idle_pages:
+            page = idle_pages.pop()
+            if not page.is_closed():
+                return page
+        page = await browser.new_page(device_scale_factor=device_scale_factor, **MermaidAssets.CONTEXT_OPTIONS)
+        await MermaidAssets.prepare_page_async(page)
+        return page
+
+    async def _recycle_page(self, page: Page, device_scale_factor: float):
+        """重置页面并放回空闲列表，重置失败则丢弃"""
+        try:
+            await MermaidAssets.reset_page_async(page)
+            self._idle_pages.setdefault(device_scale_factor, []).append(page)
+        except Exception:
+            await self._discard_page(page)
+
+    async def _discard_page(self, page: Page):
+        """关闭页面"""
+        try:
+            await page.close()
+        except:
+            pass
+
+    async def close(self):
+        """关闭浏览器并停止Playwright"""
+        self._idle_pages.clear()
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except:
+                pass
+            self._playwright = None
+
+    async def __aenter__(self) -> 'AsyncBrowserManager':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,130 @@
+"""异步Mermaid渲染器 - 基于playwright.async_api的渲染与验证"""
+import os
+from typing import Dict, Optional, Tuple
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError
+from utils.async_browser_manager import AsyncBrowserManager
+from utils.mermaid_assets import MermaidAssets
+from utils.mermaid_js_validator import MermaidJSValidator
+from utils.mermaid_renderer import MermaidRenderer
+
+
+class AsyncMermaidRenderer:
+    """异步Mermaid渲染器 - 与 MermaidRenderer 共用页面资源、验证规则和缓存
+
+    一个事件循环内可以并发发起大量 render/validate 调用，并发页面数由
+    AsyncBrowserManager 的信号量限制，不需要为每个请求占用一个线程。
+    """
+
+    def __init__(self, browser_manager: Optional[AsyncBrowserManager] = None, max_concurrency: Optional[int] = None):
+        """初始化异步渲染器
+
+        Args:
+            browser_manager: 异步浏览器管理器，默认新建一个
+            max_concurrency: 新建浏览器管理器时的最大并发页面数
+        """
+        self.browser_manager = browser_manager or AsyncBrowserManager(max_concurrency)
+        # 规范化、基础语法检查、结果合并以及两级缓存都是纯Python逻辑，直接复用同步渲染器
+        self.sync_renderer = MermaidRenderer()
+
+    async def validate(self, mermaid_code: str) -> Tuple[bool, Dict]:
+        """验证Mermaid代码语法，返回值与 MermaidRenderer.validate_syntax_with_details 相同"""
+        renderer = self.sync_renderer
+        if not mermaid_code or not mermaid_code.strip():
+            return False, renderer.error_factory.create_error_info(
+                message="Mermaid代码为空",
+                source="基础语法检查"
+            )
+
+        normalized_code = mermaid_code.strip()
+        # 验证在浏览器页面内执行，即使同步渲染器配置为 Node 后端，也按浏览器验证后端区分缓存
+        memo_key = renderer.validation_memo.make_key(normalized_code, renderer.validator_version(MermaidJSValidator.BACKEND))
+        memoized = renderer.validation_memo.get(memo_key)
+        if memoized is not None:
+            return memoized
+
+        basic_error = renderer.syntax_checker_chain.check_all(normalized_code)
+
+        mermaid_js_result = None
+        if os.path.exists(MermaidAssets.mermaid_js_path()):
+            try:
+                async with self.browser_manager.lease_page() as page:
+                    raw_result = await page.evaluate(MermaidAssets.VALIDATE_JS, normalized_code)
+                mermaid_js_result = renderer.mermaid_js_validator.build_result(normalized_code, raw_result)
+            except Exception:
+                # 验证过程出现异常，不影响基础检查结果
+                mermaid_js_result = None
+
+        is_valid, error_info = renderer._merge_validation_results(normalized_code, basic_error, mermaid_js_result)
+        if mermaid_js_result is not None:
+            renderer.validation_memo.put(memo_key, is_valid, error_info)
+        return is_valid, error_info
+
+    async def render(self, mermaid_code: str, output_path: Optional[str] = None, width: int = 1920,
+                     height: int = 1080, theme: str = 'default', timeout: Optional[float] = None,
+                     scale: Optional[float] = None) -> Dict:
+        """渲染Mermaid代码
+
+        Args:
+            mermaid_code: Mermaid代码字符串
+            output_path: 输出PNG文件路径（为None时只返回字节）
+            width: 视口宽度（像素）
+            height: 视口高度（像素）
+            theme: Mermaid主题
+            timeout: 页面内渲染和截图的超时时间（秒）
+            scale: 设备缩放比例，默认使用 EXPORT_CONFIG["png"]["scale"]
+
+        Returns:
+            {'svg': str, 'png_bytes': bytes, 'png_file': str, 'cached': bool}
+
+        Raises:
+            ValueError: Mermaid渲染错误
+            RuntimeError: 浏览器或文件写入失败
+        """
+        renderer = self.sync_renderer
+        normalized_code = renderer._normalize_code(mermaid_code)
+        timeout_ms = renderer._timeout_ms(timeout)
+        scale = renderer._png_scale(scale)
+
+        if output_path:
+            os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else ".", exist_ok=True)
+            cache_key = renderer.render_cache.make_key(normalized_code, width, height, theme, scale)
+            if renderer.render_cache.fetch_to(cache_key, output_path):
+                with open(output_path, 'rb') as f:
+                    return {'svg': None, 'png_bytes': f.read(), 'png_file': output_path, 'cached': True}
+
+        MermaidAssets.page_html()
+
+        try:
+            async with self.browser_manager.lease_page(scale) as page:
+                await page.set_viewport_size({"width": width, "height": height})
+                result = await page.evaluate(MermaidAssets.RENDER_JS, [normalized_code, {"timeout": timeout_ms, "theme": theme}])
+                if not result.get('ok'):
+                    raise ValueError(f"Mermaid渲染错误: {(result.get('error') or '').strip() or '未知错误'}")
+                # 按SVG的边界框裁剪截图
+                clip = await page.evaluate(MermaidAssets.MEASURE_JS, renderer.SCREENSHOT_PADDING)
+                if clip and clip['width'] > 0 and clip['height'] > 0:
+                    png_bytes = await page.screenshot(path=output_path, clip=clip, full_page=True, timeout=timeout_ms)
+                else:
+                    png_bytes = await page.screenshot(path=output_path, full_page=True, timeout=timeout_ms)
+        except ValueError:
+            raise
+        except ImportError:
+            raise
+        except (PlaywrightError, PlaywrightTimeoutError) as e:
+            raise RuntimeError("渲染PNG失败") from e
+        except OSError as e:
+            raise RuntimeError("输出文件写入失败") from e
+
+        if output_path:
+            renderer.render_cache.put_file(cache_key, output_path)
+        return {'svg': result.get('svg'), 'png_bytes': png_bytes, 'png_file': output_path, 'cached': False}
+
+    async def close(self):
+        """关闭浏览器"""
+        await self.browser_manager.close()
+
+    async def __aenter__(self) -> 'AsyncMermaidRenderer':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
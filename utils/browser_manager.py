@@ -1,16 +1,391 @@
 """浏览器管理器 - 单例模式 + 对象池模式"""
+import atexit
+import logging
+import os
+import queue
+import signal
 import threading
+import time
 import sys
-from typing import Optional
-from playwright.sync_api import sync_playwright, Browser, Playwright
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from playwright.sync_api import sync_playwright, Browser, Page, Playwright, Error as PlaywrightError
+from config import BROWSER_POOL_CONFIG
+from utils.mermaid_assets import MermaidAssets
+
+try:
+    import psutil
+except ImportError:
+    psutil = None  # 未安装时在Linux上读取 /proc，其他平台跳过内存检查
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserWorker:
+    """浏览器工作线程 - 独占一个Playwright和Chromium实例，串行执行提交的任务
+
+    Playwright的同步API只能在创建它的线程中使用，因此每个浏览器都绑定在
+    自己的工作线程上，调用方通过 submit/call 把任务交给该线程执行。
+    """
+
+    def __init__(self, manager: 'BrowserManager', index: int):
+        self._manager = manager
+        self._tasks: "queue.Queue" = queue.Queue()
+        self._playwright: Optional[Playwright] = None
+        self.browser: Optional[Browser] = None
+        self._warm_pages: Dict[float, Page] = {}  # 设备缩放比例 -> 预热页面
+        self.index = index
+        self.last_used = time.monotonic()
+        self.lease_count = 0
+        # 健康状况（针对当前浏览器实例，回收后清零）
+        self.render_count = 0
+        self.error_count = 0
+        self.rss_mb: Optional[float] = None
+        self.recycle_count = 0
+        self.last_recycle_reason: Optional[str] = None
+        self._last_health_check = time.monotonic()
+        self._pending_launch_ms: Optional[float] = None  # 本次任务启动浏览器的耗时，由下一次页面任务计入计时器
+        self._browser_pid: Optional[int] = None  # 浏览器主进程PID，任务超时时由调用方线程结束该进程
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"browser-worker-{index}",
+            daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def is_alive(self) -> bool:
+        """工作线程是否仍在运行"""
+        return self._thread.is_alive()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """提交任务，fn 的第一个参数为该线程持有的 Browser 实例"""
+        future = Future()
+        self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def call(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """提交任务并等待结果（异常会原样抛给调用方）
+
+        页面内的超时（setTimeout + Promise.race）在 mermaid 同步布局/解析阻塞事件循环时无法触发，
+        page.evaluate 本身也没有超时，因此在调用方一侧限制等待时间：超时后结束该浏览器进程，
+        卡住的 Playwright 调用随之报错返回，工作线程在下一个任务时重新启动浏览器。
+
+        Args:
+            timeout: 等待结果的最长秒数，默认使用 BROWSER_POOL_CONFIG["task_timeout"]，0 表示不限制
+
+        Raises:
+            TimeoutError: 任务在超时时间内未完成
+        """
+        timeout = BROWSER_POOL_CONFIG.get("task_timeout", 60) if timeout is None else timeout
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout or None)
+        except FutureTimeoutError:
+            if not future.cancel():
+                self._abort(f"任务超过 {timeout} 秒未完成")
+            raise TimeoutError(f"浏览器任务超时（{timeout}秒）") from None
+
+    def stop(self, wait: bool = False):
+        """通知工作线程关闭浏览器并退出"""
+        self._tasks.put(None)
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join(timeout=10)
+
+    def _abort(self, reason: str):
+        """结束卡住的浏览器进程（在调用方线程中执行，不使用 Playwright 对象）
+
+        无法结束进程时把该工作线程移出池，由新的工作线程补位，旧线程在任务返回后退出。
+        """
+        pid = self._browser_pid
+        logger.warning("浏览器 #%d %s，结束浏览器进程", self.index, reason)
+        if pid:
+            try:
+                os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+                self.recycle_count += 1
+                self.last_recycle_reason = reason
+                return
+            except OSError:
+                pass
+        self._manager._evict(self)
+        self.stop()
+
+    def _run(self):
+        """工作线程主循环"""
+        idle_timeout = BROWSER_POOL_CONFIG.get("idle_timeout", 300)
+        try:
+            while True:
+                try:
+                    task = self._tasks.get(timeout=min(idle_timeout, 30))
+                except queue.Empty:
+                    # 空闲超时：从池中退役并释放浏览器
+                    if time.monotonic() - self.last_used >= idle_timeout and self._manager._retire(self):
+                        break
+                    continue
+
+                if task is None:
+                    break
+
+                future, fn, args, kwargs = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn(self._ensure_browser(), *args, **kwargs))
+                except BaseException as e:
+                    if isinstance(e, PlaywrightError):
+                        # 只统计浏览器层面的错误，Mermaid语法错误等不影响浏览器健康
+                        self.error_count += 1
+                    future.set_exception(e)
+                finally:
+                    self.last_used = time.monotonic()
+                # 在两个任务之间检查健康状况，超出阈值时回收浏览器，下个任务会重新启动
+                self._check_health()
+        finally:
+            self._shutdown()
+
+    def _ensure_browser(self) -> Browser:
+        """确保当前线程已启动Playwright和浏览器（断开后自动重新启动）"""
+        if self._playwright is None:
+            # Windows上需要设置事件循环策略
+            if sys.platform == 'win32':
+                import asyncio
+                try:
+                    if hasattr(asyncio, 'WindowsProactorEventLoopPolicy'):
+                        asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+                except:
+                    pass
+
+            try:
+                self._playwright = sync_playwright().start()
+            except ImportError:
+                raise ImportError(
+                    "Playwright未安装。请运行以下命令安装：\n"
+                    "pip install playwright\n"
+                    "playwright install chromium"
+                ) from None
+
+        if self.browser is None or not self.browser.is_connected():
+            if self.browser is not None:
+                # 浏览器进程意外退出（崩溃、被系统杀掉），预热页面已失效
+                logger.warning("浏览器 #%d 已断开，重新启动", self.index)
+                self._warm_pages.clear()
+                self._reset_health()
+            launch_start = time.perf_counter()
+            self.browser = self._playwright.chromium.launch(headless=True)
+            self._pending_launch_ms = (time.perf_counter() - launch_start) * 1000
+            self._browser_pid = self._query_browser_pid()
+        return self.browser
+
+    def health(self) -> Dict:
+        """获取当前浏览器的健康状况"""
+        return {
+            'index': self.index,
+            'renders': self.render_count,
+            'errors': self.error_count,
+            'rss_mb': self.rss_mb,
+            'recycles': self.recycle_count,
+            'last_recycle_reason': self.last_recycle_reason,
+        }
+
+    def _check_health(self):
+        """渲染次数、错误次数或内存占用超过阈值时回收浏览器（在工作线程中调用）"""
+        if self.browser is None:
+            return
+
+        reason = None
+        max_renders = BROWSER_POOL_CONFIG.get("max_renders", 0)
+        max_errors = BROWSER_POOL_CONFIG.get("max_errors", 0)
+        max_rss_mb = BROWSER_POOL_CONFIG.get("max_rss_mb", 0)
+        if max_renders and self.render_count >= max_renders:
+            reason = f"已渲染 {self.render_count} 次"
+        elif max_errors and self.error_count >= max_errors:
+            reason = f"累计 {self.error_count} 次浏览器错误"
+        elif max_rss_mb and time.monotonic() - self._last_health_check >= BROWSER_POOL_CONFIG.get("health_check_interval", 30):
+            self._last_health_check = time.monotonic()
+            self.rss_mb = self._measure_rss_mb()
+            if self.rss_mb is not None and self.rss_mb >= max_rss_mb:
+                reason = f"内存占用 {self.rss_mb:.0f}MB"
+
+        if reason:
+            self._recycle_browser(reason)
+
+    def _query_browser_pid(self) -> Optional[int]:
+        """通过CDP查询浏览器主进程的PID，无法获取时返回None"""
+        try:
+            cdp = self.browser.new_browser_cdp_session()
+            try:
+                process_info = cdp.send("SystemInfo.getProcessInfo").get("processInfo", [])
+            finally:
+                cdp.detach()
+        except Exception:
+            return None
+        for info in process_info:
+            if info.get("type") == "browser":
+                return info.get("id")
+        return None
+
+    def _measure_rss_mb(self) -> Optional[float]:
+        """统计浏览器所有进程（主进程、渲染进程、GPU进程等）的常驻内存，无法获取时返回None"""
+        try:
+            cdp = self.browser.new_browser_cdp_session()
+            try:
+                process_info = cdp.send("SystemInfo.getProcessInfo").get("processInfo", [])
+            finally:
+                cdp.detach()
+        except Exception:
+            return None
+
+        total_bytes = 0
+        for info in process_info:
+            rss = self._process_rss_bytes(info.get("id"))
+            if rss is None:
+                return None
+            total_bytes += rss
+        return total_bytes / (1024 * 1024)
+
+    @staticmethod
+    def _process_rss_bytes(pid: Optional[int]) -> Optional[int]:
+        """获取单个进程的常驻内存（字节）"""
+        if not pid:
+            return 0
+        if psutil is not None:
+            try:
+                return psutil.Process(pid).memory_info().rss
+            except psutil.NoSuchProcess:
+                return 0
+            except psutil.Error:
+                return None
+        try:
+            with open(f"/proc/{pid}/status", 'r') as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except FileNotFoundError:
+            return 0
+        except OSError:
+            return None
+        return 0
+
+    def _recycle_browser(self, reason: str):
+        """关闭当前浏览器，下次执行任务时重新启动"""
+        logger.info("回收浏览器 #%d：%s", self.index, reason)
+        self._warm_pages.clear()
+        try:
+            self.browser.close()
+        except:
+            pass
+        self.browser = None
+        self._browser_pid = None
+        self.recycle_count += 1
+        self.last_recycle_reason = reason
+        self._reset_health()
+
+    def _reset_health(self):
+        """清零当前浏览器实例的健康计数"""
+        self.render_count = 0
+        self.error_count = 0
+        self.rss_mb = None
+        self._last_health_check = time.monotonic()
+
+    def _with_warm_page(self, browser: Browser, fn: Callable, args: tuple, kwargs: dict, device_scale_factor: float = 1.0,
+                        timer=None):
+        """取出预热好的mermaid页面执行 fn(page, ...)，用完后重置页面留待复用
+
+        设备缩放比例属于浏览器上下文级别的设置，因此每种缩放比例各保留一个预热页面。
+        传入 PhaseTimer 时记录 launch（本次启动浏览器）、page_setup（取出或新建预热页面）和 page_reset 阶段。
+        """
+        launch_ms, self._pending_launch_ms = self._pending_launch_ms, None
+        if timer is not None and launch_ms is not None:
+            timer.add('launch', launch_ms)
+
+        setup_start = time.perf_counter()
+        page = self._warm_pages.pop(device_scale_factor, None)
+        if page is None or page.is_closed():
+            page = browser.new_page(device_scale_factor=device_scale_factor, **MermaidAssets.CONTEXT_OPTIONS)
+            MermaidAssets.prepare_page(page)
+        if timer is not None:
+            timer.add_since('page_setup', setup_start)
+
+        self.render_count += 1
+        try:
+            result = fn(page, *args, **kwargs)
+        except PlaywrightError:
+            # 页面可能已处于异常状态（超时、崩溃），直接丢弃
+            self._discard_page(page)
+            raise
+        except BaseException:
+            self._recycle_page(page, device_scale_factor)
+            raise
+        reset_start = time.perf_counter()
+        self._recycle_page(page, device_scale_factor)
+        if timer is not None:
+            timer.add_since('page_reset', reset_start)
+        return result
+
+    def _recycle_page(self, page: Page, device_scale_factor: float):
+        """重置页面并放回预热槽位，重置失败则丢弃"""
+        try:
+            MermaidAssets.reset_page(page)
+            self._warm_pages[device_scale_factor] = page
+        except Exception:
+            self._discard_page(page)
+
+    def _discard_page(self, page: Page):
+        """关闭页面"""
+        try:
+            page.close()
+        except:
+            pass
+
+    def _shutdown(self):
+        """关闭浏览器并停止Playwright"""
+        self._warm_pages.clear()
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except:
+                pass
+            self.browser = None
+            self._browser_pid = None
+        if self._playwright is not None:
+            try:
+                self._playwright.stop()
+            except:
+                pass
+            self._playwright = None
+
+
+class BrowserLease:
+    """浏览器租约 - 在租用期间独占一个浏览器工作线程"""
+
+    def __init__(self, worker: BrowserWorker):
+        self._worker = worker
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """在浏览器线程中执行 fn(browser, *args, **kwargs) 并返回结果（timeout 同 BrowserWorker.call）"""
+        return self._worker.call(fn, *args, timeout=timeout, **kwargs)
+
+    def run_page(self, fn: Callable, *args, device_scale_factor: float = 1.0, timer=None,
+                 timeout: Optional[float] = None, **kwargs):
+        """在浏览器线程中用预热好的mermaid页面执行 fn(page, *args, **kwargs) 并返回结果
+
+        Args:
+            device_scale_factor: 页面的设备缩放比例（截图像素密度）
+            timer: 可选的 PhaseTimer，记录浏览器启动、页面准备和重置的耗时
+            timeout: 等待结果的最长秒数（同 BrowserWorker.call），超时抛出 TimeoutError
+        """
+        return self._worker.call(
+            self._worker._with_warm_page, fn, args, kwargs, device_scale_factor, timer, timeout=timeout
+        )
 
 
 class BrowserManager:
     """浏览器管理器 - 单例模式，管理浏览器实例池"""
-    
+
     _instance = None
     _lock = threading.Lock()
-    
+
     def __new__(cls):
         """单例模式"""
         if cls._instance is None:
@@ -19,59 +394,119 @@ class BrowserManager:
                     cls._instance = super().__new__(cls)
                     cls._instance._initialized = False
         return cls._instance
-    
+
     def __init__(self):
         """初始化浏览器管理器"""
         if hasattr(self, '_initialized') and self._initialized:
             return
-        
-        self._playwright: Optional[Playwright] = None
-        self._playwright_lock = threading.Lock()
+
+        self.max_size = max(1, BROWSER_POOL_CONFIG.get("max_size", 4))
+        self.lease_timeout = BROWSER_POOL_CONFIG.get("lease_timeout", 60)
+        self._pool_cond = threading.Condition()
+        self._workers: List[BrowserWorker] = []
+        self._idle: List[BrowserWorker] = []
+        self._next_index = 0
         self._initialized = True
-    
-    def _ensure_playwright(self):
-        """确保Playwright已初始化"""
-        if self._playwright is None:
-            with self._playwright_lock:
-                if self._playwright is None:
-                    # Windows上需要设置事件循环策略
-                    if sys.platform == 'win32':
-                        import asyncio
-                        try:
-                            if hasattr(asyncio, 'WindowsProactorEventLoopPolicy'):
-                                asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-                        except:
-                            pass
-                    
-                    try:
-                        from playwright.sync_api import sync_playwright
-                        self._playwright = sync_playwright().start()
-                    except ImportError:
-                        raise ImportError(
-                            "Playwright未安装。请运行以下命令安装：\n"
-                            "pip install playwright\n"
-                            "playwright install chromium"
-                        ) from None
-    
-    def get_browser(self) -> Browser:
-        """获取浏览器实例（每次都创建新的，避免线程问题）
-        
-        Returns:
-            Browser实例
+        atexit.register(self.cleanup)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[BrowserLease]:
+        """租用一个浏览器，退出上下文时自动归还
+
+        Args:
+            timeout: 等待可用浏览器的最长秒数，默认使用配置值
+
+        Yields:
+            BrowserLease实例
+        """
+        worker = self.acquire(timeout)
+        try:
+            yield BrowserLease(worker)
+        finally:
+            self.release(worker)
+
+    def acquire(self, timeout: Optional[float] = None) -> BrowserWorker:
+        """从池中取出一个空闲浏览器工作线程，池未满时新建
+
+        Raises:
+            RuntimeError: 在超时时间内没有可用的浏览器
         """
-        self._ensure_playwright()
-        return self._playwright.chromium.launch(headless=True)
-    
+        timeout = self.lease_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._pool_cond:
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()  # 后进先出，优先复用最近使用过的热浏览器
+                    if worker.is_alive:
+                        worker.lease_count += 1
+                        return worker
+                    self._workers.remove(worker)
+
+                if len(self._workers) < self.max_size:
+                    worker = BrowserWorker(self, self._next_index)
+                    self._next_index += 1
+                    self._workers.append(worker)
+                    worker.lease_count += 1
+                    return worker
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(f"等待可用浏览器超时（{timeout}秒，池大小 {self.max_size}）")
+                self._pool_cond.wait(remaining)
+
+    def release(self, worker: BrowserWorker):
+        """归还浏览器工作线程"""
+        with self._pool_cond:
+            if worker in self._workers and worker.is_alive:
+                self._idle.append(worker)
+            elif worker in self._workers:
+                self._workers.remove(worker)
+            self._pool_cond.notify()
+
+    def _evict(self, worker: BrowserWorker):
+        """把无法恢复的工作线程移出池（不等待其退出），空出的位置可以新建工作线程"""
+        with self._pool_cond:
+            if worker in self._idle:
+                self._idle.remove(worker)
+            if worker in self._workers:
+                self._workers.remove(worker)
+            self._pool_cond.notify()
+
+    def _retire(self, worker: BrowserWorker) -> bool:
+        """空闲超时的工作线程请求退役，仅当其仍处于空闲状态时成功"""
+        with self._pool_cond:
+            if worker not in self._idle:
+                return False
+            self._idle.remove(worker)
+            self._workers.remove(worker)
+            self._pool_cond.notify()
+            return True
+
+    def stats(self) -> dict:
+        """获取浏览器池状态（含每个浏览器的健康状况）"""
+        with self._pool_cond:
+            return {
+                'max_size': self.max_size,
+                'live': len(self._workers),
+                'idle': len(self._idle),
+                'leased': len(self._workers) - len(self._idle),
+                'browsers': [worker.health() for worker in self._workers],
+                'blocked_requests': MermaidAssets.blocked_requests(),
+            }
+
     def cleanup(self):
-        """清理资源"""
-        if self._playwright:
+        """清理资源：关闭所有浏览器工作线程"""
+        with self._pool_cond:
+            workers = list(self._workers)
+            self._workers.clear()
+            self._idle.clear()
+            self._pool_cond.notify_all()
+        for worker in workers:
             try:
-                self._playwright.stop()
-                self._playwright = None
+                worker.stop(wait=True)
             except:
                 pass
-    
+
     def __del__(self):
         """析构函数"""
         self.cleanup()
-
@@ -0,0 +1,364 @@
+"""Mermaid页面资源 - 渲染与验证共用的HTML/JS资源（进程内只加载一次，经虚拟源路由提供给页面）"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from config import RENDER_SANDBOX_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+# 页面骨架：从虚拟源加载mermaid.js后定义验证、渲染、重置三个入口函数，供预热页面反复使用
+_PAGE_TEMPLATE = r"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta http-equiv="Content-Security-Policy" content="default-src 'none'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src data:; font-src data:">
+    <script src="__ORIGIN__/mermaid.min.js"></script>
+    <script src="__ORIGIN__/mermaid_validate_core.js"></script>
+    <style>
+        body {
+            margin: 0;
+            padding: 20px;
+            background: white;
+            font-family: __FONT_FAMILY_CSS__;
+        }
+        .mermaid {
+            background: white;
+        }
+        #font-warmup {
+            position: absolute;
+            visibility: hidden;
+            font-family: __FONT_FAMILY_CSS__;
+        }
+        #mermaid-error {
+            color: red;
+            display: none;
+            white-space: pre-wrap;
+            padding: 10px;
+            background: #ffebee;
+            border: 1px solid #d32f2f;
+            border-radius: 4px;
+            margin-top: 10px;
+        }
+    </style>
+</head>
+<body>
+    <div id="mermaid-container"></div>
+    <div id="mermaid-error"></div>
+    <!-- 页面加载时就让浏览器解析字体回退链，首次渲染不再承担查找本机字体的开销 -->
+    <div id="font-warmup" aria-hidden="true">Aa Zz 0123 中文字体 <b>Aa 中文</b></div>
+    <script>
+        const DEFAULT_CONFIG = {
+            startOnLoad: false,
+            theme: 'default',
+            securityLevel: __SECURITY_LEVEL__,
+            fontFamily: __FONT_FAMILY__,
+            themeVariables: { fontFamily: __FONT_FAMILY__ }
+        };
+        const SHELL_IDS = new Set(['mermaid-container', 'mermaid-error', 'font-warmup']);
+
+        // 存储控制台错误
+        window.consoleErrors = [];
+        window.originalConsoleError = console.error;
+        console.error = function(...args) {
+            window.consoleErrors.push(args.join(' '));
+            window.originalConsoleError.apply(console, args);
+        };
+
+        // 错误处理函数：把错误写入 #mermaid-error 供 Python 侧读取
+        function handleMermaidError(error) {
+            const errorDiv = document.getElementById('mermaid-error');
+            let errorMessage = '';
+            if (error && error.message) {
+                errorMessage = error.message;
+            } else if (typeof error === 'string') {
+                errorMessage = error;
+            } else {
+                errorMessage = 'Unknown error occurred while parsing Mermaid diagram';
+            }
+            window.consoleErrors.push(errorMessage);
+            errorDiv.textContent = errorMessage;
+            errorDiv.style.display = 'block';
+        }
+
+        // 重置页面到初始状态：清空DOM、错误信息和 mermaid 配置，而不是重建页面
+        window.__mermaidReset = function() {
+            document.getElementById('mermaid-container').innerHTML = '';
+            const errorDiv = document.getElementById('mermaid-error');
+            errorDiv.textContent = '';
+            errorDiv.style.display = 'none';
+            window.consoleErrors.length = 0;
+            // mermaid.render 会在 body 下留下临时节点，一并清理
+            for (const el of Array.from(document.body.children)) {
+                if (el.tagName !== 'SCRIPT' && !SHELL_IDS.has(el.id)) {
+                    el.remove();
+                }
+            }
+            mermaid.initialize(DEFAULT_CONFIG);
+            return true;
+        };
+
+        // 渲染图表：await mermaid.render，渲染完成或失败时 Promise 立即返回结果
+        let renderSeq = 0;
+        window.__mermaidRender = async function(code, options) {
+            const opts = options || {};
+            const timeoutMs = opts.timeout || 30000;
+            // 各阶段耗时（毫秒）：fonts 等待字体，render 为 mermaid.render（解析 + 布局 + 生成SVG），insert 为插入DOM
+            const timings = {};
+            let mark = performance.now();
+            const lap = (name) => {
+                const now = performance.now();
+                timings[name] = now - mark;
+                mark = now;
+            };
+            let timer = null;
+            try {
+                mermaid.initialize(Object.assign({}, DEFAULT_CONFIG, { theme: opts.theme || 'default' }));
+                await document.fonts.ready;
+                lap('fonts');
+                const rendering = mermaid.render('mermaid-svg-' + (++renderSeq), code);
+                const timeout = new Promise((_, reject) => {
+                    timer = setTimeout(() => reject(new Error(`渲染超时（${timeoutMs}ms）`)), timeoutMs);
+                });
+                const { svg, bindFunctions } = await Promise.race([rendering, timeout]);
+                lap('render');
+                const wrapper = document.createElement('div');
+                wrapper.className = 'mermaid';
+                wrapper.id = 'mermaid-diagram';
+                wrapper.innerHTML = svg;
+                document.getElementById('mermaid-container').appendChild(wrapper);
+                if (bindFunctions) {
+                    bindFunctions(wrapper);
+                }
+                lap('insert');
+                return { ok: true, error: null, svg: svg, consoleErrors: [], timings: timings };
+            } catch (error) {
+                lap('render');
+                handleMermaidError(error);
+                return {
+                    ok: false,
+                    error: document.getElementById('mermaid-error').textContent,
+                    svg: null,
+                    consoleErrors: window.consoleErrors.slice(),
+                    timings: timings
+                };
+            } finally {
+                clearTimeout(timer);
+            }
+        };
+
+        // 语法验证（规则定义在 mermaid_validate_core.js，与 Node 验证器共用）
+        window.__mermaidValidate = createMermaidValidator(mermaid);
+
+        // 测量已渲染图表：按 viewBox 恢复SVG的自然尺寸，返回带边距的页面坐标区域用于裁剪截图
+        window.__mermaidMeasure = function(padding) {
+            const svg = document.querySelector('#mermaid-diagram svg');
+            if (!svg) {
+                return null;
+            }
+            const viewBox = svg.viewBox && svg.viewBox.baseVal;
+            if (viewBox && viewBox.width > 0 && viewBox.height > 0) {
+                svg.setAttribute('width', viewBox.width);
+                svg.setAttribute('height', viewBox.height);
+                svg.style.maxWidth = 'none';
+            }
+            const rect = svg.getBoundingClientRect();
+            const pad = padding || 0;
+            return {
+                x: Math.max(0, rect.left + window.scrollX - pad),
+                y: Math.max(0, rect.top + window.scrollY - pad),
+                width: Math.ceil(rect.width + pad * 2),
+                height: Math.ceil(rect.height + pad * 2)
+            };
+        };
+
+        // 批量语法验证：在同一个页面内依次调用 mermaid.parse
+        window.__mermaidValidateMany = async function(codes) {
+            const results = [];
+            for (const code of codes) {
+                results.push(await window.__mermaidValidate(code));
+            }
+            return results;
+        };
+
+        try {
+            mermaid.initialize(DEFAULT_CONFIG);
+            window.__mermaidReady = true;
+        } catch (e) {
+            handleMermaidError(e);
+        }
+    </script>
+</body>
+</html>"""
+
+
+class MermaidAssets:
+    """Mermaid页面资源 - 缓存mermaid.min.js与页面骨架，负责预热和重置页面"""
+
+    # mermaid.js 与页面脚本的版本号，渲染缓存和验证结果缓存以此区分，修改页面脚本时需递增 ASSETS_REVISION
+    # （RENDER_SANDBOX_CONFIG 中的字体和安全级别会影响渲染结果，其摘要也计入版本号）
+    MERMAID_VERSION = "10.9.4"
+    ASSETS_REVISION = 4
+
+    # 页面内入口函数
+    VALIDATE_JS = "code => window.__mermaidValidate(code)"
+    VALIDATE_MANY_JS = "codes => window.__mermaidValidateMany(codes)"
+    RENDER_JS = "([code, options]) => window.__mermaidRender(code, options)"
+    MEASURE_JS = "padding => window.__mermaidMeasure(padding)"
+    RESET_JS = "() => window.__mermaidReset()"
+    READY_JS = "() => window.__mermaidReady === true"
+
+    # 虚拟源：页面和脚本都由路由从内存返回，不访问网络也不读磁盘
+    ORIGIN = "https://mermaid.local"
+    PAGE_URL = f"{ORIGIN}/index.html"
+    # 页面的所有请求都经过路由：虚拟源由内存返回，其余请求按 RENDER_SANDBOX_CONFIG 中止
+    ROUTE_PATTERN = "**"
+    # 渲染页面所在浏览器上下文的选项：禁止 Service Worker 和下载
+    CONTEXT_OPTIONS = {'service_workers': 'block', 'accept_downloads': False}
+
+    _assets: Optional[Dict[str, Tuple[bytes, str]]] = None
+    _blocked_requests = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def version(cls) -> str:
+        """获取资源版本号"""
+        digest = hashlib.sha1(cls._shell_html().encode('utf-8')).hexdigest()[:8]
+        return f"{cls.MERMAID_VERSION}-r{cls.ASSETS_REVISION}-{digest}"
+
+    @classmethod
+    def blocked_requests(cls) -> int:
+        """渲染页面中被中止的外部请求数"""
+        return cls._blocked_requests
+
+    @staticmethod
+    def mermaid_js_path() -> str:
+        """获取本地mermaid.min.js文件路径"""
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(script_dir, 'mermaid.min.js')
+
+    @staticmethod
+    def validate_core_js_path() -> str:
+        """获取验证规则脚本路径（浏览器页面与 Node 验证进程共用）"""
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(script_dir, 'mermaid_validate_core.js')
+
+    @classmethod
+    def assets(cls) -> Dict[str, Tuple[bytes, str]]:
+        """获取虚拟源下的资源表 {路径: (内容, Content-Type)}（首次调用时读取文件，之后复用）"""
+        if cls._assets is None:
+            with cls._lock:
+                if cls._assets is None:
+                    mermaid_js_path = cls.mermaid_js_path()
+                    if not os.path.exists(mermaid_js_path):
+                        raise FileNotFoundError(
+                            f"本地 mermaid.min.js 文件不存在: {mermaid_js_path}\n"
+                            "请确保 utils/mermaid.min.js 文件存在"
+                        )
+                    with open(mermaid_js_path, 'rb') as f:
+                        mermaid_js = f.read()
+                    with open(cls.validate_core_js_path(), 'rb') as f:
+                        validate_core_js = f.read()
+                    page_html = cls._shell_html().encode('utf-8')
+                    cls._assets = {
+                        '/index.html': (page_html, 'text/html; charset=utf-8'),
+                        '/mermaid.min.js': (mermaid_js, 'application/javascript; charset=utf-8'),
+                        '/mermaid_validate_core.js': (validate_core_js, 'application/javascript; charset=utf-8'),
+                    }
+        return cls._assets
+
+    @classmethod
+    def page_html(cls) -> str:
+        """获取页面骨架HTML（只引用虚拟源上的脚本，同时确保本地资源可用）"""
+        return cls.assets()['/index.html'][0].decode('utf-8')
+
+    @staticmethod
+    def _shell_html() -> str:
+        """按 RENDER_SANDBOX_CONFIG 生成页面骨架（不含脚本内容，不读取文件）"""
+        font_family = RENDER_SANDBOX_CONFIG.get("font_family", "arial, sans-serif")
+        security_level = RENDER_SANDBOX_CONFIG.get("security_level", "antiscript")
+        return (
+            _PAGE_TEMPLATE
+            .replace('__ORIGIN__', MermaidAssets.ORIGIN)
+            .replace('__SECURITY_LEVEL__', json.dumps(security_level))
+            .replace('__FONT_FAMILY_CSS__', font_family)
+            .replace('__FONT_FAMILY__', json.dumps(font_family))
+        )
+
+    @classmethod
+    def _route_response(cls, url: str) -> Optional[Dict]:
+        """根据请求URL生成 route.fulfill 的参数；虚拟源上的未知路径返回404，其他来源返回None"""
+        if not url.startswith(cls.ORIGIN + '/'):
+            return None
+        path = urlsplit(url).path
+        asset = cls.assets().get(path)
+        if asset is None:
+            return {'status': 404, 'body': b''}
+        # 路由返回的响应不进入浏览器的HTTP缓存，每个新页面都会重新解析脚本，因此不设置缓存头
+        body, content_type = asset
+        return {'status': 200, 'body': body, 'content_type': content_type}
+
+    @classmethod
+    def _should_block(cls, url: str) -> bool:
+        """虚拟源以外的请求是否中止（data: 等内联资源不经过路由）"""
+        if not RENDER_SANDBOX_CONFIG.get("block_network", True):
+            return False
+        cls._blocked_requests += 1
+        logger.debug("已中止渲染页面的外部请求: %s", url)
+        return True
+
+    @classmethod
+    def _fulfill_route(cls, route):
+        url = route.request.url
+        response = cls._route_response(url)
+        if response is not None:
+            route.fulfill(**response)
+        elif cls._should_block(url):
+            route.abort('blockedbyclient')
+        else:
+            route.continue_()
+
+    @classmethod
+    async def _fulfill_route_async(cls, route):
+        url = route.request.url
+        response = cls._route_response(url)
+        if response is not None:
+            await route.fulfill(**response)
+        elif cls._should_block(url):
+            await route.abort('blockedbyclient')
+        else:
+            await route.continue_()
+
+    @classmethod
+    def prepare_page(cls, page):
+        """把新页面预热为已加载并初始化mermaid的页面
+
+        页面从虚拟源打开，mermaid.min.js 以 <script src> 加载并由路由直接返回内存中的内容，
+        不再把约3MB的脚本内联进 set_content 的HTML中。其他请求（外部图片、字体、样式等）
+        在路由中中止，页面的 CSP 也只允许虚拟源和 data: 资源，渲染不会因DNS或网络超时卡住。
+        页面应通过 CONTEXT_OPTIONS 创建。
+        """
+        page.route(cls.ROUTE_PATTERN, cls._fulfill_route)
+        page.goto(cls.PAGE_URL)
+        page.wait_for_function(cls.READY_JS)
+
+    @classmethod
+    def reset_page(cls, page):
+        """重置预热页面（清空DOM、恢复默认mermaid配置），供下次复用"""
+        page.evaluate(cls.RESET_JS)
+
+    @classmethod
+    async def prepare_page_async(cls, page):
+        """prepare_page 的异步版本（playwright.async_api 页面）"""
+        await page.route(cls.ROUTE_PATTERN, cls._fulfill_route_async)
+        await page.goto(cls.PAGE_URL)
+        await page.wait_for_function(cls.READY_JS)
+
+    @classmethod
+    async def reset_page_async(cls, page):
+        """reset_page 的异步版本（playwright.async_api 页面）"""
+        await page.evaluate(cls.RESET_JS)
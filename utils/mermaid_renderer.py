@@ -1,16 +1,40 @@
 """Mermaid代码渲染器 - 将Mermaid代码渲染为PNG（重构版）"""
+import io
 import os
-from typing import Optional, Tuple, Dict, List
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Tuple, Dict, List, Iterable, Iterator
 from utils.browser_manager import BrowserManager
 from utils.checkers.checker_chain import SyntaxCheckerChain
 from utils.error_factory import ErrorInfoFactory
 from utils.mermaid_js_validator import MermaidJSValidator
+from utils.node_mermaid_validator import NodeMermaidValidator
+from utils.mermaid_assets import MermaidAssets
+from utils.render_cache import RenderCache
+from utils.render_metrics import PhaseTimer
+from utils.render_worker_pool import RenderWorkerPool
+from utils.tiled_screenshot import TiledScreenshot
+from utils.validation_memo import ValidationMemo
+from config import EXPORT_CONFIG, VALIDATOR_CONFIG, RENDER_WORKER_POOL_CONFIG, PROGRESSIVE_RENDER_CONFIG, BROWSER_POOL_CONFIG
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError
 
 
 class MermaidRenderer:
     """Mermaid渲染器 - 使用Playwright渲染Mermaid为PNG（外观模式）"""
     
+    # 单个图表在页面内渲染的最长时间（毫秒）
+    RENDER_TIMEOUT_MS = 30000
+    # 截图时图表四周保留的空白（CSS像素）
+    SCREENSHOT_PADDING = 20
+    # 基础语法检查规则的版本号，修改检查器或合并逻辑时递增，使旧的验证缓存失效
+    VALIDATION_REVISION = 1
+    
+    # 渐进式渲染中后台完整渲染共用的线程池（所有实例共享，首次使用时创建）
+    _background_executor: Optional[ThreadPoolExecutor] = None
+    _background_lock = threading.Lock()
+    
     def __init__(self, generation_agent=None):
         """初始化Mermaid渲染器
         
@@ -19,20 +43,49 @@ class MermaidRenderer:
         """
         self.browser_manager = BrowserManager()
         self.syntax_checker_chain = SyntaxCheckerChain()
-        self.mermaid_js_validator = MermaidJSValidator()
+        self.mermaid_js_validator = self._create_js_validator()
         self.error_factory = ErrorInfoFactory()
+        self.render_cache = RenderCache()
+        self.validation_memo = ValidationMemo()
+        # 开启进程池时渲染转发到工作进程（工作进程内部的渲染器直接使用本进程的浏览器）
+        self.worker_pool = (
+            RenderWorkerPool()
+            if RENDER_WORKER_POOL_CONFIG.get("enabled") and not RenderWorkerPool.is_worker_process()
+            else None
+        )
+        # 最近一次操作的分阶段耗时（按线程保存，并发渲染时互不覆盖）
+        self._timings_local = threading.local()
         # generation_agent 已废弃，不再使用
         self.generation_agent = generation_agent
     
-    def render_to_png(self, mermaid_code: str, output_path: str, width: int = 1920, height: int = 1080, validate: bool = True) -> str:
-        """将Mermaid代码渲染为PNG文件
+    @property
+    def last_timings(self) -> Optional[Dict]:
+        """当前线程最近一次渲染/验证的分阶段耗时记录（见 PhaseTimer.finish）"""
+        return getattr(self._timings_local, 'record', None)
+    
+    @contextmanager
+    def _timed(self, operation: str) -> Iterator[PhaseTimer]:
+        """为一次操作计时，结束（包括抛出异常）时发送记录并保存为 last_timings"""
+        timer = PhaseTimer(operation)
+        try:
+            yield timer
+        except BaseException:
+            self._timings_local.record = timer.finish(ok=False)
+            raise
+        self._timings_local.record = timer.finish(ok=True)
+    
+    def render_to_png(self, mermaid_code: str, output_path: str, width: int = 1920, height: int = 1080, validate: bool = True, theme: str = 'default', timeout: Optional[float] = None, scale: Optional[float] = None) -> str:
+        """将Mermaid代码渲染为PNG文件（截图只裁剪图表所在区域）
         
         Args:
             mermaid_code: Mermaid代码字符串
             output_path: 输出PNG文件路径
-            width: 图片宽度（像素）
-            height: 图片高度（像素）
+            width: 视口宽度（像素），决定按容器宽度布局的图表（如甘特图）的宽度
+            height: 视口高度（像素）
             validate: 是否在渲染前验证语法（默认True）
+            theme: Mermaid主题
+            timeout: 页面内渲染和截图的超时时间（秒），默认使用 RENDER_TIMEOUT_MS
+            scale: 设备缩放比例，默认使用 EXPORT_CONFIG["png"]["scale"]
         
         Returns:
             输出文件路径
@@ -40,66 +93,412 @@ class MermaidRenderer:
         Raises:
             ValueError: 如果语法检查失败
         """
-        # 规范化Mermaid代码
-        normalized_code = self._normalize_code(mermaid_code)
+        if self.worker_pool is not None:
+            return self.worker_pool.call(
+                'render_to_png', mermaid_code, output_path, width=width, height=height,
+                validate=validate, theme=theme, timeout=timeout, scale=scale
+            )
         
-        # 语法检查（如果启用）
-        if validate:
-            is_valid, error_message = self.validate_syntax(normalized_code)
-            if not is_valid:
-                raise ValueError(f"Mermaid语法错误: {error_message}")
+        with self._timed('render_png') as timer:
+            # 规范化Mermaid代码
+            normalized_code = self._normalize_code(mermaid_code)
+            
+            # 确保输出目录存在
+            os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else ".", exist_ok=True)
+            
+            # 命中渲染缓存时直接复制已有PNG，完全跳过浏览器（包括语法验证）：
+            # 只有渲染成功的代码才会写入缓存，命中即说明代码有效
+            scale = self._png_scale(scale)
+            cache_key = self.render_cache.make_key(normalized_code, width, height, theme, scale)
+            with timer.phase('cache_lookup'):
+                cached = self.render_cache.fetch_to(cache_key, output_path)
+            timer.tags['cached'] = cached
+            if cached:
+                return output_path
+            
+            # 语法检查（如果启用）
+            if validate:
+                with timer.phase('validate'):
+                    is_valid, error_message = self.validate_syntax(normalized_code)
+                if not is_valid:
+                    raise ValueError(f"Mermaid语法错误: {error_message}")
+            
+            # 确保本地 mermaid.js 可用（进程内只读取一次）
+            MermaidAssets.page_html()
+            
+            # 渲染为PNG（租用已加载mermaid.js的预热页面，只传入图表代码）
+            try:
+                lease_start = time.perf_counter()
+                with self.browser_manager.lease() as lease:
+                    timer.add_since('lease', lease_start)
+                    png_bytes = lease.run_page(
+                        self._render_in_page, normalized_code, width, height, theme, self._timeout_ms(timeout), timer,
+                        output_path, device_scale_factor=scale, timer=timer, timeout=self._task_timeout(timeout)
+                    )
+                
+                # 文件在浏览器线程之外写入，浏览器可以更早处理下一个任务（分块截图时已直接写入文件）
+                if png_bytes is not None:
+                    with timer.phase('file_write'):
+                        self._write_png(png_bytes, output_path)
+                with timer.phase('cache_store'):
+                    self.render_cache.put_file(cache_key, output_path)
+                return output_path
+            except TimeoutError:
+                raise
+            except ImportError:
+                raise ImportError(
+                    "Playwright未安装。请运行以下命令安装：\n"
+                    "pip install playwright\n"
+                    "playwright install chromium"
+                )
+            except (PlaywrightError, PlaywrightTimeoutError) as e:
+                raise RuntimeError("渲染PNG失败") from e
+            except OSError as e:
+                raise RuntimeError("输出文件写入失败") from e
+            except Exception as e:
+                raise RuntimeError("渲染过程中发生意外错误") from e
+    
+    def _render_in_page(self, page, mermaid_code: str, width: int, height: int, theme: str = 'default',
+                        timeout_ms: Optional[int] = None, timer: Optional[PhaseTimer] = None,
+                        output_path: Optional[str] = None) -> Optional[bytes]:
+        """在预热页面中渲染图表并截图，返回PNG字节（页面由浏览器池负责重置和复用）
+
+        超大图表分块截图时直接写入 output_path 并返回None，见 _screenshot_diagram。
+        """
+        timeout_ms = timeout_ms or self.RENDER_TIMEOUT_MS
+        render_start = time.perf_counter()
+        page.set_viewport_size({"width": width, "height": height})
         
-        # 确保输出目录存在
-        os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else ".", exist_ok=True)
+        # 等待 mermaid.render 的 Promise：SVG 写入 DOM 或得到错误后立即返回
+        result = page.evaluate(MermaidAssets.RENDER_JS, [mermaid_code, {"timeout": timeout_ms, "theme": theme}])
+        if timer is not None:
+            timer.add_since('render', render_start)
+            timer.add_page_marks(result.get('timings'))
+        if not result.get('ok'):
+            error_details = (result.get('error') or '').strip() or '未知错误'
+            console_errors = [e for e in result.get('consoleErrors') or [] if e and e.strip() != error_details]
+            if console_errors:
+                error_details += f"\n控制台错误: {', '.join(console_errors)}"
+            raise ValueError(f"Mermaid渲染错误: {error_details}")
         
-        # 创建HTML页面
-        html_content = self._create_html_page(normalized_code)
+        # 截图为PNG
+        screenshot_start = time.perf_counter()
+        png_bytes = self._screenshot_diagram(page, timeout_ms, output_path)
+        if timer is not None:
+            timer.add_since('screenshot', screenshot_start)
+        return png_bytes
+    
+    def _screenshot_diagram(self, page, timeout_ms: int, output_path: Optional[str] = None) -> Optional[bytes]:
+        """按SVG的边界框裁剪截图，返回PNG字节
         
-        # 渲染为PNG
-        try:
-            browser = self.browser_manager.get_browser()
+        超过 TILED_RENDER_CONFIG["threshold_px"] 的图表分块截图后拼接：传入 output_path 时
+        边截图边写入文件并返回None（内存占用与图表高度无关），否则在内存中拼接后返回字节。
+        """
+        clip = page.evaluate(MermaidAssets.MEASURE_JS, self.SCREENSHOT_PADDING)
+        if not clip or clip['width'] <= 0 or clip['height'] <= 0:
+            return page.screenshot(full_page=True, timeout=timeout_ms)
+        
+        tiler = TiledScreenshot()
+        scale = page.evaluate("() => window.devicePixelRatio")
+        if not tiler.needs_tiling(clip, scale):
+            return page.screenshot(clip=clip, full_page=True, timeout=timeout_ms)
+        if output_path:
+            with open(output_path, 'wb') as f:
+                tiler.capture(page, clip, scale, f, timeout_ms)
+            return None
+        buffer = io.BytesIO()
+        tiler.capture(page, clip, scale, buffer, timeout_ms)
+        return buffer.getvalue()
+    
+    def _write_png(self, png_bytes: bytes, output_path: str):
+        """把PNG字节写入文件"""
+        with open(output_path, 'wb') as f:
+            f.write(png_bytes)
+    
+    def _png_scale(self, scale: Optional[float]) -> float:
+        """获取PNG截图的设备缩放比例"""
+        return float(scale or EXPORT_CONFIG.get("png", {}).get("scale", 1.0))
+    
+    def render_to_svg(self, mermaid_code: str, output_path: Optional[str] = None, validate: bool = False, theme: str = 'default', timeout: Optional[float] = None) -> str:
+        """将Mermaid代码渲染为SVG字符串（不截图、不做栅格化）
+        
+        Args:
+            mermaid_code: Mermaid代码字符串
+            output_path: 输出SVG文件路径（为None时不写文件）
+            validate: 是否在渲染前验证语法（默认False）
+            theme: Mermaid主题
+            timeout: 页面内渲染的超时时间（秒）
+        
+        Returns:
+            mermaid.render 生成的SVG字符串
+            
+        Raises:
+            ValueError: 如果语法检查失败或Mermaid渲染出错
+        """
+        if self.worker_pool is not None:
+            return self.worker_pool.call(
+                'render_to_svg', mermaid_code, output_path, validate=validate, theme=theme, timeout=timeout
+            )
+        
+        with self._timed('render_svg') as timer:
+            normalized_code = self._normalize_code(mermaid_code)
+            
+            if validate:
+                with timer.phase('validate'):
+                    is_valid, error_message = self.validate_syntax(normalized_code)
+                if not is_valid:
+                    raise ValueError(f"Mermaid语法错误: {error_message}")
+            
+            MermaidAssets.page_html()
+            
             try:
-                page = browser.new_page(viewport={"width": width, "height": height})
-                page.set_content(html_content)
-                page.wait_for_timeout(3000)
-                
-                # 检查是否有错误信息
-                error_div = page.query_selector('#mermaid-error')
-                if error_div:
-                    error_text = error_div.inner_text()
-                    if error_text and error_text.strip():
-                        raise ValueError(f"Mermaid渲染错误: {error_text.strip()}")
-                
-                # 等待Mermaid图表元素出现
-                try:
-                    page.wait_for_selector('.mermaid svg', timeout=5000)
-                except PlaywrightTimeoutError as e:
-                    error_div = page.query_selector('#mermaid-error')
-                    if error_div:
-                        error_text = error_div.inner_text()
-                        if error_text and error_text.strip():
-                            try:
-                                console_errors = page.evaluate("() => window.consoleErrors || []")
-                                error_details = error_text.strip()
-                                if console_errors:
-                                    error_details += f"\n控制台错误: {', '.join(console_errors)}"
-                                raise ValueError(f"Mermaid渲染错误: {error_details}") from e
-                            except PlaywrightError:
-                                raise ValueError(f"Mermaid渲染错误: {error_text.strip()}")
-                    try:
-                        console_errors = page.evaluate("() => window.consoleErrors || []")
-                        if console_errors:
-                            raise ValueError(f"Mermaid渲染错误: {', '.join(console_errors)}") from e
-                    except PlaywrightError as pe:
-                        raise ValueError("Mermaid渲染超时且无法获取错误详情") from e
-                
-                # 截图保存为PNG
-                page.screenshot(path=output_path, full_page=True)
-                page.close()
-            finally:
-                browser.close()
+                lease_start = time.perf_counter()
+                with self.browser_manager.lease() as lease:
+                    timer.add_since('lease', lease_start)
+                    svg = lease.run_page(
+                        self._render_svg_in_page, normalized_code, theme, self._timeout_ms(timeout), timer, timer=timer,
+                        timeout=self._task_timeout(timeout)
+                    )
+            except (ValueError, TimeoutError):
+                raise
+            except ImportError:
+                raise ImportError(
+                    "Playwright未安装。请运行以下命令安装：\n"
+                    "pip install playwright\n"
+                    "playwright install chromium"
+                )
+            except (PlaywrightError, PlaywrightTimeoutError) as e:
+                raise RuntimeError("渲染SVG失败") from e
+            except Exception as e:
+                raise RuntimeError("渲染过程中发生意外错误") from e
             
-            return output_path
+            if output_path:
+                with timer.phase('file_write'):
+                    self.write_svg(svg, output_path)
+            return svg
+    
+    def write_svg(self, svg: str, output_path: str) -> str:
+        """把SVG字符串写入文件"""
+        os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else ".", exist_ok=True)
+        try:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(svg)
+        except OSError as e:
+            raise RuntimeError("输出文件写入失败") from e
+        return output_path
+    
+    def _render_svg_in_page(self, page, mermaid_code: str, theme: str, timeout_ms: int,
+                            timer: Optional[PhaseTimer] = None) -> str:
+        """在预热页面中只执行 mermaid.render 并返回SVG"""
+        render_start = time.perf_counter()
+        result = page.evaluate(MermaidAssets.RENDER_JS, [mermaid_code, {"timeout": timeout_ms, "theme": theme}])
+        if timer is not None:
+            timer.add_since('render', render_start)
+            timer.add_page_marks(result.get('timings'))
+        if not result.get('ok'):
+            raise ValueError(f"Mermaid渲染错误: {(result.get('error') or '').strip() or '未知错误'}")
+        return result.get('svg') or ''
+    
+    def render_many(self, jobs: Iterable[Dict], concurrency: Optional[int] = None, timeout: Optional[float] = None) -> Iterator[Dict]:
+        """并发批量渲染，按完成顺序逐个返回结果
+        
+        每个工作线程从浏览器池租用各自的浏览器，因此实际并发数不超过
+        BROWSER_POOL_CONFIG["max_size"]（开启渲染进程池时为工作进程数）。单个任务失败不会中断整个批次。
+        
+        Args:
+            jobs: 渲染任务列表，每项为字典：
+                - mermaid_code: Mermaid代码（必填）
+                - output_path: 输出PNG路径（必填）
+                - width / height / theme / validate / scale: 同 render_to_png
+                - timeout: 该任务的渲染超时时间（秒），覆盖参数 timeout；浏览器任务在调用方一侧按
+                  该值限时（见 BrowserWorker.call），超时的任务以失败结果返回，不会阻塞整个批次
+                - id: 任务标识（可选，原样返回）
+            concurrency: 并发数，默认等于浏览器池大小（或渲染进程数）
+            timeout: 默认的单任务超时时间（秒）
+        
+        Yields:
+            结果字典：{'id', 'job', 'ok', 'timed_out', 'output_path', 'error', 'elapsed', 'timings'}
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return
+        
+        pool_size = self.worker_pool.size if self.worker_pool is not None else self.browser_manager.max_size
+        concurrency = max(1, min(concurrency or pool_size, pool_size, len(jobs)))
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="mermaid-render")
+        try:
+            futures = [executor.submit(self._run_render_job, job, timeout) for job in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # 调用方提前停止迭代时取消尚未开始的任务
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _run_render_job(self, job: Dict, default_timeout: Optional[float]) -> Dict:
+        """执行单个批量渲染任务，捕获所有异常以隔离失败"""
+        start = time.monotonic()
+        self._timings_local.record = None
+        result = {
+            'id': job.get('id'),
+            'job': job,
+            'ok': False,
+            'timed_out': False,
+            'output_path': job.get('output_path'),
+            'error': None,
+            'elapsed': 0.0,
+        }
+        try:
+            self.render_to_png(
+                job['mermaid_code'],
+                job['output_path'],
+                width=job.get('width', 1920),
+                height=job.get('height', 1080),
+                validate=job.get('validate', False),
+                theme=job.get('theme', 'default'),
+                timeout=job.get('timeout', default_timeout),
+                scale=job.get('scale')
+            )
+            result['ok'] = True
+        except TimeoutError as e:
+            # 卡住的浏览器已被结束，该任务记为失败，批次中的其他任务继续
+            result['timed_out'] = True
+            result['error'] = f"渲染超时: {e}"
+        except Exception as e:
+            cause = e.__cause__
+            result['error'] = f"{e}: {cause}" if cause else str(e)
+        result['elapsed'] = time.monotonic() - start
+        result['timings'] = self.last_timings
+        return result
+    
+    def _timeout_ms(self, timeout: Optional[float]) -> int:
+        """把秒级超时转换为毫秒，未指定时使用默认值"""
+        return int(timeout * 1000) if timeout else self.RENDER_TIMEOUT_MS
+    
+    def _task_timeout(self, timeout: Optional[float]) -> float:
+        """浏览器任务在调用方一侧的等待上限（秒）：渲染和截图各自受 timeout 限制，再留出启动浏览器、准备页面的余量"""
+        return self._timeout_ms(timeout) / 1000 * 2 + BROWSER_POOL_CONFIG.get("task_timeout_slack", 15)
+    
+    def render_with_diagnostics(self, mermaid_code: str, output_path: Optional[str] = None, width: int = 1920, height: int = 1080, theme: str = 'default', scale: Optional[float] = None, timeout: Optional[float] = None) -> Dict:
+        """在同一个页面中完成语法验证和渲染（一次浏览器往返）
+        
+        Args:
+            mermaid_code: Mermaid代码字符串
+            output_path: 输出PNG文件路径（为None时只返回PNG字节，不写文件）
+            width: 视口宽度（像素）
+            height: 视口高度（像素）
+            theme: Mermaid主题
+            scale: 设备缩放比例，默认使用 EXPORT_CONFIG["png"]["scale"]
+            timeout: 页面内渲染和截图的超时时间（秒），默认使用 RENDER_TIMEOUT_MS
+        
+        Returns:
+            诊断结果字典：
+                - is_valid: 语法是否有效
+                - error_info: 与 validate_syntax_with_details 相同格式的错误/成功信息
+                - diagram_type: 图表类型
+                - svg: 渲染得到的SVG字符串（语法错误或渲染失败时为None）
+                - png_bytes: PNG图片字节（同上；超大图表分块截图并直接写入 output_path 时为None）
+                - png_file: 写入的PNG文件路径（未写入时为None）
+                - render_error: 语法正确但渲染失败时的错误消息
+                - timings: 各阶段耗时记录（见 PhaseTimer.finish）
+        """
+        if self.worker_pool is not None:
+            return self.worker_pool.call(
+                'render_with_diagnostics', mermaid_code, output_path, width=width, height=height,
+                theme=theme, scale=scale, timeout=timeout
+            )
+        
+        with self._timed('render_diagnostics') as timer:
+            result = self._render_with_diagnostics(mermaid_code, output_path, width, height, theme, scale, timeout, timer)
+        result['timings'] = self.last_timings
+        return result
+    
+    def render_progressive(self, mermaid_code: str, output_path: str, width: int = 1920, height: int = 1080, theme: str = 'default', scale: Optional[float] = None, preview_scale: Optional[float] = None, timeout: Optional[float] = None) -> Dict:
+        """两阶段渲染：先以低缩放比例生成预览图并完成语法诊断，再在后台渲染完整分辨率PNG
+        
+        布局与完整图相同，只是截图像素更少，大图表可以更快地先展示出来。
+        
+        Args:
+            mermaid_code: Mermaid代码字符串
+            output_path: 完整分辨率PNG的输出路径（预览图写入同目录下的 *.preview.png）
+            width / height / theme: 同 render_with_diagnostics
+            scale: 完整分辨率PNG的设备缩放比例，默认使用 EXPORT_CONFIG["png"]["scale"]
+            preview_scale: 预览图的设备缩放比例，默认使用 PROGRESSIVE_RENDER_CONFIG["preview_scale"]
+            timeout: 预览和完整渲染各自的页面内渲染和截图超时时间（秒），默认使用 RENDER_TIMEOUT_MS
+        
+        Returns:
+            render_with_diagnostics 的结果（png_file、png_bytes 为预览图），另含：
+                - preview_file: 预览PNG路径（未生成时为None）
+                - full_render: 后台完整渲染的 Future，结果为 output_path；语法错误或预览渲染失败时为None
+        """
+        preview_scale = preview_scale or PROGRESSIVE_RENDER_CONFIG.get("preview_scale", 0.5)
+        root, ext = os.path.splitext(output_path)
+        result = self.render_with_diagnostics(
+            mermaid_code, f"{root}.preview{ext or '.png'}", width, height, theme, scale=preview_scale, timeout=timeout
+        )
+        result['preview_file'] = result.get('png_file')
+        result['full_render'] = None
+        if result['is_valid'] and result['preview_file']:
+            # 语法已在预览阶段验证过，完整渲染不再重复验证
+            result['full_render'] = self._background().submit(
+                self.render_to_png, mermaid_code, output_path,
+                width=width, height=height, validate=False, theme=theme, timeout=timeout, scale=scale
+            )
+        return result
+    
+    @classmethod
+    def _background(cls) -> ThreadPoolExecutor:
+        """获取后台渲染线程池"""
+        if cls._background_executor is None:
+            with cls._background_lock:
+                if cls._background_executor is None:
+                    cls._background_executor = ThreadPoolExecutor(
+                        max_workers=max(1, PROGRESSIVE_RENDER_CONFIG.get("workers", 2)),
+                        thread_name_prefix="mermaid-full-render"
+                    )
+        return cls._background_executor
+    
+    def _render_with_diagnostics(self, mermaid_code: str, output_path: Optional[str], width: int, height: int,
+                                 theme: str, scale: Optional[float], timeout: Optional[float], timer: PhaseTimer) -> Dict:
+        """render_with_diagnostics 的实现"""
+        if not mermaid_code or not mermaid_code.strip():
+            error_info = self.error_factory.create_error_info(
+                message="Mermaid代码为空",
+                source="基础语法检查"
+            )
+            return self._diagnostics_result(False, error_info)
+        
+        normalized_code = self._normalize_code(mermaid_code)
+        
+        # 已知语法错误的代码无需再开浏览器（验证在渲染页面内执行，按浏览器验证后端区分缓存）
+        memo_key = self.validation_memo.make_key(normalized_code, self.validator_version(MermaidJSValidator.BACKEND))
+        with timer.phase('memo_lookup'):
+            memoized = self.validation_memo.get(memo_key)
+        if memoized is not None and not memoized[0]:
+            return self._diagnostics_result(False, memoized[1])
+        
+        # 基础语法检查在Python侧完成，无需浏览器
+        with timer.phase('basic_check'):
+            basic_error = self.syntax_checker_chain.check_all(normalized_code)
+        
+        if output_path:
+            os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else ".", exist_ok=True)
+        MermaidAssets.page_html()
+        scale = self._png_scale(scale)
+        
+        try:
+            lease_start = time.perf_counter()
+            with self.browser_manager.lease() as lease:
+                timer.add_since('lease', lease_start)
+                page_result = lease.run_page(
+                    self._validate_and_render_in_page,
+                    normalized_code, width, height, theme, not basic_error, timer, output_path, self._timeout_ms(timeout),
+                    device_scale_factor=scale, timer=timer, timeout=self._task_timeout(timeout)
+                )
+            if output_path and page_result['png_bytes'] is not None:
+                with timer.phase('file_write'):
+                    self._write_png(page_result['png_bytes'], output_path)
+        except TimeoutError:
+            raise
         except ImportError:
             raise ImportError(
                 "Playwright未安装。请运行以下命令安装：\n"
@@ -112,6 +511,71 @@ class MermaidRenderer:
             raise RuntimeError("输出文件写入失败") from e
         except Exception as e:
             raise RuntimeError("渲染过程中发生意外错误") from e
+        
+        mermaid_js_result = self.mermaid_js_validator.build_result(normalized_code, page_result['validation'])
+        is_valid, error_info = self._merge_validation_results(normalized_code, basic_error, mermaid_js_result)
+        if mermaid_js_result is not None:
+            self.validation_memo.put(memo_key, is_valid, error_info)
+        if not is_valid:
+            return self._diagnostics_result(False, error_info)
+        
+        render_result = page_result['render'] or {}
+        if not render_result.get('ok'):
+            return self._diagnostics_result(True, error_info, render_error=render_result.get('error') or '未知错误')
+        
+        # 写入渲染缓存，之后相同代码的 render_to_png（如"重新渲染"）可直接命中
+        if output_path:
+            with timer.phase('cache_store'):
+                self.render_cache.put_file(self.render_cache.make_key(normalized_code, width, height, theme, scale), output_path)
+        
+        return self._diagnostics_result(
+            True,
+            error_info,
+            svg=render_result.get('svg'),
+            png_bytes=page_result['png_bytes'],
+            png_file=output_path
+        )
+    
+    def _validate_and_render_in_page(self, page, mermaid_code: str, width: int, height: int, theme: str, render: bool,
+                                     timer: Optional[PhaseTimer] = None, output_path: Optional[str] = None,
+                                     timeout_ms: Optional[int] = None) -> Dict:
+        """在预热页面中先执行 mermaid.parse 验证，通过后直接渲染并截图（超大图表分块截图时直接写入 output_path）"""
+        timeout_ms = timeout_ms or self.RENDER_TIMEOUT_MS
+        parse_start = time.perf_counter()
+        validation = page.evaluate(MermaidAssets.VALIDATE_JS, mermaid_code)
+        if timer is not None:
+            timer.add_since('parse', parse_start)
+            timer.add_page_marks((validation or {}).get('timings'))
+        if not render or not validation or not validation.get('isValid'):
+            return {'validation': validation, 'render': None, 'png_bytes': None}
+        
+        render_start = time.perf_counter()
+        page.set_viewport_size({"width": width, "height": height})
+        render_result = page.evaluate(MermaidAssets.RENDER_JS, [mermaid_code, {"timeout": timeout_ms, "theme": theme}])
+        if timer is not None:
+            timer.add_since('render', render_start)
+            timer.add_page_marks(render_result.get('timings'))
+        png_bytes = None
+        if render_result.get('ok'):
+            screenshot_start = time.perf_counter()
+            png_bytes = self._screenshot_diagram(page, timeout_ms, output_path)
+            if timer is not None:
+                timer.add_since('screenshot', screenshot_start)
+        return {'validation': validation, 'render': render_result, 'png_bytes': png_bytes}
+    
+    def _diagnostics_result(self, is_valid: bool, error_info: Dict, svg: Optional[str] = None,
+                            png_bytes: Optional[bytes] = None, png_file: Optional[str] = None,
+                            render_error: Optional[str] = None) -> Dict:
+        """构建 render_with_diagnostics 的返回结果"""
+        return {
+            'is_valid': is_valid,
+            'error_info': error_info,
+            'diagram_type': error_info.get('diagram_type'),
+            'svg': svg,
+            'png_bytes': png_bytes,
+            'png_file': png_file,
+            'render_error': render_error,
+        }
     
     def validate_syntax(self, mermaid_code: str) -> Tuple[bool, Optional[str]]:
         """验证Mermaid代码语法
@@ -150,15 +614,56 @@ class MermaidRenderer:
             )
             return False, error_info
         
-        # 规范化代码格式
-        normalized_code = mermaid_code.strip()
-        
-        # 第一步：基础语法检查（使用责任链模式）
-        basic_error = self.syntax_checker_chain.check_all(normalized_code)
-        
-        # 第二步：使用 mermaid.js 进行语法验证
-        mermaid_js_result = self.mermaid_js_validator.validate(normalized_code)
-        
+        with self._timed('validate_syntax') as timer:
+            # 规范化代码格式
+            normalized_code = mermaid_code.strip()
+            
+            # 相同代码已验证过时直接返回缓存结果
+            memo_key = self.validation_memo.make_key(normalized_code, self.validator_version())
+            with timer.phase('memo_lookup'):
+                memoized = self.validation_memo.get(memo_key)
+            timer.tags['cached'] = memoized is not None
+            if memoized is not None:
+                return memoized
+            
+            # 第一步：基础语法检查（使用责任链模式）
+            with timer.phase('basic_check'):
+                basic_error = self.syntax_checker_chain.check_all(normalized_code)
+            
+            # 第二步：使用 mermaid.js 进行语法验证（各阶段耗时记入同一个计时器）
+            mermaid_js_result = self.mermaid_js_validator.validate(normalized_code, timer=timer)
+            
+            is_valid, error_info = self._merge_validation_results(normalized_code, basic_error, mermaid_js_result)
+            # mermaid.js 验证未能执行（浏览器异常等）时结果不完整，不缓存
+            if mermaid_js_result is not None:
+                self.validation_memo.put(memo_key, is_valid, error_info)
+            return is_valid, error_info
+    
+    @staticmethod
+    def _create_js_validator() -> MermaidJSValidator:
+        """根据 VALIDATOR_CONFIG 选择 mermaid.js 验证后端"""
+        if VALIDATOR_CONFIG.get("backend") == "node":
+            return NodeMermaidValidator()
+        return MermaidJSValidator()
+    
+    def validator_version(self, backend: Optional[str] = None) -> str:
+        """获取验证器版本号（mermaid.js资源版本 + 基础检查规则版本 + 验证后端）
+
+        Args:
+            backend: 实际执行验证的后端，默认为 VALIDATOR_CONFIG 选择的后端；
+                在渲染页面内验证的路径应传入 MermaidJSValidator.BACKEND
+        """
+        return f"{MermaidAssets.version()}-v{self.VALIDATION_REVISION}-{backend or self.mermaid_js_validator.BACKEND}"
+    
+    def cache_stats(self) -> Dict:
+        """获取渲染缓存和验证结果缓存的命中统计"""
+        return {
+            'render_cache': self.render_cache.stats(),
+            'validation_memo': self.validation_memo.stats(),
+        }
+    
+    def _merge_validation_results(self, normalized_code: str, basic_error: Optional[Dict], mermaid_js_result: Optional[Dict]) -> Tuple[bool, Dict]:
+        """合并基础语法检查与 mermaid.js 验证结果"""
         # 收集所有错误
         all_errors = []
         if basic_error:
@@ -178,8 +683,8 @@ class MermaidRenderer:
                 if mermaid_js_result.get('source') == 'mermaid.js 验证异常':
                     # mermaid.js 验证过程出现异常，添加警告但不阻塞
                     all_errors.append(mermaid_js_result)
-                elif not mermaid_js_result.get('isValid', True):
-                    # 正常的语法错误
+                elif mermaid_js_result.get('source') == 'mermaid.js 验证' or not mermaid_js_result.get('isValid', True):
+                    # 正常的语法错误（ErrorInfoFactory 构建的错误信息不含 isValid 字段，按来源判断）
                     all_errors.append(mermaid_js_result)
         
         # 合并所有错误或返回成功
@@ -230,123 +735,3 @@ class MermaidRenderer:
             snippets.append('\n'.join(snippet_lines))
         
         return '\n\n'.join(snippets)
-    
-    def _create_html_page(self, mermaid_code: str) -> str:
-        """创建包含Mermaid的HTML页面"""
-        # 获取本地 mermaid.js 文件路径并读取内容
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        mermaid_js_path = os.path.join(script_dir, 'mermaid.min.js')
-        
-        if not os.path.exists(mermaid_js_path):
-            raise FileNotFoundError(
-                f"本地 mermaid.min.js 文件不存在: {mermaid_js_path}\n"
-                "请确保 utils/mermaid.min.js 文件存在"
-            )
-        
-        with open(mermaid_js_path, 'r', encoding='utf-8') as f:
-            mermaid_js_content = f.read()
-        
-        # 转义HTML特殊字符
-        safe_code = mermaid_code.replace('</pre>', '&lt;/pre&gt;').replace('</script>', '&lt;/script&gt;')
-        escaped_js = mermaid_js_content.replace('</script>', '<\\/script>')
-        
-        return f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <script>
-        {escaped_js}
-    </script>
-    <style>
-        body {{
-            margin: 0;
-            padding: 20px;
-            background: white;
-            font-family: Arial, sans-serif;
-        }}
-        .mermaid {{
-            background: white;
-        }}
-        #mermaid-error {{
-            color: red;
-            display: none;
-            white-space: pre-wrap;
-            padding: 10px;
-            background: #ffebee;
-            border: 1px solid #d32f2f;
-            border-radius: 4px;
-            margin-top: 10px;
-        }}
-    </style>
-</head>
-<body>
-    <pre class="mermaid" id="mermaid-diagram">{safe_code}</pre>
-    <div id="mermaid-error"></div>
-    <script>
-        // 错误处理函数
-        function handleMermaidError(error) {{
-            const errorDiv = document.getElementById('mermaid-error');
-            if (errorDiv) {{
-                let errorMessage = '';
-                if (error && error.message) {{
-                    errorMessage = error.message;
-                }} else if (typeof error === 'string') {{
-                    errorMessage = error;
-                }} else {{
-                    errorMessage = 'Unknown error occurred while parsing Mermaid diagram';
-                }}
-                errorDiv.textContent = errorMessage;
-                errorDiv.style.display = 'block';
-                // 抛出错误以便外部捕获
-                throw new Error(errorMessage);
-            }}
-        }}
-        
-        // 捕获全局JavaScript错误
-        window.addEventListener('error', function(event) {{
-            if (event.message && event.message.includes('mermaid')) {{
-                handleMermaidError(event.message);
-            }}
-        }});
-        
-        // 捕获未处理的Promise拒绝
-        window.addEventListener('unhandledrejection', function(event) {{
-            if (event.reason && (event.reason.message || event.reason.toString()).includes('mermaid')) {{
-                handleMermaidError(event.reason);
-            }}
-        }});
-        
-        // 存储控制台错误
-        window.consoleErrors = [];
-        window.originalConsoleError = console.error;
-        console.error = function(...args) {{
-            window.consoleErrors.push(args.join(' '));
-            window.originalConsoleError.apply(console, args);
-        }};
-        
-        try {{
-            mermaid.initialize({{
-                startOnLoad: true,
-                theme: 'default',
-                securityLevel: 'loose',
-                // 设置错误回调
-                errorCallback: function(error, hash) {{
-                    const errorMsg = error?.message || error?.toString() || String(error);
-                    window.consoleErrors.push(errorMsg);
-                    handleMermaidError(error);
-                }}
-            }});
-        }} catch (e) {{
-            const errorMsg = e.message || e.toString();
-            window.consoleErrors.push(errorMsg);
-            handleMermaidError(errorMsg);
-        }}
-    </script>
-</body>
-</html>"""
-    
-    def __del__(self):
-        """清理资源"""
-        if hasattr(self, 'browser_manager'):
-            self.browser_manager.cleanup()
-
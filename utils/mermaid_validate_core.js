@@ -0,0 +1,189 @@
+/**
+ * Mermaid语法验证规则
+ * 浏览器页面（mermaid_assets.py）和 Node 验证进程（mermaid_validator.js）共用，
+ * 保证两种验证后端给出相同的结论。
+ */
+
+/**
+ * 创建验证函数
+ * @param {object} mermaid - 已加载的 mermaid 对象
+ * @returns {function(string): Promise<{isValid: boolean, error: (string|null), diagramType: (string|null)}>}
+ */
+function createMermaidValidator(mermaid) {
+    return async function validate(code) {
+        try {
+            // 检查参数是否有效
+            if (!code || typeof code !== 'string') {
+                return {
+                    isValid: false,
+                    error: 'Mermaid代码参数无效',
+                    diagramType: null
+                };
+            }
+
+            // 检测图表类型
+            const codeTrimmed = code.trim();
+            if (!codeTrimmed) {
+                return {
+                    isValid: false,
+                    error: 'Mermaid代码为空',
+                    diagramType: null
+                };
+            }
+
+            const firstLine = codeTrimmed.split('\n')[0].trim();
+            let diagramType = null;
+
+            // 定义有效的图表类型关键字（精确匹配，不区分大小写）
+            const validDiagramTypes = [
+                'flowchart', 'graph', 'sequenceDiagram', 'classDiagram',
+                'stateDiagram-v2', 'stateDiagram', 'erDiagram', 'journey',
+                'gantt', 'pie', 'gitgraph', 'quadrantChart'
+            ];
+
+            // 先提取第一个单词（去除可能的空格和方向指示符）
+            const firstWord = firstLine.split(/\s+/)[0].toLowerCase();
+
+            // 检查是否是有效的图表类型（精确匹配，防止 flowcharts, subgraphs 等错误）
+            let matchedType = null;
+            for (const validType of validDiagramTypes) {
+                if (firstWord === validType.toLowerCase()) {
+                    matchedType = validType;
+                    break;
+                }
+            }
+
+            // 如果没有精确匹配，检查是否是常见的拼写错误
+            if (!matchedType) {
+                if (firstWord.startsWith('flowchart') && firstWord !== 'flowchart') {
+                    return {
+                        isValid: false,
+                        error: `图表类型拼写错误：'${firstLine.split(/\s+/)[0]}' 应该是 'flowchart' 或 'graph'`,
+                        diagramType: null
+                    };
+                }
+                if (firstWord.includes('subgraph') && !firstWord.startsWith('subgraph') || firstWord === 'subgraphs') {
+                    return {
+                        isValid: false,
+                        error: `语法错误：'subgraph' 拼写错误，请检查代码中的 'subgraphs' 是否为 'subgraph'`,
+                        diagramType: null
+                    };
+                }
+                // 如果第一个单词完全不匹配任何有效类型，报告错误
+                return {
+                    isValid: false,
+                    error: `无效的图表类型：'${firstLine.split(/\s+/)[0]}'，有效的类型包括：flowchart, graph, sequenceDiagram, classDiagram, stateDiagram, erDiagram, journey, gantt, pie, gitgraph, quadrantChart`,
+                    diagramType: null
+                };
+            }
+
+            // 设置图表类型
+            const diagramTypeMap = {
+                'flowchart': 'flowchart',
+                'graph': 'flowchart',
+                'sequencediagram': 'sequenceDiagram',
+                'classdiagram': 'classDiagram',
+                'statediagram-v2': 'stateDiagram-v2',
+                'statediagram': 'stateDiagram',
+                'erdiagram': 'erDiagram',
+                'journey': 'journey',
+                'gantt': 'gantt',
+                'pie': 'pie',
+                'gitgraph': 'gitgraph',
+                'quadrantchart': 'quadrantChart'
+            };
+            diagramType = diagramTypeMap[firstWord] || matchedType;
+
+            // 定义所有Mermaid关键字及其常见的错误拼写（精确匹配检查）
+            const keywordPatterns = [
+                // 图表类型关键字（复数形式错误）
+                { wrong: /\bflowcharts\b/i, correct: 'flowchart', description: '图表类型关键字' },
+                { wrong: /\bgraphs\b/i, correct: 'graph', description: '图表类型关键字' },
+                { wrong: /\bsequenceDiagrams\b/i, correct: 'sequenceDiagram', description: '图表类型关键字' },
+                { wrong: /\bclassDiagrams\b/i, correct: 'classDiagram', description: '图表类型关键字' },
+                { wrong: /\bstateDiagrams\b/i, correct: 'stateDiagram', description: '图表类型关键字' },
+                { wrong: /\berDiagrams\b/i, correct: 'erDiagram', description: '图表类型关键字' },
+                { wrong: /\bjourneys\b/i, correct: 'journey', description: '图表类型关键字' },
+                { wrong: /\bgantts\b/i, correct: 'gantt', description: '图表类型关键字' },
+                { wrong: /\bquadrantCharts\b/i, correct: 'quadrantChart', description: '图表类型关键字' },
+                { wrong: /\bgitgraphs\b/i, correct: 'gitgraph', description: '图表类型关键字' },
+
+                // 流程图关键字
+                { wrong: /\bsubgraphs\b/i, correct: 'subgraph', description: '流程图关键字' },
+
+                // 时序图关键字
+                { wrong: /\bparticipants\b/i, correct: 'participant', description: '时序图关键字' },
+                { wrong: /\bactivates\b/i, correct: 'activate', description: '时序图关键字' },
+                { wrong: /\bdeactivates\b/i, correct: 'deactivate', description: '时序图关键字' },
+
+                // 用户旅程图关键字
+                { wrong: /\bsections\b/i, correct: 'section', description: '用户旅程图关键字' },
+
+                // 类图关键字
+                { wrong: /\bclasses\b/i, correct: 'class', description: '类图关键字（如果出现在类定义行）' },
+            ];
+
+            // 检查代码中是否有任何关键字拼写错误（对所有行进行全局检查）
+            const lines = codeTrimmed.split('\n');
+            for (let i = 0; i < lines.length; i++) {
+                const line = lines[i].trim();
+
+                // 跳过注释行
+                if (line.startsWith('//') || line.startsWith('%%')) {
+                    continue;
+                }
+
+                for (const pattern of keywordPatterns) {
+                    if (pattern.wrong.test(line)) {
+                        const match = line.match(pattern.wrong);
+                        const wrongKeyword = match ? match[0] : '';
+
+                        return {
+                            isValid: false,
+                            error: `第${i + 1}行语法错误：'${wrongKeyword}' 应该是 '${pattern.correct}'（${pattern.description}）`,
+                            diagramType: diagramType
+                        };
+                    }
+                }
+            }
+
+            // 使用 mermaid.parse 进行语法验证（mermaid 10 起 parse 返回 Promise，必须 await）
+            if (typeof mermaid !== 'undefined' && typeof mermaid.parse === 'function') {
+                // 记录 mermaid.parse 的耗时（毫秒），浏览器和 Node 16+ 都提供 performance.now()
+                const parseStart = performance.now();
+                try {
+                    await mermaid.parse(codeTrimmed);
+                    return {
+                        isValid: true,
+                        error: null,
+                        diagramType: diagramType,
+                        timings: { parse: performance.now() - parseStart }
+                    };
+                } catch (parseError) {
+                    return {
+                        isValid: false,
+                        error: parseError.message || String(parseError),
+                        diagramType: diagramType,
+                        timings: { parse: performance.now() - parseStart }
+                    };
+                }
+            } else {
+                return {
+                    isValid: false,
+                    error: 'Mermaid API不可用',
+                    diagramType: null
+                };
+            }
+        } catch (error) {
+            return {
+                isValid: false,
+                error: error.message || String(error),
+                diagramType: null
+            };
+        }
+    };
+}
+
+if (typeof module !== 'undefined' && module.exports) {
+    module.exports = createMermaidValidator;
+}
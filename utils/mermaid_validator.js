@@ -1,169 +1,184 @@
 #!/usr/bin/env node
 /**
  * Mermaid语法验证器
- * 直接使用 Mermaid.js 的解析器进行语法验证
- * 基于 mermaid-linter.js 的实现方式
+ * 直接使用 Mermaid.js 的解析器进行语法验证，验证规则与浏览器页面共用 mermaid_validate_core.js
+ *
+ * 两种运行方式：
+ * 1. 一次性模式：node mermaid_validator.js '<JSON编码的代码>'，输出一行 JSON 后退出
+ * 2. 常驻模式（无参数）：从 stdin 逐行读取 {"id": ..., "code": "..."}，
+ *    每个请求输出一行 {"id": ..., "isValid": ..., "error": ..., "diagramType": ...}，
+ *    mermaid 只加载一次，进程由 node_mermaid_validator.py 管理
  */
 
-// 从命令行参数获取 Mermaid 代码（通过 JSON 编码传递）
-let mermaidCode = '';
-
-try {
-  // 尝试从命令行参数获取（JSON 编码的字符串）
-  const arg = process.argv[2];
-  if (arg) {
-    // 尝试解析 JSON（如果是以引号开头和结尾的字符串）
-    try {
-      mermaidCode = JSON.parse(arg);
-    } catch (e) {
-      // 解析失败，直接使用原始参数
-      mermaidCode = arg;
+const fs = require('fs');
+const path = require('path');
+const readline = require('readline');
+const createMermaidValidator = require('./mermaid_validate_core.js');
+
+// 与浏览器页面加载同一个 mermaid.min.js，两种验证后端使用相同版本的解析器
+const MERMAID_JS_PATH = path.join(__dirname, 'mermaid.min.js');
+const NODE_GLOBALS = ['structuredClone', 'TextEncoder', 'TextDecoder'];
+// mermaid 构建产物中的版本常量（mermaid 对象本身不暴露版本号）
+const VERSION_PATTERN = /const [\w$]+="(\d+\.\d+\.\d+)",[\w$]+=Object\.freeze\(/;
+
+/**
+ * 在 jsdom 提供的 DOM 中加载并初始化 mermaid
+ *
+ * mermaid 10 在加载时就需要 document（直接 require 会抛出 "document is not defined"，
+ * npm 包的 ESM 入口也无法 require），因此在 jsdom 窗口内执行 mermaid.min.js，
+ * 其内置的 DOMPurify 随之绑定到该窗口。
+ *
+ * @returns {{mermaid: (object|null), version: (string|null), error: (string|null)}}
+ */
+function loadMermaid() {
+  let JSDOM;
+  try {
+    JSDOM = require('jsdom').JSDOM;
+  } catch (e) {
+    return { mermaid: null, version: null, error: '未找到 jsdom（Node 中加载 mermaid 需要 DOM），请在项目根目录运行: npm install' };
+  }
+
+  let source;
+  try {
+    source = fs.readFileSync(MERMAID_JS_PATH, 'utf8');
+  } catch (e) {
+    return { mermaid: null, version: null, error: `无法读取 ${MERMAID_JS_PATH}: ${e.message}` };
+  }
+  const versionMatch = source.match(VERSION_PATTERN);
+
+  let mermaid;
+  try {
+    const dom = new JSDOM('<!DOCTYPE html><html><body></body></html>', {
+      runScripts: 'outside-only',
+      pretendToBeVisual: true
+    });
+    // jsdom 窗口缺少部分 Node 已有的全局函数（mermaid 加载时会用到 structuredClone）
+    for (const name of NODE_GLOBALS) {
+      if (dom.window[name] === undefined && globalThis[name] !== undefined) {
+        dom.window[name] = globalThis[name];
+      }
     }
+    dom.window.eval(source);
+    mermaid = dom.window.mermaid;
+  } catch (e) {
+    return { mermaid: null, version: null, error: `加载 mermaid.min.js 失败: ${e.message}` };
+  }
+  if (!mermaid || typeof mermaid.parse !== 'function') {
+    return { mermaid: null, version: null, error: 'mermaid.min.js 加载后未提供 mermaid.parse' };
   }
-} catch (e) {
-  // 忽略错误，继续使用空字符串
+
+  mermaid.initialize({
+    startOnLoad: false,
+    securityLevel: 'strict'
+  });
+  return { mermaid: mermaid, version: versionMatch ? versionMatch[1] : null, error: null };
 }
 
-if (!mermaidCode || !mermaidCode.trim()) {
-  const errorResult = {
+function mermaidMissing(error) {
+  return {
     isValid: false,
-    error: '未提供Mermaid代码',
+    error: `Mermaid库加载失败: ${error}`,
     diagramType: null
   };
-  console.log(JSON.stringify(errorResult));
-  process.exit(1);
 }
 
-try {
-  // 导入 mermaid 库
-  let mermaid;
+/**
+ * 从命令行参数获取 Mermaid 代码（通过 JSON 编码传递）
+ */
+function parseArgCode(arg) {
   try {
-    // 尝试使用 require (CommonJS)
-    mermaid = require('mermaid');
+    const parsed = JSON.parse(arg);
+    return typeof parsed === 'string' ? parsed : arg;
   } catch (e) {
-    // 如果 require 失败，说明 mermaid 未安装
-    const errorResult = {
+    // 解析失败，直接使用原始参数
+    return arg;
+  }
+}
+
+/**
+ * 一次性模式：验证命令行参数中的代码并退出
+ */
+async function runOnce(arg) {
+  const mermaidCode = parseArgCode(arg);
+  if (!mermaidCode || !mermaidCode.trim()) {
+    console.log(JSON.stringify({
       isValid: false,
-      error: 'Mermaid库未找到。请运行: npm install mermaid',
+      error: '未提供Mermaid代码',
       diagramType: null
-    };
-    console.log(JSON.stringify(errorResult));
+    }));
     process.exit(1);
   }
-  
-  // 初始化 Mermaid
-  if (mermaid && typeof mermaid.initialize === 'function') {
-    mermaid.initialize({ 
-      startOnLoad: false,
-      securityLevel: 'strict'
-    });
+
+  const loaded = loadMermaid();
+  if (!loaded.mermaid) {
+    console.log(JSON.stringify(mermaidMissing(loaded.error)));
+    process.exit(1);
   }
-  
-  // 验证代码
-  const result = validateMermaidCode(mermaidCode.trim(), mermaid);
-  
-  // 输出 JSON 格式的结果
+
+  const validate = createMermaidValidator(loaded.mermaid);
+  const result = await validate(mermaidCode.trim());
   console.log(JSON.stringify(result));
-  
-  // 根据结果设置退出码
   process.exit(result.isValid ? 0 : 1);
-  
-} catch (error) {
-  // 错误处理
-  const errorResult = {
-    isValid: false,
-    error: error.message || String(error),
-    diagramType: null
-  };
-  
-  console.log(JSON.stringify(errorResult));
-  process.exit(1);
 }
 
 /**
- * 验证 Mermaid 代码
- * 直接使用 Mermaid.js 的 parse 方法
+ * 常驻模式：按行处理 JSON 请求，按到达顺序逐个验证并输出结果
  */
-function validateMermaidCode(code, mermaid) {
-  if (!code || !code.trim()) {
-    return {
-      isValid: false,
-      error: 'Mermaid代码为空',
-      diagramType: null
-    };
-  }
-  
-  // 检测图表类型
-  const firstLine = code.trim().split('\n')[0].trim();
-  let diagramType = null;
-  
-  const diagramTypeMap = {
-    'flowchart': 'flowchart',
-    'graph': 'flowchart',
-    'sequenceDiagram': 'sequenceDiagram',
-    'classDiagram': 'classDiagram',
-    'stateDiagram-v2': 'stateDiagram-v2',
-    'stateDiagram': 'stateDiagram',
-    'erDiagram': 'erDiagram',
-    'journey': 'journey',
-    'gantt': 'gantt',
-    'pie': 'pie',
-    'gitgraph': 'gitgraph',
-    'quadrantChart': 'quadrantChart'
-  };
-  
-  for (const [key, value] of Object.entries(diagramTypeMap)) {
-    if (firstLine.toLowerCase().startsWith(key.toLowerCase())) {
-      diagramType = value;
-      break;
+function runDaemon() {
+  const loaded = loadMermaid();
+  const validate = loaded.mermaid ? createMermaidValidator(loaded.mermaid) : null;
+  const rl = readline.createInterface({ input: process.stdin, terminal: false });
+
+  // 串行处理，保证 mermaid 内部的全局状态不被并发解析打乱
+  let chain = Promise.resolve();
+
+  rl.on('line', (line) => {
+    if (!line.trim()) {
+      return;
     }
-  }
-  
-  if (!mermaid) {
-    return {
-      isValid: false,
-      error: 'Mermaid库未找到',
-      diagramType: diagramType
-    };
-  }
-  
-  try {
-    // 使用 Mermaid.js 的 parse 方法进行验证
-    // parse 方法会同步解析代码，如果语法错误会抛出异常
-    if (mermaid.mermaidAPI && typeof mermaid.mermaidAPI.parse === 'function') {
+    chain = chain.then(async () => {
+      let id = null;
+      let result;
       try {
-        // 调用 parse 方法，如果成功则没有语法错误
-        mermaid.mermaidAPI.parse(code);
-        return {
-          isValid: true,
-          error: null,
-          diagramType: diagramType
-        };
-      } catch (parseError) {
-        // 捕获解析错误
-        const errorMessage = parseError.message || String(parseError);
-        return {
+        const request = JSON.parse(line);
+        id = request.id === undefined ? null : request.id;
+        if (!validate) {
+          result = mermaidMissing(loaded.error);
+        } else {
+          result = await validate(request.code);
+        }
+      } catch (error) {
+        result = {
           isValid: false,
-          error: errorMessage,
-          diagramType: diagramType
+          error: error.message || String(error),
+          diagramType: null
         };
       }
-    } else {
-      // 如果没有 parse 方法，尝试其他方式
-      // 某些版本的 mermaid 可能 API 不同
-      return {
-        isValid: false,
-        error: 'Mermaid API不可用，请确保使用正确版本的mermaid库（>=10.0.0）',
-        diagramType: diagramType
-      };
-    }
-    
-  } catch (error) {
-    return {
-      isValid: false,
-      error: error.message || String(error),
-      diagramType: diagramType
-    };
-  }
+      process.stdout.write(JSON.stringify(Object.assign({ id: id }, result)) + '\n');
+    });
+  });
+
+  rl.on('close', () => {
+    chain.then(() => process.exit(0));
+  });
+
+  // 通知父进程已就绪，附带 mermaid 版本（由父进程与浏览器页面使用的版本比对）或加载失败的原因
+  process.stdout.write(JSON.stringify({
+    id: null,
+    ready: true,
+    mermaid: Boolean(loaded.mermaid),
+    version: loaded.version,
+    error: loaded.error
+  }) + '\n');
 }
 
+// 验证规则内部的异常已转换为结果；这里兜底，防止个别异常让常驻进程退出
+process.on('unhandledRejection', (error) => {
+  process.stderr.write(`unhandledRejection: ${error && error.stack ? error.stack : error}\n`);
+});
+
+if (process.argv.length > 2) {
+  runOnce(process.argv[2]);
+} else {
+  runDaemon();
+}
@@ -0,0 +1,335 @@
+"""Node.js验证器 - 单例模式 + 对象池模式，常驻Node进程按JSON行协议验证"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from config import VALIDATOR_CONFIG
+from utils.mermaid_assets import MermaidAssets
+from utils.mermaid_js_validator import MermaidJSValidator
+from utils.render_metrics import PhaseTimer
+
+logger = logging.getLogger(__name__)
+
+
+class NodeValidatorProcess:
+    """单个常驻的 node mermaid_validator.js 进程
+
+    请求逐行写入stdin，结果由读取线程逐行从stdout取出放入队列；
+    每个请求带自增id，超时后迟到的结果会按id丢弃。
+    """
+
+    def __init__(self, node_path: str, script_path: str, startup_timeout: float):
+        self._ids = itertools.count(1)
+        self._responses: "queue.Queue" = queue.Queue()
+        self.process = subprocess.Popen(
+            [node_path, script_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(script_path)),  # 项目根目录，便于解析 node_modules
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+        self._reader = threading.Thread(target=self._read_stdout, name="node-validator-reader", daemon=True)
+        self._reader.start()
+
+        ready = self._next_message(startup_timeout)
+        if not ready.get('ready'):
+            self.close()
+            raise RuntimeError(f"Node验证进程启动异常: {ready}")
+        self.mermaid_available = bool(ready.get('mermaid'))
+        self.mermaid_version = ready.get('version')
+        self.load_error = ready.get('error')
+
+    def is_alive(self) -> bool:
+        """进程是否仍在运行"""
+        return self.process.poll() is None
+
+    def request(self, code: str, timeout: float) -> Dict:
+        """验证单条代码"""
+        return self.request_many([code], timeout)[0]
+
+    def request_many(self, codes: List[str], timeout: float) -> List[Dict]:
+        """一次写入多条请求再依次读取结果（进程内串行处理，结果按请求顺序返回）
+
+        Args:
+            codes: Mermaid代码列表
+            timeout: 每条结果的最长等待秒数
+
+        Raises:
+            TimeoutError: 等待结果超时
+            RuntimeError: 进程已退出或管道断开
+        """
+        ids = [next(self._ids) for _ in codes]
+        try:
+            for request_id, code in zip(ids, codes):
+                self.process.stdin.write(json.dumps({'id': request_id, 'code': code}, ensure_ascii=False) + '\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            raise RuntimeError("Node验证进程管道已断开") from e
+
+        results: Dict[int, Dict] = {}
+        pending = set(ids)
+        while pending:
+            message = self._next_message(timeout)
+            if message.get('id') in pending:
+                pending.discard(message['id'])
+                results[message['id']] = message
+            # 其他id是之前超时请求的迟到结果，直接丢弃
+        return [results[request_id] for request_id in ids]
+
+    def close(self):
+        """关闭进程"""
+        try:
+            self.process.stdin.close()
+        except:
+            pass
+        try:
+            self.process.terminate()
+            self.process.wait(timeout=2)
+        except:
+            try:
+                self.process.kill()
+            except:
+                pass
+
+    def _next_message(self, timeout: float) -> Dict:
+        """取出下一条输出，超时或进程退出时抛出异常"""
+        try:
+            message = self._responses.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Node验证进程在 {timeout} 秒内未返回结果") from None
+        if message is None:
+            raise RuntimeError("Node验证进程已退出")
+        return message
+
+    def _read_stdout(self):
+        """读取线程：把stdout中的每行JSON放入结果队列，EOF时放入None"""
+        try:
+            for line in self.process.stdout:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self._responses.put(json.loads(line))
+                except ValueError:
+                    logger.debug("忽略Node验证进程的非JSON输出: %s", line)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._responses.put(None)
+
+
+class NodeMermaidValidator(MermaidJSValidator):
+    """Node.js验证器 - 用常驻Node进程代替浏览器页面执行 mermaid.parse
+
+    验证规则与浏览器页面共用 mermaid_validate_core.js，返回格式与 MermaidJSValidator 相同，
+    可以通过 VALIDATOR_CONFIG["backend"] = "node" 直接替换。进程崩溃或超时后会被丢弃，
+    下次使用时自动重新启动；node 或 jsdom（Node 中加载 mermaid.min.js 所需的DOM）不可用时与缺少 mermaid.js 一样跳过验证。
+    """
+
+    BACKEND = "node"
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        """单例模式"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化Node进程池（进程在首次验证时才启动）"""
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+
+        self.node_path = shutil.which(VALIDATOR_CONFIG.get("node_path", "node"))
+        self.pool_size = max(1, VALIDATOR_CONFIG.get("node_pool_size", 2))
+        self.timeout = VALIDATOR_CONFIG.get("node_timeout", 10)
+        self.startup_timeout = VALIDATOR_CONFIG.get("node_startup_timeout", 15)
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._idle: List[NodeValidatorProcess] = []
+        self._pool_lock = threading.Lock()
+        self._mermaid_missing = False
+        self._restarts = 0
+        self._initialized = True
+        atexit.register(self.cleanup)
+
+    @property
+    def script_path(self) -> str:
+        """获取Node验证脚本路径"""
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mermaid_validator.js')
+
+    @property
+    def available(self) -> bool:
+        """node 可执行文件、验证脚本和 mermaid 是否都可用（mermaid 加载失败后不再尝试）"""
+        return bool(self.node_path) and os.path.exists(self.script_path) and not self._mermaid_missing
+
+    def validate(self, mermaid_code: str, timer: Optional[PhaseTimer] = None) -> Optional[Dict]:
+        """验证Mermaid代码
+
+        Args:
+            mermaid_code: Mermaid代码
+            timer: 调用方的计时器，传入时各阶段耗时记入其中；否则单独生成一条 validate 记录
+
+        Returns:
+            与 MermaidJSValidator.validate 相同；Node不可用或验证异常时返回None
+        """
+        if not self.available:
+            return None
+
+        own_timer = timer is None
+        timer = timer or PhaseTimer('validate')
+        result = None
+        try:
+            request_start = time.perf_counter()
+            result = self._run(lambda proc: proc.request(mermaid_code, self.timeout))
+            timer.add_since('parse', request_start)
+        except Exception as e:
+            logger.warning("Node验证失败: %s", e)
+            return None
+        finally:
+            if result is not None:
+                timer.add_page_marks(result.get('timings'))
+            if own_timer:
+                timer.finish(ok=result is not None, backend=self.BACKEND)
+        if result is None:
+            return None
+        return self.build_result(mermaid_code, result)
+
+    def validate_many(self, codes: List[str], chunk_size: Optional[int] = None) -> List[Dict]:
+        """批量验证Mermaid代码，分块后由池中的多个Node进程并行处理
+
+        Args:
+            codes: Mermaid代码列表
+            chunk_size: 每块条数
+
+        Returns:
+            与 codes 顺序一致的结果列表，每项为 {'isValid': bool, 'diagramType': str, 'error': str}
+        """
+        if not codes:
+            return []
+
+        if not self.available:
+            return [self._batch_item(False, 'Node验证器不可用，无法验证') for _ in codes]
+
+        chunk_size = max(1, chunk_size or self.BATCH_CHUNK_SIZE)
+        chunks = [
+            [code.strip() if code else '' for code in codes[start:start + chunk_size]]
+            for start in range(0, len(codes), chunk_size)
+        ]
+
+        def validate_chunk(chunk: List[str]) -> List[Dict]:
+            try:
+                raw_results = self._run(lambda proc: proc.request_many(chunk, self.timeout))
+            except Exception as e:
+                # 单个分块失败（如进程崩溃）不影响其余分块
+                logger.warning("批量验证分块失败: %s", e)
+                return [self._batch_item(False, f"验证过程异常: {e}") for _ in chunk]
+            if raw_results is None:
+                return [self._batch_item(False, 'Node验证器不可用，无法验证') for _ in chunk]
+            return [self._batch_item(bool(r.get('isValid')), r.get('error'), r.get('diagramType')) for r in raw_results]
+
+        results: List[Dict] = []
+        with ThreadPoolExecutor(max_workers=min(self.pool_size, len(chunks)), thread_name_prefix="node-validate") as executor:
+            for chunk_results in executor.map(validate_chunk, chunks):
+                results.extend(chunk_results)
+        return results
+
+    def stats(self) -> Dict:
+        """获取进程池状态"""
+        with self._pool_lock:
+            return {
+                'pool_size': self.pool_size,
+                'idle': len(self._idle),
+                'restarts': self._restarts,
+                'available': self.available,
+            }
+
+    def cleanup(self):
+        """关闭所有空闲的Node进程"""
+        with self._pool_lock:
+            processes = list(self._idle)
+            self._idle.clear()
+        for proc in processes:
+            proc.close()
+
+    def _run(self, fn):
+        """从池中取一个进程执行 fn(proc)
+
+        进程在请求中途退出时换一个新进程重试一次；超时的进程会被关闭（可能卡在某条代码上），
+        不重试。mermaid 无法加载时返回None。
+        """
+        for attempt in range(2):
+            proc = self._acquire()
+            if proc is None:
+                return None
+            healthy = False
+            try:
+                result = fn(proc)
+                healthy = True
+                return result
+            except RuntimeError:
+                if attempt == 1:
+                    raise
+                logger.warning("Node验证进程异常退出，重新启动后重试")
+            finally:
+                self._release(proc, healthy)
+
+    def _acquire(self) -> Optional[NodeValidatorProcess]:
+        """取一个空闲进程，没有时启动新进程（总数不超过 pool_size）"""
+        self._slots.acquire()
+        try:
+            with self._pool_lock:
+                while self._idle:
+                    proc = self._idle.pop()
+                    if proc.is_alive():
+                        return proc
+                    proc.close()
+                    self._restarts += 1
+
+            proc = NodeValidatorProcess(self.node_path, self.script_path, self.startup_timeout)
+            problem = self._startup_problem(proc)
+            if problem:
+                proc.close()
+                self._mermaid_missing = True
+                logger.warning("Node验证器已停用（语法验证只剩基础检查）: %s", problem)
+                self._slots.release()
+                return None
+            return proc
+        except BaseException:
+            self._slots.release()
+            raise
+
+    @staticmethod
+    def _startup_problem(proc: NodeValidatorProcess) -> Optional[str]:
+        """检查新进程加载的mermaid：加载失败或版本与浏览器页面不一致时返回原因"""
+        if not proc.mermaid_available:
+            return proc.load_error or "mermaid加载失败"
+        if proc.mermaid_version != MermaidAssets.MERMAID_VERSION:
+            return f"mermaid版本 {proc.mermaid_version} 与浏览器页面使用的 {MermaidAssets.MERMAID_VERSION} 不一致"
+        return None
+
+    def _release(self, proc: NodeValidatorProcess, healthy: bool):
+        """归还进程；不健康的进程直接关闭，下次取用时重新启动"""
+        if healthy and proc.is_alive():
+            with self._pool_lock:
+                self._idle.append(proc)
+        else:
+            proc.close()
+            with self._pool_lock:
+                self._restarts += 1
+        self._slots.release()
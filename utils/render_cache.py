@@ -0,0 +1,210 @@
+"""渲染结果缓存 - 单例模式，内容寻址 + LRU淘汰"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import RENDER_CACHE_CONFIG
+from utils.mermaid_assets import MermaidAssets
+
+
+class RenderCache:
+    """渲染结果缓存 - 以规范化代码和渲染参数的哈希为键，PNG存放在磁盘上
+
+    内存中维护一个按最近使用排序的索引，磁盘上每个条目对应一个 <key>.png 文件。
+    进程重启后按文件修改时间重建索引，命中时会更新修改时间以保持LRU顺序。
+    渲染进程池的多个进程共用同一个缓存目录：索引未命中时再检查磁盘；写入时只更新本进程的索引，
+    每隔 rescan_interval 秒才按目录内容重建一次，把其他进程写入和淘汰的条目计入数量和容量限制。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        """单例模式"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化渲染缓存"""
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+
+        self.enabled = RENDER_CACHE_CONFIG.get("enabled", True)
+        self.cache_dir = RENDER_CACHE_CONFIG.get("dir", os.path.join("output", ".render_cache"))
+        self.max_entries = RENDER_CACHE_CONFIG.get("max_entries", 500)
+        self.max_bytes = RENDER_CACHE_CONFIG.get("max_bytes", 200 * 1024 * 1024)
+        self.rescan_interval = RENDER_CACHE_CONFIG.get("rescan_interval", 60)
+        self._last_rescan = 0.0
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> 文件大小
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._index_lock = threading.Lock()
+        self._load_index()
+        self._initialized = True
+
+    @staticmethod
+    def make_key(normalized_code: str, width: int, height: int, theme: str = 'default', scale: float = 1.0) -> str:
+        """根据规范化后的代码和渲染参数计算缓存键"""
+        payload = json.dumps(
+            {
+                'code': normalized_code,
+                'width': width,
+                'height': height,
+                'theme': theme,
+                'scale': scale,
+                'assets': MermaidAssets.version(),
+            },
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def fetch_to(self, key: str, output_path: str) -> bool:
+        """命中时把缓存的PNG复制到 output_path
+
+        Returns:
+            是否命中
+        """
+        blob_path = self.get(key)
+        if blob_path is None:
+            return False
+        try:
+            shutil.copyfile(blob_path, output_path)
+        except OSError:
+            # 缓存文件被外部删除，视为未命中
+            self._drop(key)
+            return False
+        return True
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，命中返回缓存文件路径，未命中返回None"""
+        if not self.enabled:
+            return None
+        blob_path = self._blob_path(key)
+        with self._index_lock:
+            if key not in self._index:
+                # 可能由其他进程写入
+                try:
+                    size = os.path.getsize(blob_path)
+                except OSError:
+                    self._misses += 1
+                    return None
+                self._index[key] = size
+                self._total_bytes += size
+            self._index.move_to_end(key)
+            self._hits += 1
+        try:
+            os.utime(blob_path)
+        except OSError:
+            pass
+        return blob_path
+
+    def put_file(self, key: str, source_path: str):
+        """把已渲染好的PNG文件存入缓存"""
+        if not self.enabled or not os.path.exists(source_path):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        blob_path = self._blob_path(key)
+        # 临时文件名需跨进程唯一（不同进程的线程id可能相同）
+        tmp_path = f"{blob_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(source_path, tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, blob_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._index_lock:
+            if time.monotonic() - self._last_rescan >= self.rescan_interval:
+                # 定期按目录内容重建索引，包含其他进程写入和删除的条目
+                self._rescan_locked()
+            else:
+                self._total_bytes += size - self._index.pop(key, 0)
+                self._index[key] = size
+            self._evict_locked()
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._index_lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """清空缓存"""
+        with self._index_lock:
+            keys = list(self._index.keys())
+            self._index.clear()
+            self._total_bytes = 0
+        for key in keys:
+            self._remove_blob(key)
+
+    def _blob_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _load_index(self):
+        """按修改时间从磁盘重建LRU索引"""
+        if not self.enabled or not os.path.isdir(self.cache_dir):
+            return
+        with self._index_lock:
+            self._rescan_locked()
+            self._evict_locked()
+
+    def _rescan_locked(self):
+        """按目录中的文件和修改时间重建LRU索引（调用方需持有锁）"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.png'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len('.png')], stat.st_size))
+        self._index.clear()
+        self._total_bytes = 0
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._last_rescan = time.monotonic()
+
+    def _evict_locked(self):
+        """淘汰最久未使用的条目直到满足数量和容量限制（调用方需持有锁）"""
+        while self._index and (len(self._index) > self.max_entries or self._total_bytes > self.max_bytes):
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self._evictions += 1
+            self._remove_blob(key)
+
+    def _drop(self, key: str):
+        """缓存文件已不存在（被其他进程淘汰或外部删除）：移出索引，这次查询改记为未命中"""
+        with self._index_lock:
+            self._total_bytes -= self._index.pop(key, 0)
+            self._hits -= 1
+            self._misses += 1
+
+    def _remove_blob(self, key: str):
+        try:
+            os.remove(self._blob_path(key))
+        except OSError:
+            pass
@@ -0,0 +1,197 @@
+"""渲染服务客户端 - 代理模式，与 MermaidRenderer 接口一致，实际渲染由 render_server 完成"""
+import base64
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import requests
+from config import RENDER_SERVER_CONFIG, PROGRESSIVE_RENDER_CONFIG
+
+
+def encode_result(result: Dict) -> Dict:
+    """把结果中的PNG字节转换为base64，便于放入JSON"""
+    encoded = dict(result)
+    if 'png_bytes' in encoded:
+        png_bytes = encoded.pop('png_bytes')
+        encoded['png_base64'] = base64.b64encode(png_bytes).decode('ascii') if png_bytes is not None else None
+    return encoded
+
+
+def decode_result(result: Dict) -> Dict:
+    """encode_result 的逆操作"""
+    decoded = dict(result)
+    if 'png_base64' in decoded:
+        png_base64 = decoded.pop('png_base64')
+        decoded['png_bytes'] = base64.b64decode(png_base64) if png_base64 is not None else None
+    return decoded
+
+
+class RenderClient:
+    """渲染服务客户端 - 可直接替换 GenerationAgent 中的 MermaidRenderer
+
+    语法错误和渲染错误与本地渲染器一样以 ValueError 抛出，服务不可用或内部错误以 RuntimeError 抛出；
+    服务繁忙（429）时按 Retry-After 等待后重试。
+    """
+
+    # 渐进式渲染中后台完整渲染共用的线程池
+    _background_executor = None
+    _background_lock = threading.Lock()
+
+    def __init__(self, base_url: Optional[str] = None, timeout: Optional[float] = None):
+        """初始化客户端
+
+        Args:
+            base_url: 服务地址，默认使用 RENDER_SERVER_CONFIG["url"]，未配置时使用本机的 host/port
+            timeout: 单次请求的超时秒数
+        """
+        if not base_url:
+            base_url = RENDER_SERVER_CONFIG.get("url") or (
+                f"http://{RENDER_SERVER_CONFIG.get('host', '127.0.0.1')}:{RENDER_SERVER_CONFIG.get('port', 8765)}"
+            )
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout or RENDER_SERVER_CONFIG.get("client_timeout", 180)
+        self.busy_retries = RENDER_SERVER_CONFIG.get("busy_retries", 3)
+        self.session = requests.Session()
+
+    def validate_syntax(self, mermaid_code: str) -> Tuple[bool, Optional[str]]:
+        """验证Mermaid语法（与 MermaidRenderer.validate_syntax 相同）"""
+        is_valid, error_info = self.validate_syntax_with_details(mermaid_code)
+        if is_valid:
+            return True, None
+        return False, error_info.get('message', '未知错误')
+
+    def validate_syntax_with_details(self, mermaid_code: str) -> Tuple[bool, Dict]:
+        """验证Mermaid语法并返回详细错误信息（与 MermaidRenderer.validate_syntax_with_details 相同）"""
+        result = self._post('/validate', {'code': mermaid_code}).json()
+        return result['is_valid'], result['error_info']
+
+    def render_to_png(self, mermaid_code: str, output_path: str, width: int = 1920, height: int = 1080, validate: bool = True, theme: str = 'default', timeout: Optional[float] = None, scale: Optional[float] = None) -> str:
+        """将Mermaid代码渲染为PNG文件（与 MermaidRenderer.render_to_png 相同）"""
+        response = self._post('/render.png', {
+            'code': mermaid_code, 'width': width, 'height': height, 'validate': validate,
+            'theme': theme, 'timeout': timeout, 'scale': scale,
+        })
+        self._write_file(response.content, output_path)
+        return output_path
+
+    def render_to_svg(self, mermaid_code: str, output_path: Optional[str] = None, validate: bool = False, theme: str = 'default', timeout: Optional[float] = None) -> str:
+        """将Mermaid代码渲染为SVG字符串（与 MermaidRenderer.render_to_svg 相同）"""
+        response = self._post('/render.svg', {
+            'code': mermaid_code, 'validate': validate, 'theme': theme, 'timeout': timeout,
+        })
+        svg = response.content.decode('utf-8')
+        if output_path:
+            self.write_svg(svg, output_path)
+        return svg
+
+    def write_svg(self, svg: str, output_path: str) -> str:
+        """把SVG字符串写入本地文件"""
+        self._write_file(svg.encode('utf-8'), output_path)
+        return output_path
+
+    def render_with_diagnostics(self, mermaid_code: str, output_path: Optional[str] = None, width: int = 1920, height: int = 1080, theme: str = 'default', scale: Optional[float] = None, timeout: Optional[float] = None) -> Dict:
+        """一次请求完成语法验证和渲染（与 MermaidRenderer.render_with_diagnostics 相同，PNG写入本地文件）"""
+        result = decode_result(self._post('/diagnostics', {
+            'code': mermaid_code, 'width': width, 'height': height, 'theme': theme, 'scale': scale, 'timeout': timeout,
+        }).json())
+        if output_path and result['png_bytes'] is not None:
+            self._write_file(result['png_bytes'], output_path)
+            result['png_file'] = output_path
+        return result
+
+    def render_progressive(self, mermaid_code: str, output_path: str, width: int = 1920, height: int = 1080, theme: str = 'default', scale: Optional[float] = None, preview_scale: Optional[float] = None, timeout: Optional[float] = None) -> Dict:
+        """两阶段渲染：先生成预览图并完成语法诊断，再在后台请求完整分辨率PNG（与 MermaidRenderer.render_progressive 相同）"""
+        preview_scale = preview_scale or PROGRESSIVE_RENDER_CONFIG.get("preview_scale", 0.5)
+        root, ext = os.path.splitext(output_path)
+        result = self.render_with_diagnostics(
+            mermaid_code, f"{root}.preview{ext or '.png'}", width, height, theme, scale=preview_scale, timeout=timeout
+        )
+        result['preview_file'] = result.get('png_file')
+        result['full_render'] = None
+        if result['is_valid'] and result['preview_file']:
+            result['full_render'] = self._background().submit(
+                self.render_to_png, mermaid_code, output_path,
+                width=width, height=height, validate=False, theme=theme, timeout=timeout, scale=scale
+            )
+        return result
+
+    def batch(self, jobs: List[Dict]) -> List[Dict]:
+        """批量请求
+
+        Args:
+            jobs: 每项为 {'id', 'op': 'validate' | 'png' | 'svg' | 'diagnostics', 'code', ...其他参数}
+
+        Returns:
+            与 jobs 顺序一致的结果列表：{'id', 'ok', 'result' | 'error'}，PNG 以 result['png_bytes'] 返回
+        """
+        results = self._post('/batch', {'jobs': jobs}).json()['results']
+        for item in results:
+            if item.get('ok'):
+                item['result'] = decode_result(item['result'])
+        return results
+
+    def health(self) -> Dict:
+        """获取服务状态"""
+        return self._get('/healthz')
+
+    def metrics(self) -> Dict:
+        """获取服务指标"""
+        return self._get('/metrics')
+
+    @classmethod
+    def _background(cls) -> ThreadPoolExecutor:
+        if cls._background_executor is None:
+            with cls._background_lock:
+                if cls._background_executor is None:
+                    cls._background_executor = ThreadPoolExecutor(
+                        max_workers=max(1, PROGRESSIVE_RENDER_CONFIG.get("workers", 2)),
+                        thread_name_prefix="render-client-full"
+                    )
+        return cls._background_executor
+
+    def _get(self, path: str) -> Dict:
+        try:
+            response = self.session.get(self.base_url + path, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise RuntimeError(f"渲染服务请求失败: {e}") from e
+        return response.json()
+
+    def _post(self, path: str, payload: Dict) -> requests.Response:
+        """发送请求，429 时等待重试，并把错误响应转换为与本地渲染器一致的异常"""
+        for attempt in range(self.busy_retries + 1):
+            try:
+                response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                raise RuntimeError(f"渲染服务请求失败: {e}") from e
+
+            if response.status_code == 429 and attempt < self.busy_retries:
+                time.sleep(self._retry_after(response, attempt))
+                continue
+            if response.ok:
+                return response
+
+            try:
+                message = response.json().get('error') or response.reason
+            except ValueError:
+                message = response.text or response.reason
+            if response.status_code in (400, 422):
+                raise ValueError(message)
+            raise RuntimeError(f"渲染服务返回 {response.status_code}: {message}")
+
+    @staticmethod
+    def _retry_after(response: requests.Response, attempt: int) -> float:
+        try:
+            return max(0.0, float(response.headers.get('Retry-After', '')))
+        except ValueError:
+            return 0.5 * (2 ** attempt)
+
+    @staticmethod
+    def _write_file(data: bytes, output_path: str):
+        os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else ".", exist_ok=True)
+        try:
+            with open(output_path, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            raise RuntimeError("输出文件写入失败") from e
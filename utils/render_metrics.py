@@ -0,0 +1,171 @@
+"""渲染性能指标 - 分阶段计时 + 观察者模式（可插拔的指标钩子）"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from config import RENDER_METRICS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class PhaseTimer:
+    """分阶段计时器 - 记录一次渲染或验证中各阶段的耗时（毫秒）
+
+    阶段按发生顺序记录，同名阶段累加。页面内用 performance.now() 测得的耗时以 "page." 前缀
+    合并进来，它们是对应 Python 阶段（如 render、parse）内部的细分，不单独计入总耗时。
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.phases: Dict[str, float] = {}
+        self.tags: Dict = {}  # 附加到记录中的字段（如 cached），可在计时过程中设置
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_since(name, start)
+
+    def add_since(self, name: str, start: float):
+        """记录从 start（time.perf_counter() 的返回值）到现在的耗时"""
+        self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, elapsed_ms: float):
+        """累加一个阶段的耗时（毫秒）"""
+        self.phases[name] = round(self.phases.get(name, 0.0) + elapsed_ms, 3)
+
+    def add_page_marks(self, marks: Optional[Dict]):
+        """合并页面返回的 performance.now() 耗时"""
+        for name, elapsed_ms in (marks or {}).items():
+            if isinstance(elapsed_ms, (int, float)):
+                self.add(f"page.{name}", elapsed_ms)
+
+    def finish(self, **fields) -> Dict:
+        """结束计时，生成记录并发送给 RenderMetrics
+
+        Args:
+            **fields: 附加到记录中的字段（如 ok、cached）
+
+        Returns:
+            {'operation', 'timestamp', 'total_ms', 'phases', ...}
+        """
+        record = {
+            'operation': self.operation,
+            'timestamp': time.time(),
+            'total_ms': round((time.perf_counter() - self._start) * 1000, 3),
+            'phases': dict(self.phases),
+        }
+        record.update(self.tags)
+        record.update(fields)
+        RenderMetrics().emit(record)
+        return record
+
+
+class RenderMetrics:
+    """渲染指标中心 - 单例模式，保存最近的计时记录（滚动日志）并通知已注册的钩子
+
+    钩子是接收一条记录字典的可调用对象，可用于写日志、上报 Prometheus/StatsD 等；
+    钩子在产生记录的线程中同步调用，抛出的异常会被记录但不影响渲染。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        """单例模式"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化指标中心"""
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+
+        self.enabled = RENDER_METRICS_CONFIG.get("enabled", True)
+        self.log_to_logger = RENDER_METRICS_CONFIG.get("log_to_logger", False)
+        self._records = deque(maxlen=RENDER_METRICS_CONFIG.get("log_size", 500))
+        self._hooks: List[Callable[[Dict], None]] = []
+        self._records_lock = threading.Lock()
+        self._initialized = True
+
+    def add_hook(self, hook: Callable[[Dict], None]):
+        """注册指标钩子"""
+        with self._records_lock:
+            if hook not in self._hooks:
+                self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[Dict], None]):
+        """移除指标钩子"""
+        with self._records_lock:
+            if hook in self._hooks:
+                self._hooks.remove(hook)
+
+    def emit(self, record: Dict):
+        """保存一条记录并通知所有钩子"""
+        if not self.enabled:
+            return
+        with self._records_lock:
+            self._records.append(record)
+            hooks = list(self._hooks)
+
+        if self.log_to_logger:
+            phases = ', '.join(f"{name}={elapsed:.1f}ms" for name, elapsed in record['phases'].items())
+            logger.info("%s %.1fms [%s]", record['operation'], record['total_ms'], phases)
+
+        for hook in hooks:
+            try:
+                hook(record)
+            except Exception:
+                logger.exception("指标钩子执行失败")
+
+    def recent(self, limit: Optional[int] = None, operation: Optional[str] = None) -> List[Dict]:
+        """获取最近的记录（从旧到新）
+
+        Args:
+            limit: 最多返回的条数
+            operation: 只返回指定操作的记录
+        """
+        with self._records_lock:
+            records = list(self._records)
+        if operation:
+            records = [r for r in records if r['operation'] == operation]
+        return records[-limit:] if limit else records
+
+    def summary(self) -> Dict:
+        """按操作汇总滚动日志中的耗时：次数、平均值、p95 和最大值（毫秒）"""
+        grouped: Dict[str, Dict[str, List[float]]] = {}
+        for record in self.recent():
+            samples = grouped.setdefault(record['operation'], {'total': []})
+            samples['total'].append(record['total_ms'])
+            for name, elapsed in record['phases'].items():
+                samples.setdefault(name, []).append(elapsed)
+
+        return {
+            operation: {name: self._describe(values) for name, values in samples.items()}
+            for operation, samples in grouped.items()
+        }
+
+    def clear(self):
+        """清空滚动日志"""
+        with self._records_lock:
+            self._records.clear()
+
+    @staticmethod
+    def _describe(values: List[float]) -> Dict:
+        ordered = sorted(values)
+        return {
+            'count': len(ordered),
+            'avg_ms': round(sum(ordered) / len(ordered), 3),
+            'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            'max_ms': ordered[-1],
+        }
@@ -0,0 +1,426 @@
+"""Mermaid渲染服务 - 外观模式 + 生产者-消费者模式，通过HTTP共享一组预热浏览器
+
+启动方式：
+    python -m utils.render_server [--host 127.0.0.1] [--port 8765]
+
+接口（请求体和响应均为JSON，图片接口直接返回图片字节）：
+    POST /validate      {"code"} -> {"is_valid", "error_info"}
+    POST /render.png    {"code", "width", "height", "theme", "scale", "timeout", "validate"} -> image/png
+    POST /render.svg    {"code", "theme", "timeout", "validate"} -> image/svg+xml
+    POST /diagnostics   {"code", "width", "height", "theme", "scale", "timeout"} -> render_with_diagnostics 的结果（PNG为base64）
+    POST /batch         {"jobs": [{"id", "op": "validate|png|svg|diagnostics", "code", ...}]} -> {"results": [...]}
+                        （每项单独进入请求队列，最多 max_batch_jobs 项）
+    GET  /healthz       服务和浏览器池状态
+    GET  /metrics       分阶段耗时汇总（RenderMetrics）、缓存命中和请求计数
+
+参数类型或取值范围错误返回 400，语法错误等渲染失败返回 422。
+请求由 ThreadingHTTPServer 的连接线程放入有界队列，固定数量的处理线程依次取出执行；
+队列已满时立即返回 429（带 Retry-After），调用方应稍后重试。
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from config import RENDER_SERVER_CONFIG
+from utils.mermaid_renderer import MermaidRenderer
+from utils.render_client import encode_result
+from utils.render_metrics import RenderMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceBusyError(Exception):
+    """请求队列已满"""
+
+
+class InvalidParamsError(ValueError):
+    """请求参数类型或取值范围错误（返回400，与渲染失败的422区分）"""
+
+
+class RenderService:
+    """渲染服务核心 - 持有 MermaidRenderer、有界请求队列和固定数量的处理线程（与HTTP无关）"""
+
+    def __init__(self, renderer: Optional[MermaidRenderer] = None, dispatchers: Optional[int] = None,
+                 queue_size: Optional[int] = None, request_timeout: Optional[float] = None):
+        self.renderer = renderer or MermaidRenderer()
+        self.dispatchers = max(1, dispatchers or RENDER_SERVER_CONFIG.get("dispatchers", 4))
+        self.request_timeout = request_timeout or RENDER_SERVER_CONFIG.get("request_timeout", 120)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size or RENDER_SERVER_CONFIG.get("queue_size", 32)))
+        self._operations: Dict[str, Callable[[Dict], Dict]] = {
+            'validate': self._validate,
+            'png': self._render_png,
+            'svg': self._render_svg,
+            'diagnostics': self._diagnostics,
+        }
+        self._counters = {'accepted': 0, 'rejected': 0, 'completed': 0, 'failed': 0, 'timed_out': 0}
+        self._counters_lock = threading.Lock()
+        self._started_at = time.time()
+        self._threads: List[threading.Thread] = []
+        for i in range(self.dispatchers):
+            thread = threading.Thread(target=self._dispatch, name=f"render-dispatcher-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, op: str, params: Dict) -> Future:
+        """把请求放入队列，返回 Future
+
+        Raises:
+            ValueError: 未知操作
+            ServiceBusyError: 队列已满
+        """
+        if op not in self._operations:
+            raise ValueError(f"未知操作: {op}")
+        future = Future()
+        try:
+            self._queue.put_nowait((op, params, future))
+        except queue.Full:
+            self._count('rejected')
+            raise ServiceBusyError("渲染服务繁忙，请稍后重试") from None
+        self._count('accepted')
+        return future
+
+    def call(self, op: str, params: Dict) -> Dict:
+        """提交请求并等待结果（op 为 batch 时见 call_batch）
+
+        Raises:
+            TimeoutError: 超过 request_timeout 仍未完成（尚未开始的请求会被取消）
+        """
+        if op == 'batch':
+            return self.call_batch(params)
+        future = self.submit(op, params)
+        try:
+            return future.result(timeout=self.request_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._count('timed_out')
+            raise TimeoutError(f"请求在 {self.request_timeout} 秒内未完成") from None
+
+    def health(self) -> Dict:
+        """服务状态"""
+        return {
+            'status': 'ok',
+            'uptime': round(time.time() - self._started_at, 1),
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self._queue.maxsize,
+            'dispatchers': self.dispatchers,
+            'browser_pool': self.renderer.browser_manager.stats(),
+            'worker_pool': self.renderer.worker_pool.stats() if self.renderer.worker_pool is not None else None,
+        }
+
+    def metrics(self) -> Dict:
+        """请求计数、缓存命中统计和分阶段耗时汇总"""
+        with self._counters_lock:
+            counters = dict(self._counters)
+        counters['queue_depth'] = self._queue.qsize()
+        return {
+            'requests': counters,
+            'caches': self.renderer.cache_stats(),
+            'timings': RenderMetrics().summary(),
+        }
+
+    def _count(self, name: str):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def _dispatch(self):
+        """处理线程：依次执行队列中的请求"""
+        while True:
+            op, params, future = self._queue.get()
+            # 调用方已超时放弃的请求不再执行
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = self._operations[op](params)
+            except BaseException as e:
+                self._count('failed')
+                future.set_exception(e)
+            else:
+                self._count('completed')
+                future.set_result(result)
+
+    def call_batch(self, params: Dict) -> Dict:
+        """批量执行：每项作为单独的请求进入同一个有界队列，每项单独捕获异常
+
+        整批要么全部入队，要么（队列容纳不下时）全部撤回并抛出 ServiceBusyError；
+        所有项共用 request_timeout，到期时尚未开始的项被取消并记为超时
+        （已在执行的项受浏览器任务超时限制，结果不再等待）。
+
+        Raises:
+            InvalidParamsError: jobs 不是列表或超过 max_batch_jobs
+            ServiceBusyError: 队列已满
+        """
+        jobs = params.get('jobs')
+        if not isinstance(jobs, list):
+            raise InvalidParamsError("jobs 必须是列表")
+        max_jobs = RENDER_SERVER_CONFIG.get("max_batch_jobs", 16)
+        if len(jobs) > max_jobs:
+            raise InvalidParamsError(f"jobs 最多 {max_jobs} 项，实际 {len(jobs)} 项")
+
+        deadline = time.monotonic() + self.request_timeout
+        items: List[Dict] = []
+        futures: List[Optional[Future]] = []
+        try:
+            for job in jobs:
+                item = {'id': job.get('id') if isinstance(job, dict) else None, 'ok': False}
+                items.append(item)
+                if not isinstance(job, dict) or job.get('op') not in self._operations:
+                    item['error'] = f"未知操作: {job.get('op')}" if isinstance(job, dict) else "任务必须是JSON对象"
+                    futures.append(None)
+                else:
+                    futures.append(self.submit(job['op'], job))
+        except ServiceBusyError:
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+            raise
+
+        for item, future in zip(items, futures):
+            if future is None:
+                continue
+            try:
+                item['result'] = encode_result(future.result(timeout=max(0.0, deadline - time.monotonic())))
+                item['ok'] = True
+            except FutureTimeoutError:
+                future.cancel()
+                self._count('timed_out')
+                item['error'] = f"请求在 {self.request_timeout} 秒内未完成"
+            except Exception as e:
+                item['error'] = _describe_error(e)
+        return {'results': items}
+
+    def _validate(self, params: Dict) -> Dict:
+        is_valid, error_info = self.renderer.validate_syntax_with_details(_require_code(params))
+        return {'is_valid': is_valid, 'error_info': error_info}
+
+    def _render_png(self, params: Dict) -> Dict:
+        # render_to_png 以文件为输出（可直接命中渲染缓存），写入临时文件后读回
+        fd, path = tempfile.mkstemp(suffix='.png', prefix='mermaid_render_')
+        os.close(fd)
+        try:
+            self.renderer.render_to_png(
+                _require_code(params), path,
+                width=_dimension_param(params, 'width', 1920),
+                height=_dimension_param(params, 'height', 1080),
+                validate=_bool_param(params, 'validate', True),
+                theme=_theme_param(params),
+                timeout=_number_param(params, 'timeout', RENDER_SERVER_CONFIG.get("max_render_timeout", 60)),
+                scale=_number_param(params, 'scale', RENDER_SERVER_CONFIG.get("max_scale", 4))
+            )
+            with open(path, 'rb') as f:
+                return {'png_bytes': f.read()}
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _render_svg(self, params: Dict) -> Dict:
+        svg = self.renderer.render_to_svg(
+            _require_code(params),
+            validate=_bool_param(params, 'validate', False),
+            theme=_theme_param(params),
+            timeout=_number_param(params, 'timeout', RENDER_SERVER_CONFIG.get("max_render_timeout", 60))
+        )
+        return {'svg': svg}
+
+    def _diagnostics(self, params: Dict) -> Dict:
+        return self.renderer.render_with_diagnostics(
+            _require_code(params),
+            width=_dimension_param(params, 'width', 1920),
+            height=_dimension_param(params, 'height', 1080),
+            theme=_theme_param(params),
+            scale=_number_param(params, 'scale', RENDER_SERVER_CONFIG.get("max_scale", 4)),
+            timeout=_number_param(params, 'timeout', RENDER_SERVER_CONFIG.get("max_render_timeout", 60))
+        )
+
+
+def _require_code(params: Dict) -> str:
+    code = params.get('code')
+    if not isinstance(code, str) or not code.strip():
+        raise InvalidParamsError("缺少 Mermaid 代码（code）")
+    return code
+
+
+def _dimension_param(params: Dict, name: str, default: int) -> int:
+    """视口宽高：正整数，不超过 max_dimension"""
+    value = params.get(name, default)
+    limit = RENDER_SERVER_CONFIG.get("max_dimension", 8192)
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 < value <= limit:
+        raise InvalidParamsError(f"{name} 必须是 1 到 {limit} 之间的整数")
+    return value
+
+
+def _number_param(params: Dict, name: str, limit: float) -> Optional[float]:
+    """可选的正数参数（timeout、scale），不超过 limit；未提供或为 null 时返回None（使用渲染器默认值）"""
+    value = params.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or not 0 < value <= limit:
+        raise InvalidParamsError(f"{name} 必须是大于 0 且不超过 {limit} 的数字")
+    return float(value)
+
+
+def _bool_param(params: Dict, name: str, default: bool) -> bool:
+    """布尔参数只接受JSON的 true/false（bool("false") 为 True）"""
+    value = params.get(name, default)
+    if not isinstance(value, bool):
+        raise InvalidParamsError(f"{name} 必须是 true 或 false")
+    return value
+
+
+def _theme_param(params: Dict) -> str:
+    theme = params.get('theme', 'default')
+    if not isinstance(theme, str) or not theme:
+        raise InvalidParamsError("theme 必须是非空字符串")
+    return theme
+
+
+def _describe_error(e: BaseException) -> str:
+    """异常消息，附带底层原因（如 Playwright 错误）"""
+    cause = e.__cause__
+    return f"{e}: {cause}" if cause else str(e)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """HTTP请求处理：解析请求、交给 RenderService，并把结果或异常转换为HTTP响应"""
+
+    server_version = "MermaidRenderServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # 路径 -> 操作名
+    POST_ROUTES = {
+        '/validate': 'validate',
+        '/render.png': 'png',
+        '/render.svg': 'svg',
+        '/diagnostics': 'diagnostics',
+        '/batch': 'batch',
+    }
+
+    @property
+    def service(self) -> RenderService:
+        return self.server.service
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/healthz':
+            self._send_json(200, self.service.health())
+        elif path == '/metrics':
+            self._send_json(200, self.service.metrics())
+        else:
+            self._send_json(404, {'error': f"未知路径: {path}"})
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        op = self.POST_ROUTES.get(path)
+        if op is None:
+            self._send_json(404, {'error': f"未知路径: {path}"})
+            return
+
+        params, error = self._read_json()
+        if error:
+            self._send_json(400, {'error': error})
+            return
+
+        try:
+            result = self.service.call(op, params)
+        except ServiceBusyError as e:
+            self._send_json(429, {'error': str(e)}, headers={'Retry-After': '1'})
+            return
+        except TimeoutError as e:
+            self._send_json(504, {'error': str(e)})
+            return
+        except InvalidParamsError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except ValueError as e:
+            # 语法错误或参数错误
+            self._send_json(422, {'error': _describe_error(e)})
+            return
+        except Exception as e:
+            logger.exception("处理 %s 失败", path)
+            self._send_json(500, {'error': _describe_error(e)})
+            return
+
+        if op == 'png':
+            self._send_bytes(200, result['png_bytes'], 'image/png')
+        elif op == 'svg':
+            self._send_bytes(200, result['svg'].encode('utf-8'), 'image/svg+xml; charset=utf-8')
+        else:
+            self._send_json(200, encode_result(result))
+
+    def _read_json(self) -> Tuple[Dict, Optional[str]]:
+        """读取JSON请求体，返回 (参数, 错误消息)"""
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            return {}, "Content-Length 无效"
+        max_body = RENDER_SERVER_CONFIG.get("max_body_bytes", 4 * 1024 * 1024)
+        if length > max_body:
+            # 请求体未读取，连接无法复用
+            self.close_connection = True
+            return {}, f"请求体超过 {max_body} 字节"
+        try:
+            params = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}, "请求体不是有效的JSON"
+        if not isinstance(params, dict):
+            return {}, "请求体必须是JSON对象"
+        return params, None
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self._send_bytes(status, body, 'application/json; charset=utf-8', headers)
+
+    def _send_bytes(self, status: int, body: bytes, content_type: str, headers: Optional[Dict] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    """渲染HTTP服务（每个连接一个线程，实际处理由 RenderService 的处理线程完成）"""
+
+    daemon_threads = True
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, service: Optional[RenderService] = None):
+        host = host or RENDER_SERVER_CONFIG.get("host", "127.0.0.1")
+        port = RENDER_SERVER_CONFIG.get("port", 8765) if port is None else port
+        super().__init__((host, port), RenderRequestHandler)
+        self.service = service or RenderService()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Mermaid渲染服务")
+    parser.add_argument('--host', default=RENDER_SERVER_CONFIG.get("host", "127.0.0.1"))
+    parser.add_argument('--port', type=int, default=RENDER_SERVER_CONFIG.get("port", 8765))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = RenderServer(args.host, args.port)
+    logger.info("渲染服务已启动: http://%s:%d", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.renderer.browser_manager.cleanup()
+
+
+if __name__ == "__main__":
+    main()
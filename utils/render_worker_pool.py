@@ -0,0 +1,334 @@
+"""渲染工作进程池 - 单例模式 + 对象池模式，每个子进程独占一个MermaidRenderer和浏览器"""
+import atexit
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import wait as wait_connections
+from typing import Dict, List, Optional
+from config import RENDER_WORKER_POOL_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# 子进程内置为True，MermaidRenderer据此不再把任务转发回进程池
+_IN_WORKER_PROCESS = False
+
+
+def _worker_main(index: int, task_queue, result_conn):
+    """工作进程入口：串行执行任务队列中的 MermaidRenderer 方法调用"""
+    global _IN_WORKER_PROCESS
+    _IN_WORKER_PROCESS = True
+
+    # 延迟导入，避免与 mermaid_renderer 循环引用，也让主进程不必为子进程加载Playwright
+    from utils.mermaid_renderer import MermaidRenderer
+    renderer = MermaidRenderer()
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, method, args, kwargs = task
+        # 通知主进程任务开始执行（ok 为 None），超时从这里开始计算，不含排队时间
+        result_conn.send((task_id, None, None))
+        try:
+            result = (task_id, True, getattr(renderer, method)(*args, **kwargs))
+        except BaseException as e:
+            result = (task_id, False, e)
+        try:
+            result_conn.send(result)
+        except Exception as e:
+            # 结果或异常对象无法序列化（send 先序列化再写入，失败时管道中没有残留数据）
+            result_conn.send((task_id, False, RuntimeError(f"渲染结果无法传回主进程: {e}")))
+
+    try:
+        renderer.browser_manager.cleanup()
+    except:
+        pass
+
+
+class _WorkerSlot:
+    """进程池中的一个位置：工作进程、它的任务队列、结果管道和正在执行的任务
+
+    每个进程使用独立的结果管道而不是共享队列：共享队列的写锁跨进程共享，
+    进程恰好在持锁时被杀死会让其他进程永远无法写回结果。
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.task_queue = None
+        self.result_reader = None
+        self.in_flight: Dict[int, Optional[float]] = {}  # 任务id -> 开始执行的时间（仍在排队时为None）
+        self.tasks: Dict[int, tuple] = {}  # 任务id -> (method, args, kwargs)，进程重启时重新提交未开始的任务
+        self.restarts = 0
+
+
+class RenderWorkerPool:
+    """渲染工作进程池 - 把渲染任务分发到多个独立进程
+
+    每个进程有自己的 Python 解释器、BrowserManager 和 Chromium，渲染可以真正并行使用多核；
+    某个进程崩溃或卡死只影响它正在执行的任务，监控线程会让该任务失败并重启该进程，
+    排队中的任务交给重启后的进程继续执行。
+    通过 RENDER_WORKER_POOL_CONFIG["enabled"] 开启后，MermaidRenderer 会自动把渲染转发到这里。
+    """
+
+    # 允许在子进程中调用的 MermaidRenderer 方法
+    METHODS = ('render_to_png', 'render_to_svg', 'render_with_diagnostics')
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        """单例模式"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化进程池（进程在首次提交任务时才启动）"""
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+
+        self.size = max(1, RENDER_WORKER_POOL_CONFIG.get("workers", 2))
+        self.task_timeout = RENDER_WORKER_POOL_CONFIG.get("task_timeout", 120)
+        self._context = multiprocessing.get_context(RENDER_WORKER_POOL_CONFIG.get("start_method", "spawn"))
+        self._slots: List[_WorkerSlot] = [_WorkerSlot(i) for i in range(self.size)]
+        self._futures: Dict[int, Future] = {}
+        self._task_ids = itertools.count(1)
+        self._collector: Optional[threading.Thread] = None
+        self._state_lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._initialized = True
+        atexit.register(self.shutdown)
+
+    @staticmethod
+    def is_worker_process() -> bool:
+        """当前是否运行在渲染工作进程中"""
+        return _IN_WORKER_PROCESS
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        """提交一次 MermaidRenderer 方法调用，返回 Future
+
+        Args:
+            method: 方法名，见 METHODS
+            *args, **kwargs: 方法参数（需可序列化）
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"不支持在渲染进程中调用: {method}")
+
+        future = Future()
+        with self._state_lock:
+            if self._closed:
+                raise RuntimeError("渲染进程池已关闭")
+            self._ensure_started_locked()
+            task_id = next(self._task_ids)
+            # 分配给正在执行任务最少的进程
+            slot = min(self._slots, key=lambda s: len(s.in_flight))
+            slot.in_flight[task_id] = None
+            slot.tasks[task_id] = (method, args, kwargs)
+            self._futures[task_id] = future
+            slot.task_queue.put((task_id, method, args, kwargs))
+        return future
+
+    def call(self, method: str, *args, **kwargs):
+        """提交任务并等待结果（子进程中的异常会原样抛给调用方）"""
+        return self.submit(method, *args, **kwargs).result()
+
+    def stats(self) -> Dict:
+        """获取进程池状态"""
+        with self._state_lock:
+            return {
+                'workers': self.size,
+                'alive': sum(1 for s in self._slots if s.process is not None and s.process.is_alive()),
+                'in_flight': sum(len(s.in_flight) for s in self._slots),
+                'restarts': sum(s.restarts for s in self._slots),
+            }
+
+    def shutdown(self, wait: bool = True):
+        """通知所有工作进程退出，未完成的任务以异常结束"""
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            slots = list(self._slots) if self._started else []
+
+        for slot in slots:
+            try:
+                slot.task_queue.put(None)
+            except:
+                pass
+        for slot in slots:
+            try:
+                if wait:
+                    slot.process.join(timeout=10)
+                if slot.process.is_alive():
+                    slot.process.terminate()
+            except:
+                pass
+
+        with self._state_lock:
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(RuntimeError("渲染进程池已关闭"))
+
+    def _ensure_started_locked(self):
+        """启动所有工作进程和结果收集线程（调用方需持有锁）"""
+        if self._started:
+            return
+        for slot in self._slots:
+            self._start_worker_locked(slot)
+        self._collector = threading.Thread(target=self._collect, name="render-pool-collector", daemon=True)
+        self._collector.start()
+        self._started = True
+
+    def _start_worker_locked(self, slot: _WorkerSlot):
+        """启动（或重启）一个工作进程（调用方需持有锁）"""
+        if slot.result_reader is not None:
+            try:
+                slot.result_reader.close()
+            except:
+                pass
+        slot.task_queue = self._context.Queue()
+        slot.result_reader, result_writer = self._context.Pipe(duplex=False)
+        slot.process = self._context.Process(
+            target=_worker_main,
+            args=(slot.index, slot.task_queue, result_writer),
+            name=f"mermaid-render-worker-{slot.index}",
+            daemon=True
+        )
+        slot.process.start()
+        # 关闭本进程持有的写端，子进程退出时读端才能收到EOF
+        result_writer.close()
+
+    def _collect(self):
+        """收集线程：分发结果到 Future，同时监控进程存活和任务超时"""
+        last_check = time.monotonic()
+        while True:
+            # 持续有结果返回时也要定期检查，否则卡死的进程在高负载下不会被发现
+            # （先检查再取管道列表：重启进程会关闭旧的管道）
+            if time.monotonic() - last_check >= 1:
+                self._check_workers()
+                last_check = time.monotonic()
+
+            with self._state_lock:
+                if self._closed:
+                    return
+                readers = {slot.result_reader: slot for slot in self._slots}
+
+            for conn in wait_connections(list(readers), timeout=1):
+                try:
+                    task_id, ok, payload = conn.recv()
+                except (EOFError, OSError):
+                    # 进程已退出：等它被回收后立即重启，已关闭的管道不能再读取，重新取管道列表
+                    readers[conn].process.join(timeout=1)
+                    self._check_workers()
+                    break
+                if ok is None:
+                    self._mark_started(readers[conn], task_id)
+                else:
+                    self._resolve(task_id, ok, payload)
+
+    def _mark_started(self, slot: _WorkerSlot, task_id: int):
+        """记录任务开始执行的时间"""
+        with self._state_lock:
+            if task_id in slot.in_flight:
+                slot.in_flight[task_id] = time.monotonic()
+
+    def _resolve(self, task_id: int, ok: bool, payload):
+        """把结果交给对应的 Future"""
+        with self._state_lock:
+            future = self._futures.pop(task_id, None)
+            for slot in self._slots:
+                slot.in_flight.pop(task_id, None)
+                slot.tasks.pop(task_id, None)
+        if future is None or future.done():
+            return
+        if ok:
+            future.set_result(payload)
+        else:
+            future.set_exception(payload)
+
+    def _check_workers(self):
+        """重启已退出或卡住的工作进程
+
+        已开始执行的任务以异常结束；仍在排队、从未开始的任务重新提交给重启后的进程。
+        """
+        now = time.monotonic()
+        failed: List[tuple] = []
+        finished: List[tuple] = []
+        with self._state_lock:
+            if self._closed:
+                return
+            for slot in self._slots:
+                dead = not slot.process.is_alive()
+                # 只看已开始执行的任务，排队等待的时间不算卡死
+                stuck = any(
+                    started is not None and now - started > self.task_timeout
+                    for started in slot.in_flight.values()
+                )
+                if not dead and not stuck:
+                    continue
+
+                if dead:
+                    reason = f"渲染工作进程异常退出（exitcode={slot.process.exitcode}）"
+                else:
+                    reason = f"渲染任务超过 {self.task_timeout} 秒未完成，工作进程已重启"
+                    try:
+                        slot.process.kill()
+                        slot.process.join(timeout=5)
+                    except:
+                        pass
+                logger.warning("%s: worker-%d", reason, slot.index)
+
+                # 管道中可能还有未读取的开始通知和结果，先取出，避免已开始的任务被当作未开始重新执行
+                finished.extend(self._drain_locked(slot))
+                requeue = []
+                for task_id, started in slot.in_flight.items():
+                    if started is None:
+                        requeue.append(task_id)
+                        continue
+                    future = self._futures.pop(task_id, None)
+                    if future is not None:
+                        failed.append((future, reason))
+                    slot.tasks.pop(task_id, None)
+
+                slot.in_flight = {task_id: None for task_id in requeue}
+                slot.restarts += 1
+                self._start_worker_locked(slot)
+                for task_id in requeue:
+                    method, args, kwargs = slot.tasks[task_id]
+                    slot.task_queue.put((task_id, method, args, kwargs))
+                if requeue:
+                    logger.info("已把 %d 个未开始的任务重新提交给 worker-%d", len(requeue), slot.index)
+
+        for task_id, ok, payload in finished:
+            self._resolve(task_id, ok, payload)
+        for future, reason in failed:
+            if not future.done():
+                future.set_exception(RuntimeError(reason))
+
+    @staticmethod
+    def _drain_locked(slot: _WorkerSlot) -> List[tuple]:
+        """读出已退出进程留在管道中的消息：记录开始时间，返回已完成任务的结果（调用方需持有锁）"""
+        finished = []
+        try:
+            while slot.result_reader.poll():
+                task_id, ok, payload = slot.result_reader.recv()
+                if ok is None:
+                    if task_id in slot.in_flight:
+                        slot.in_flight[task_id] = time.monotonic()
+                else:
+                    slot.in_flight.pop(task_id, None)
+                    slot.tasks.pop(task_id, None)
+                    finished.append((task_id, ok, payload))
+        except (EOFError, OSError):
+            pass
+        return finished
@@ -0,0 +1,120 @@
+"""分块截图 - 超大图表按固定大小分块截图，用Pillow逐条拼接并流式写入PNG"""
+import io
+import struct
+import zlib
+from typing import BinaryIO, Dict, Optional
+from PIL import Image
+from config import TILED_RENDER_CONFIG
+
+
+class PngStreamWriter:
+    """流式PNG写入器 - 按条带写入像素行，压缩后的数据立即写出，内存中只保留当前条带
+
+    只支持 8 位 RGB/RGBA，每行使用 None 过滤。
+    """
+
+    _COLOR_TYPES = {'RGB': (2, 3), 'RGBA': (6, 4)}  # 模式 -> (PNG颜色类型, 每像素字节数)
+
+    def __init__(self, fileobj: BinaryIO, width: int, height: int, mode: str = 'RGB', compress_level: int = 6):
+        if mode not in self._COLOR_TYPES:
+            raise ValueError(f"不支持的图像模式: {mode}")
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self._file = fileobj
+        color_type, self._channels = self._COLOR_TYPES[mode]
+        self._compressor = zlib.compressobj(compress_level)
+        self._rows_written = 0
+
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+
+    def write_band(self, band: Image.Image):
+        """写入一个条带（宽度必须等于图像宽度，模式必须一致）"""
+        if band.width != self.width or band.mode != self.mode:
+            raise ValueError(f"条带尺寸或模式不匹配: {band.size} {band.mode}")
+        if self._rows_written + band.height > self.height:
+            raise ValueError("写入的行数超过图像高度")
+
+        raw = band.tobytes()
+        stride = self.width * self._channels
+        filtered = bytearray()
+        for offset in range(0, len(raw), stride):
+            filtered.append(0)
+            filtered += raw[offset:offset + stride]
+        self._write_idat(self._compressor.compress(bytes(filtered)))
+        self._rows_written += band.height
+
+    def close(self):
+        """写出剩余的压缩数据和 IEND"""
+        if self._rows_written != self.height:
+            raise ValueError(f"PNG数据不完整：已写入 {self._rows_written}/{self.height} 行")
+        self._write_idat(self._compressor.flush())
+        self._write_chunk(b'IEND', b'')
+
+    def _write_idat(self, data: bytes):
+        if data:
+            self._write_chunk(b'IDAT', data)
+
+    def _write_chunk(self, tag: bytes, data: bytes):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(tag)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+
+class TiledScreenshot:
+    """分块截图 - 把页面上的一个区域按 tile_size 分块截图后拼接为一张PNG
+
+    整张图的一次截图受 Chromium 纹理大小限制，超大图表会变慢甚至失败；分块后每次只截取
+    tile_size × tile_size 设备像素，逐条带拼接写出，内存占用约为 图宽 × tile_size 像素。
+    """
+
+    def __init__(self, tile_size: Optional[int] = None, threshold_px: Optional[int] = None,
+                 compress_level: Optional[int] = None):
+        self.tile_size = max(256, tile_size or TILED_RENDER_CONFIG.get("tile_size", 2048))
+        self.threshold_px = threshold_px or TILED_RENDER_CONFIG.get("threshold_px", 8192)
+        self.compress_level = compress_level if compress_level is not None else TILED_RENDER_CONFIG.get("compress_level", 6)
+
+    def needs_tiling(self, clip: Dict, scale: float) -> bool:
+        """截图区域的任一边（设备像素）超过阈值时分块"""
+        if not TILED_RENDER_CONFIG.get("enabled", True):
+            return False
+        return max(clip['width'], clip['height']) * scale > self.threshold_px
+
+    def capture(self, page, clip: Dict, scale: float, fileobj: BinaryIO, timeout_ms: int):
+        """分块截取 clip 区域（CSS像素）并写入 fileobj
+
+        Args:
+            page: Playwright页面
+            clip: {'x', 'y', 'width', 'height'}，页面坐标
+            scale: 页面的设备缩放比例
+            fileobj: 以二进制方式打开的输出文件（或 BytesIO）
+            timeout_ms: 每次截图的超时时间
+        """
+        width_px = max(1, round(clip['width'] * scale))
+        height_px = max(1, round(clip['height'] * scale))
+        writer = PngStreamWriter(fileobj, width_px, height_px, 'RGB', self.compress_level)
+
+        for top in range(0, height_px, self.tile_size):
+            band_height = min(self.tile_size, height_px - top)
+            band = Image.new('RGB', (width_px, band_height), 'white')
+            for left in range(0, width_px, self.tile_size):
+                tile_width = min(self.tile_size, width_px - left)
+                tile_png = page.screenshot(
+                    clip={
+                        'x': clip['x'] + left / scale,
+                        'y': clip['y'] + top / scale,
+                        'width': tile_width / scale,
+                        'height': band_height / scale,
+                    },
+                    full_page=True,
+                    timeout=timeout_ms
+                )
+                with Image.open(io.BytesIO(tile_png)) as tile:
+                    # 坐标换算可能有一个像素的舍入误差，按目标大小裁剪
+                    band.paste(tile.convert('RGB').crop((0, 0, tile_width, band_height)), (left, 0))
+            writer.write_band(band)
+            band.close()
+
+        writer.close()
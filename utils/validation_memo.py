@@ -0,0 +1,85 @@
+"""验证结果缓存 - 单例模式，进程内共享的LRU备忘录"""
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from config import VALIDATION_MEMO_CONFIG
+
+
+class ValidationMemo:
+    """验证结果备忘录 - 以代码哈希和验证器版本为键缓存 (is_valid, error_info)
+
+    所有会话共享同一个实例；返回的是深拷贝，调用方修改结果不会污染缓存。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        """单例模式"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化验证结果备忘录"""
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+
+        self.enabled = VALIDATION_MEMO_CONFIG.get("enabled", True)
+        self.max_entries = VALIDATION_MEMO_CONFIG.get("max_entries", 1024)
+        self._entries: "OrderedDict[str, Tuple[bool, Dict]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._entries_lock = threading.Lock()
+        self._initialized = True
+
+    @staticmethod
+    def make_key(mermaid_code: str, validator_version: str) -> str:
+        """根据代码和验证器版本计算键"""
+        digest = hashlib.sha256(mermaid_code.encode('utf-8')).hexdigest()
+        return f"{validator_version}:{digest}"
+
+    def get(self, key: str) -> Optional[Tuple[bool, Dict]]:
+        """查询验证结果，未命中返回None"""
+        if not self.enabled:
+            return None
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        is_valid, error_info = entry
+        return is_valid, copy.deepcopy(error_info)
+
+    def put(self, key: str, is_valid: bool, error_info: Dict):
+        """保存验证结果"""
+        if not self.enabled:
+            return
+        with self._entries_lock:
+            self._entries[key] = (is_valid, copy.deepcopy(error_info))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """获取命中统计"""
+        with self._entries_lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """清空备忘录"""
+        with self._entries_lock:
+            self._entries.clear()